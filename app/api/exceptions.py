@@ -40,3 +40,57 @@ class BadRequestException(ApiException):
     status_code: int = status.HTTP_400_BAD_REQUEST
     id: str = "BAD_REQUEST"
     message: str = "Malformed request."
+
+
+@dataclass
+class NotFoundException(ApiException):
+    """Thrown if a requested resource does not exist."""
+
+    status_code: int = status.HTTP_404_NOT_FOUND
+    id: str = "NOT_FOUND"
+    message: str = "Resource not found."
+
+
+@dataclass
+class ConflictException(ApiException):
+    """Thrown if a request conflicts with the current state of a resource."""
+
+    status_code: int = status.HTTP_409_CONFLICT
+    id: str = "CONFLICT"
+    message: str = "Request conflicts with current state."
+
+
+@dataclass
+class GoneException(ApiException):
+    """Thrown if a requested resource is no longer available."""
+
+    status_code: int = status.HTTP_410_GONE
+    id: str = "GONE"
+    message: str = "Resource no longer available."
+
+
+@dataclass
+class NotLeaderException(ApiException):
+    """Thrown if a request can only be handled by the leader of the cluster."""
+
+    status_code: int = status.HTTP_421_MISDIRECTED_REQUEST
+    id: str = "NOT_LEADER"
+    message: str = "This node is not the leader."
+
+
+@dataclass
+class TooManyRequestsException(ApiException):
+    """Thrown if a request was rejected because too many are in progress."""
+
+    status_code: int = status.HTTP_429_TOO_MANY_REQUESTS
+    id: str = "TOO_MANY_REQUESTS"
+    message: str = "Too many requests in progress."
+
+
+@dataclass
+class ServiceUnavailableException(ApiException):
+    """Thrown if a request can temporarily not be handled."""
+
+    status_code: int = status.HTTP_503_SERVICE_UNAVAILABLE
+    id: str = "SERVICE_UNAVAILABLE"
+    message: str = "Service temporarily unavailable."
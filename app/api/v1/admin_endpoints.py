@@ -0,0 +1,143 @@
+"""FastAPI endpoint definitions for cluster administration.
+
+* transfer leadership
+* payload script results
+* metrics
+* profile
+
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+from fastapi import APIRouter, Query, Request
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+
+from app.api.v1.models import LeadershipTransferSchema, V1ApiResponse
+from app.raft import functions, groups, profiling
+
+logger: logging.Logger = logging.getLogger(__name__)
+admin_router: APIRouter = APIRouter()
+
+
+@admin_router.post("/transfer-leadership")
+def transfer_leadership(request: Request, t_req: LeadershipTransferSchema):
+    """
+    Hand leadership of this node over to a follower, e.g. before redeploying
+    the leader. Failover then takes one round trip instead of an election
+    timeout.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+    t_req : LeadershipTransferSchema
+        The follower to transfer leadership to, if unset the follower with the
+        most entries is chosen, and the Raft group, by default the default
+        group.
+
+    Returns
+    -------
+    V1ApiResponse[LeadershipTransferSchema]
+        The follower that starts the election.
+    """
+    state = groups.bind_request(
+        request, groups.resolve_group(request.app.state, t_req.group)
+    )
+    target = functions.transfer_leadership(state, t_req.target)
+    return V1ApiResponse(
+        data=LeadershipTransferSchema(target=target, group=t_req.group)
+    )
+
+
+@admin_router.get("/scripts")
+async def get_script_results(request: Request):
+    """
+    Get exit codes and durations of the last payload script runs.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+
+    Returns
+    -------
+    V1ApiResponse[List[Dict[str, Any]]]
+        The script results, oldest first.
+    """
+    return V1ApiResponse(data=request.app.state.script_runner.results())
+
+
+@admin_router.get("/metrics")
+async def get_metrics(request: Request):
+    """
+    Get the counters, gauges and timings of this node, e.g. log cache hits.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+
+    Returns
+    -------
+    V1ApiResponse[Dict[str, Dict[str, Any]]]
+        `counters`, `gauges` and `timings`, all by name.
+    """
+    return V1ApiResponse(data=request.app.state.metrics.snapshot())
+
+
+@admin_router.get("/profile")
+async def get_profile(
+    request: Request,
+    seconds: float = Query(default=5.0, gt=0, le=60),
+    interval_millis: float = Query(default=5.0, ge=1, le=1000),
+):
+    """
+    Profile this node for `seconds` and download the result as JSON file.
+
+    The file holds the stacks of all threads and event loop tasks at the
+    start, the sampled stacks of all threads in the folded format of flame
+    graph tools, and how late the event loop woke up while sampling.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+    seconds : float
+        Duration of the profile.
+    interval_millis : float
+        Time between two samples.
+
+    Returns
+    -------
+    Response
+        `application/json` attachment.
+    """
+    started = time.time()
+    threads = profiling.thread_dump()
+    tasks = profiling.task_dump()
+    # sample from a worker thread, so the event loop is sampled as well
+    profile, lag = await asyncio.gather(
+        run_in_threadpool(profiling.sample_stacks, seconds, interval_millis / 1000),
+        profiling.measure_loop_lag(seconds),
+    )
+    node = request.app.state.id
+    report = {
+        "node": node,
+        "started": started,
+        "seconds": seconds,
+        "interval_millis": interval_millis,
+        "threads": threads,
+        "tasks": tasks,
+        "event_loop_lag": lag,
+        **profile,
+    }
+    filename = f"profile-{node.replace(':', '-')}-{int(started)}.json"
+    return Response(
+        content=json.dumps(report, indent=1),
+        media_type="application/json",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
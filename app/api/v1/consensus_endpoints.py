@@ -1,23 +1,38 @@
 """FastAPI endpoint definitions for Raft operations.
 
 * get status
+* list Raft groups
+* request pre-vote
 * request vote
 * append log / send heartbeat
+* append logs of several groups at once
+* append raw log records on catch-up
+* timeout now / start election on leadership transfer
+* watch leader, term and key changes
 
 """
-import datetime
+import json
 import logging
+from typing import List, Optional
 
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Query, Request
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
 
-from app.api.exceptions import BadRequestException
+from app.api.exceptions import ApiException, BadRequestException, GoneException
 from app.api.v1.models import (
+    RaftBatchSchema,
+    RaftGroupSchema,
     RaftMessageSchema,
     RaftStatusResponseSchema,
     V1ApiResponse,
+    WatchEventSchema,
+    WatchResponseSchema,
 )
 from app.config import Settings, get_settings
-from app.raft import functions
+from app.raft import functions, groups
+from app.raft.status import current_status
+from app.raft.storage import decode_records
 
 logger: logging.Logger = logging.getLogger(__name__)
 settings: Settings = get_settings()
@@ -40,17 +55,74 @@ async def get_state(request: Request):
     V1ApiResponse[RaftStatusResponseSchema]
         the state as json
     """
-    state = request.app.state
+    status = current_status(request.app.state)
+    metrics = getattr(request.app.state, "metrics", None)
     return V1ApiResponse(
         data=RaftStatusResponseSchema(
-            app_name=state.app_name.split(".", maxsplit=1)[0],
-            id=state.id,
-            state=state.state.value,
-            term=state.term,
+            app_name=status.app_name.split(".", maxsplit=1)[0],
+            id=status.id,
+            state=status.state.value,
+            term=status.term,
+            timings=metrics.timings() if metrics is not None else None,
         )
     )
 
 
+@consensus_router.get("/groups")
+async def get_groups(request: Request):
+    """
+    Get role, term and leader of every Raft group on this node.
+
+    Parameters
+    ----------
+    request : Request
+        request object
+
+    Returns
+    -------
+    V1ApiResponse[List[RaftGroupSchema]]
+        the groups, ordered by name
+    """
+    return V1ApiResponse(
+        data=[
+            RaftGroupSchema(
+                group=name,
+                state=status.state.value,
+                term=status.term,
+                leader=status.leader,
+            )
+            for name, status in sorted(
+                (name, current_status(group))
+                for name, group in request.app.state.groups.items()
+            )
+        ]
+    )
+
+
+@consensus_router.put("/prevote")
+async def request_pre_vote(request: Request, v_req: RaftMessageSchema):
+    """
+    Ask this node if it would vote for the sender in the senders next term.
+
+    Other than a vote request, this does not change term or vote of this node.
+    The pre-vote is rejected while this node still has contact to a leader.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+
+    Returns
+    -------
+    V1ApiResponse[RaftMessageSchema]
+        Reponse object.
+    """
+    state = groups.bind_request(
+        request, groups.resolve_group(request.app.state, v_req.group)
+    )
+    return V1ApiResponse(data=functions.grant_pre_vote(state, v_req))
+
+
 @consensus_router.put("/vote")
 async def request_vote(request: Request, v_req: RaftMessageSchema):
     """
@@ -66,47 +138,10 @@ async def request_vote(request: Request, v_req: RaftMessageSchema):
     V1ApiResponse[VoteResponseSchema]
         Reponse object.
     """
-    state = request.app.state
-
-    # check if node is known
-    if state.replicas.get(v_req.sender):
-        logger.info("vote requested from %s", v_req.sender)
-    else:
-        # We do not know this node (not discovered)
-        logger.info("reject unknown node %s", v_req.sender)
-        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
-        raise BadRequestException(message=f"Node app_name {v_req.sender} unknown.")  # type: ignore
-
-    # check if term is correct
-    if v_req.term < state.term:
-        # requests term is out of date, rejecting
-        logger.info("reject outdated term (%s) vote request", v_req.term)
-        # mypy has problems with pydantic.dataclasses, so I am disabling the type check for this instance
-        raise BadRequestException(message=f"Outdated term: {v_req.term}.")  # type: ignore
-
-    if state.term == v_req.term:
-        # terms match
-        logger.debug("current term %s == %s", state.term, v_req.term)
-        if not state.vote or state.vote == v_req.sender:
-            # we want to vote for this node
-            return V1ApiResponse(data=RaftMessageSchema.from_state_object(state))
-
-        # we do not want to vote for this node
-        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
-        raise BadRequestException(message=f"Did not vote for {v_req.sender}.")  # type: ignore
-
-    if v_req.term > state.term:
-        # own term is outdated
-        logger.info(
-            "term %s out of date by %s",
-            state.term,
-            (v_req.term - state.term),
-        )
-        # if leader, step down, then vote
-        functions.term_reset(state, v_req.term, state.state)
-        state.vote = v_req.sender
-
-    return V1ApiResponse(data=RaftMessageSchema.from_state_object(state))
+    state = groups.bind_request(
+        request, groups.resolve_group(request.app.state, v_req.group)
+    )
+    return V1ApiResponse(data=functions.grant_vote(state, v_req))
 
 
 @consensus_router.post("/log")
@@ -124,26 +159,212 @@ async def append_log(request: Request, l_req: RaftMessageSchema):
     V1ApiResponse
         Reponse object.
     """
-    state = request.app.state
+    state = groups.bind_request(
+        request, groups.resolve_group(request.app.state, l_req.group)
+    )
+    # storing entries may wait for an fsync, keep the event loop free
+    answer = await run_in_threadpool(functions.append_entries, state, l_req)
+    return V1ApiResponse(data=answer)
+
+
+@consensus_router.post("/log/batch")
+async def append_log_batch(request: Request, b_req: RaftBatchSchema):
+    """
+    Append entries of several Raft groups led by the same node at once.
+
+    Every message is answered on its own, so a rejected group does not fail
+    the other groups of the batch.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+    b_req : RaftBatchSchema
+        The messages, at most one per group.
+
+    Returns
+    -------
+    V1ApiResponse[List[Dict[str, Any]]]
+        Per message the status code and either the answer or the error, in the
+        order of the messages.
+    """
+    results = []
+    for l_req in b_req.messages:
+        term = 0  # unknown groups can not make the leader step down
+        try:
+            state = groups.resolve_group(request.app.state, l_req.group)
+            term = current_status(state).term
+            answer = await run_in_threadpool(functions.append_entries, state, l_req)
+        except ApiException as error:
+            results.append(
+                {
+                    "status_code": error.status_code,
+                    "error": {
+                        "id": error.id,
+                        "message": error.message,
+                        "details": error.details,
+                        "term": term,
+                    },
+                }
+            )
+            continue
+        results.append({"status_code": 200, "data": answer.dict()})
+    return V1ApiResponse(data=results)
+
+
+@consensus_router.post("/log/catchup")
+async def append_log_records(
+    request: Request,
+    id: str,
+    sender: str,
+    term: int,
+    prev_log_index: int,
+    prev_log_term: int,
+    leader_commit: int = 0,
+    group: Optional[str] = None,
+):
+    """
+    Append raw log records, sent by the leader while this node is far behind.
+
+    The body holds the records as stored in the log segments of the leader, so
+    neither side converts the entries to JSON.
 
-    if state.replicas.get(l_req.sender):
-        logger.info("heartbeat / log append from %s", l_req.sender)
-    else:
-        # we do not know this node
-        logger.info("reject unknown node %s", l_req.sender)
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+    id, sender, term, prev_log_index, prev_log_term, leader_commit, group
+        The fields of the append message, see `RaftMessageSchema`.
+
+    Returns
+    -------
+    V1ApiResponse[RaftMessageSchema]
+        Reponse object.
+    """
+    state = groups.bind_request(request, groups.resolve_group(request.app.state, group))
+    try:
+        entries = decode_records(await request.body())
+    except ValueError as error:
         # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
-        raise BadRequestException(message=f"Node ID {l_req.sender} unknown.")  # type: ignore
+        raise BadRequestException(message=str(error))  # type: ignore
+    l_req = RaftMessageSchema(
+        id=id,
+        sender=sender,
+        term=term,
+        group=group,
+        prev_log_index=prev_log_index,
+        prev_log_term=prev_log_term,
+        leader_commit=leader_commit,
+    )
+    answer = await run_in_threadpool(functions.append_entries, state, l_req, entries)
+    return V1ApiResponse(data=answer)
+
+
+@consensus_router.post("/timeout-now")
+async def timeout_now(request: Request, t_req: RaftMessageSchema):
+    """
+    Start an election immediately, sent by the leader on leadership transfer.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+
+    Returns
+    -------
+    V1ApiResponse
+        Reponse object.
+    """
+    state = groups.bind_request(
+        request, groups.resolve_group(request.app.state, t_req.group)
+    )
+    return V1ApiResponse(data=functions.timeout_now(state, t_req))
+
 
-    # check if term is correct
-    if state.term > l_req.term:
-        # term out of date, rejecting
-        logger.info("reject outdated term %s log append", l_req.term)
-        # mypy has problems with pydantic.dataclasses, so I am disabling the type check for this instance
-        raise BadRequestException(message=f"Outdated term: {l_req.term}")  # type: ignore
+@consensus_router.get("/watch")
+async def watch(
+    request: Request,
+    index: Optional[int] = None,
+    keys: List[str] = Query(default=[]),
+    timeout_millis: int = Query(default=30000, gt=0, le=300000),
+    group: Optional[str] = None,
+):
+    """
+    Long-poll for leader, term or key changes after `index`.
+
+    Keys are `leader`, `term`, `locks/<name>` and `kv/<key>`, a key ending
+    with `/` matches as prefix. Without keys, all changes are returned.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+    index : Optional[int]
+        Index returned by the previous call, by default only new changes.
+    keys : List[str]
+        Keys to watch, by default all.
+    timeout_millis : int
+        Time after which an empty response is returned.
+    group : Optional[str]
+        Raft group to watch, by default the default group.
+
+    Returns
+    -------
+    V1ApiResponse[WatchResponseSchema]
+        The changes and the index to resume from, 410 if `index` is too old.
+    """
+    hub = groups.resolve_group(request.app.state, group).watch
+    start = hub.index if index is None else index
+    resume, events = await hub.wait(start, keys, timeout_millis / 1000)
+    return V1ApiResponse(
+        data=WatchResponseSchema(
+            index=resume, events=[WatchEventSchema(**e._asdict()) for e in events]
+        )
+    )
+
+
+@consensus_router.get("/watch/stream")
+async def watch_stream(
+    request: Request,
+    index: Optional[int] = None,
+    keys: List[str] = Query(default=[]),
+    group: Optional[str] = None,
+):
+    """
+    Stream leader, term or key changes after `index` as server-sent events.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+    index : Optional[int]
+        Index to resume from, by default only new changes.
+    keys : List[str]
+        Keys to watch, see `watch`.
+    group : Optional[str]
+        Raft group to watch, by default the default group.
+
+    Returns
+    -------
+    StreamingResponse
+        `text/event-stream` with one event per change.
+    """
+    hub = groups.resolve_group(request.app.state, group).watch
+    start = hub.index if index is None else index
+    hub.since(start)  # raises 410 before the stream starts
 
-    # term is current or newer
-    state.ping_time = datetime.datetime.utcnow()
-    functions.term_reset(state, l_req.term, state.state)
-    state.leader = l_req.sender
+    async def events():
+        resume = start
+        while not await request.is_disconnected():
+            try:
+                resume, changes = await hub.wait(resume, keys, 15)
+            except GoneException:
+                yield "event: GONE\ndata: {}\n\n"
+                return
+            for change in changes:
+                data = json.dumps(change._asdict())
+                yield f"id: {change.index}\nevent: {change.kind}\ndata: {data}\n\n"
+            if not changes:
+                yield ": keep-alive\n\n"
 
-    return V1ApiResponse(data=RaftMessageSchema.from_state_object(state))
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -0,0 +1,286 @@
+"""FastAPI endpoint definitions for the replicated key-value store.
+
+* write key
+* delete key
+* read key
+
+Writes are accepted by the leader only and answered once committed and
+applied. A follower passes writes on to the leader it knows, see
+`app.raft.forwarding`. Writes sent with a client session and sequence number
+apply once, retries are answered with the log index of the first write. Reads
+are answered by every node from its applied state.
+
+"""
+import logging
+import time
+from typing import Any, Optional
+
+import requests
+from fastapi import APIRouter, Query, Request
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+
+from app.api.exceptions import (
+    BadRequestException,
+    NotFoundException,
+    ServiceUnavailableException,
+)
+from app.api.v1.models import KeyValueSchema, V1ApiResponse
+from app.raft import functions, groups
+from app.raft.forwarding import FORWARDED_HEADER, LEADER_HEADER
+from app.raft.kv import KeyValueStore
+from app.raft.status import current_status
+
+logger: logging.Logger = logging.getLogger(__name__)
+kv_router: APIRouter = APIRouter()
+
+FORWARD_TIMEOUT_MARGIN = 1.0  # seconds for the hop to the leader and back
+
+
+async def forward_write(
+    request: Request, key: str, timeout: float
+) -> Optional[Response]:
+    """
+    Send a write received by a follower on to the leader of its group.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+    key : str
+        Key the write changes, decides the Raft group.
+    timeout : float
+        Seconds the leader waits for the write to be committed.
+
+    Returns
+    -------
+    Optional[Response]
+        The answer of the leader, None if the write is to be handled here:
+        on the leader, if the leader is unknown or unreachable, or if the
+        write was forwarded already.
+    """
+    forwarder = getattr(request.app.state, "forwarder", None)
+    status = current_status(groups.group_for_key(request.app.state, key))
+    if (
+        forwarder is None
+        or status.state is functions.State.LEADER
+        or status.leader in (None, status.id, status.app_name)
+        or FORWARDED_HEADER in request.headers
+    ):
+        return None
+    try:
+        answer = await run_in_threadpool(
+            forwarder.forward,
+            status.leader,
+            request.method,
+            request.url.path,
+            dict(request.query_params),
+            await request.body(),
+            request.headers.get("content-type"),
+            timeout + FORWARD_TIMEOUT_MARGIN,
+        )
+    except requests.RequestException as error:
+        logger.info("could not forward to %s: %s", status.leader, str(error))
+        return None  # answered with 421 and the leader as hint
+    headers = {LEADER_HEADER: status.leader}
+    if "Retry-After" in answer.headers:
+        headers["Retry-After"] = answer.headers["Retry-After"]
+    return Response(
+        content=answer.content,
+        status_code=answer.status_code,
+        headers=headers,
+        media_type=answer.headers.get("content-type"),
+    )
+
+
+async def replicate(
+    request: Request,
+    key: str,
+    op: str,
+    value: Any,
+    timeout: float,
+    session: Optional[str] = None,
+    sequence: Optional[int] = None,
+) -> int:
+    """
+    Propose a command and wait until it is applied.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+    key : str
+        Key the command changes, decides the Raft group.
+    op : str
+        `KeyValueStore.SET` or `KeyValueStore.DELETE`.
+    value : Any
+        New value for SET.
+    timeout : float
+        Seconds to wait for the command to be committed.
+    session : Optional[str]
+        Client session of the write.
+    sequence : Optional[int]
+        Sequence number of the write in the session.
+
+    Returns
+    -------
+    int
+        Log index of the command, of its first application for a retry.
+
+    Raises
+    ------
+    BadRequestException
+        when a session is given without sequence number
+    ConflictException
+        when the session applied a later write already
+    TooManyRequestsException
+        when too many writes of the group are pending
+    ServiceUnavailableException
+        when the command was not committed in time or lost on a leader change,
+        or the followers do not keep up
+    """
+    state = groups.bind_request(request, groups.group_for_key(request.app.state, key))
+    if session is not None:
+        if sequence is None:
+            # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+            raise BadRequestException(message="Session without sequence.")  # type: ignore
+        applied = state.kv.sessions.lookup(session, sequence)
+        if applied is not None:
+            return applied  # retry of an applied write
+    payload = KeyValueStore.command(
+        op, key, value, session, sequence, time.time() if session else None
+    )
+    term = current_status(state).term
+    with state.admission.admit():
+        # appending waits for the configured durability, keep the event loop free
+        index = await run_in_threadpool(functions.propose, state, payload)
+        await state.watch.wait_until(
+            lambda: state.last_applied >= index or current_status(state).term != term,
+            timeout,
+        )
+    if state.last_applied < index or state.log.term_at(index) != term:
+        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+        raise ServiceUnavailableException(  # type: ignore
+            message=f"Write to {key} not committed, retry.",
+            details={"index": index},
+        )
+    if session is not None:
+        # a retry appended twice is skipped, answer with the first write
+        return state.kv.sessions.lookup(session, sequence) or index
+    return index
+
+
+@kv_router.put("/{key}")
+async def put_value(
+    request: Request,
+    key: str,
+    kv_req: KeyValueSchema,
+    timeout_millis: int = Query(default=5000, gt=0, le=60000),
+    session: Optional[str] = Query(default=None, min_length=1, max_length=64),
+    sequence: Optional[int] = Query(default=None, gt=0),
+):
+    """
+    Set the value of a key.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+    key : str
+        Key to set.
+    kv_req : KeyValueSchema
+        The new value.
+    timeout_millis : int
+        Time to wait for the write to be committed.
+    session : Optional[str]
+        Client session, retries of the write apply once.
+    sequence : Optional[int]
+        Sequence number of the write in the session, the same for retries.
+
+    Returns
+    -------
+    V1ApiResponse[KeyValueSchema]
+        The key, its value and the log index of the write.
+    """
+    forwarded = await forward_write(request, key, timeout_millis / 1000)
+    if forwarded is not None:
+        return forwarded
+    index = await replicate(
+        request,
+        key,
+        KeyValueStore.SET,
+        kv_req.value,
+        timeout_millis / 1000,
+        session,
+        sequence,
+    )
+    return V1ApiResponse(data=KeyValueSchema(key=key, value=kv_req.value, index=index))
+
+
+@kv_router.delete("/{key}")
+async def delete_value(
+    request: Request,
+    key: str,
+    timeout_millis: int = Query(default=5000, gt=0, le=60000),
+    session: Optional[str] = Query(default=None, min_length=1, max_length=64),
+    sequence: Optional[int] = Query(default=None, gt=0),
+):
+    """
+    Delete a key.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+    key : str
+        Key to delete.
+    timeout_millis : int
+        Time to wait for the delete to be committed.
+    session : Optional[str]
+        Client session, retries of the delete apply once.
+    sequence : Optional[int]
+        Sequence number of the delete in the session, the same for retries.
+
+    Returns
+    -------
+    V1ApiResponse[KeyValueSchema]
+        The key and the log index of the delete.
+    """
+    forwarded = await forward_write(request, key, timeout_millis / 1000)
+    if forwarded is not None:
+        return forwarded
+    index = await replicate(
+        request,
+        key,
+        KeyValueStore.DELETE,
+        None,
+        timeout_millis / 1000,
+        session,
+        sequence,
+    )
+    return V1ApiResponse(data=KeyValueSchema(key=key, index=index))
+
+
+@kv_router.get("/{key}")
+async def get_value(request: Request, key: str):
+    """
+    Get the value of a key as applied on this node.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+    key : str
+        Key to read.
+
+    Returns
+    -------
+    V1ApiResponse[KeyValueSchema]
+        The key and its value, 404 if it does not exist.
+    """
+    state = groups.bind_request(request, groups.group_for_key(request.app.state, key))
+    value = state.kv.get(key)
+    if value is None:
+        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+        raise NotFoundException(message=f"Key {key} not found.")  # type: ignore
+    return V1ApiResponse(data=KeyValueSchema(key=key, value=value))
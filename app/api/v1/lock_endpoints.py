@@ -0,0 +1,210 @@
+"""FastAPI endpoint definitions for distributed locks.
+
+* acquire lock
+* renew lock
+* release lock
+* get lock
+* watch lock
+
+Locks are granted by the leader only, every node answers reads and watches
+from its replicated lease table. With several Raft groups, every lock belongs
+to the group its name hashes to.
+
+"""
+import logging
+from typing import Optional
+
+from fastapi import APIRouter, Query, Request
+
+from app.api.exceptions import NotFoundException
+from app.api.v1.models import (
+    LockRenewSchema,
+    LockRequestSchema,
+    LockSchema,
+    V1ApiResponse,
+)
+from app.raft import functions, groups
+from app.raft.leases import Lease, LeaseTable
+
+logger: logging.Logger = logging.getLogger(__name__)
+lock_router: APIRouter = APIRouter()
+
+
+def lock_schema(
+    leases: LeaseTable, name: str, lease: Optional[Lease], revision: int
+) -> LockSchema:
+    """
+    Create the response model for a lock, without exposing its lease id.
+
+    Parameters
+    ----------
+    leases : LeaseTable
+        table the lease belongs to
+    name : str
+        name of the lock
+    lease : Optional[Lease]
+        current lease on the lock, None if the lock is free
+    revision : int
+        revision of the last change of the lock
+
+    Returns
+    -------
+    LockSchema
+        the response model
+    """
+    if lease is None:
+        return LockSchema(name=name, revision=revision)
+    return LockSchema(
+        name=name,
+        owner=lease.owner,
+        ttl_millis=int(lease.ttl * 1000),
+        remaining_millis=leases.remaining_millis(lease),
+        revision=revision,
+    )
+
+
+@lock_router.put("/{name}")
+async def acquire_lock(request: Request, name: str, l_req: LockRequestSchema):
+    """
+    Acquire a lock, or renew it if it is already held by the same owner.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+    name : str
+        Name of the lock.
+    l_req : LockRequestSchema
+        Owner and time to live of the lease.
+
+    Returns
+    -------
+    V1ApiResponse[LockSchema]
+        The granted lease including its lease id.
+    """
+    state = groups.bind_request(request, groups.group_for_key(request.app.state, name))
+    functions.require_leader(state)
+    lease = state.leases.acquire(name, l_req.owner, l_req.ttl_millis / 1000)
+    logger.info("lock %s acquired by %s", name, l_req.owner)
+    return V1ApiResponse(
+        data=lock_schema(state.leases, name, lease, lease.revision).copy(
+            update={"lease_id": lease.lease_id}
+        )
+    )
+
+
+@lock_router.post("/{name}/renew")
+async def renew_lock(request: Request, name: str, l_req: LockRenewSchema):
+    """
+    Extend a lease by its time to live.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+    name : str
+        Name of the lock.
+    l_req : LockRenewSchema
+        Id of the lease.
+
+    Returns
+    -------
+    V1ApiResponse[LockSchema]
+        The renewed lease.
+    """
+    state = groups.bind_request(request, groups.group_for_key(request.app.state, name))
+    functions.require_leader(state)
+    lease = state.leases.renew(name, l_req.lease_id)
+    return V1ApiResponse(
+        data=lock_schema(state.leases, name, lease, lease.revision).copy(
+            update={"lease_id": lease.lease_id}
+        )
+    )
+
+
+@lock_router.delete("/{name}")
+async def release_lock(request: Request, name: str, lease_id: str):
+    """
+    Release a lock before its lease expires.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+    name : str
+        Name of the lock.
+    lease_id : str
+        Id of the lease.
+
+    Returns
+    -------
+    V1ApiResponse[LockSchema]
+        The now free lock.
+    """
+    state = groups.bind_request(request, groups.group_for_key(request.app.state, name))
+    functions.require_leader(state)
+    state.leases.release(name, lease_id)
+    logger.info("lock %s released", name)
+    return V1ApiResponse(
+        data=lock_schema(state.leases, name, None, state.leases.name_revision(name))
+    )
+
+
+@lock_router.get("/{name}")
+async def get_lock(request: Request, name: str):
+    """
+    Get the current holder of a lock.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+    name : str
+        Name of the lock.
+
+    Returns
+    -------
+    V1ApiResponse[LockSchema]
+        The lock, 404 if it is free.
+    """
+    state = groups.bind_request(request, groups.group_for_key(request.app.state, name))
+    lease = state.leases.get(name)
+    if lease is None:
+        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+        raise NotFoundException(message=f"Lock {name} is free.")  # type: ignore
+    return V1ApiResponse(data=lock_schema(state.leases, name, lease, lease.revision))
+
+
+@lock_router.get("/{name}/watch")
+async def watch_lock(
+    request: Request,
+    name: str,
+    revision: int = 0,
+    timeout_millis: int = Query(default=30000, gt=0, le=300000),
+):
+    """
+    Wait until a lock changes after `revision`, e.g. until it is released.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+    name : str
+        Name of the lock.
+    revision : int
+        Last revision known to the client, by default 0.
+    timeout_millis : int
+        Time after which the current state is returned unchanged.
+
+    Returns
+    -------
+    V1ApiResponse[LockSchema]
+        The lock with the revision of its last change.
+    """
+    state = groups.bind_request(request, groups.group_for_key(request.app.state, name))
+    await state.watch.wait_until(
+        lambda: state.leases.name_revision(name) > revision, timeout_millis / 1000
+    )
+    lease = state.leases.get(name)  # expires the lease first if due
+    current = state.leases.name_revision(name)
+    return V1ApiResponse(data=lock_schema(state.leases, name, lease, current))
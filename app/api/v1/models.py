@@ -1,22 +1,40 @@
 """Messaging models and Raft-specific datastructures"""
 
 import dataclasses
-from typing import Generic, TypeVar
+from typing import Any, Dict, Generic, List, Optional, TypeVar
 
 from pydantic import BaseModel, Field
 from fastapi.applications import State as FastAPIState
 
 from app.api.models import ApiErrorResponse, ApiResponse
+from app.raft.status import current_status
 
 T = TypeVar("T")
 
 
+class LogEntrySchema(BaseModel):
+    """A replicated log entry, `data` is the JSON encoded command."""
+
+    index: int
+    term: int
+    data: str
+
+
 class RaftMessageSchema(BaseModel):
     """Validation model for all Raft messages between nodes."""
 
     id: str
     sender: str
     term: int
+    leases: Optional[Dict[str, Any]] = None  # lease table, sent by the leader
+    group: Optional[str] = None  # Raft group, None for the default group
+    last_log_index: int = 0  # log of the sender, to reject outdated candidates
+    last_log_term: int = 0
+    # append entries, sent by the leader
+    prev_log_index: int = 0
+    prev_log_term: int = 0
+    entries: List[LogEntrySchema] = []
+    leader_commit: int = 0
 
     @classmethod
     def from_state_object(cls, state: FastAPIState) -> "RaftMessageSchema":
@@ -32,7 +50,31 @@ class RaftMessageSchema(BaseModel):
         RaftMessageSchema
             new message schema
         """
-        return RaftMessageSchema(id=state.id, sender=state.app_name, term=state.term)
+        status = current_status(state)
+        log = getattr(state, "log", None)
+        return RaftMessageSchema(
+            id=status.id,
+            sender=status.app_name,
+            term=status.term,
+            group=status.group,
+            last_log_index=log.last_index if log is not None else 0,
+            last_log_term=log.last_term if log is not None else 0,
+        )
+
+
+class RaftBatchSchema(BaseModel):
+    """Messages of several Raft groups sent to the same node in one request."""
+
+    messages: List[RaftMessageSchema]
+
+
+class RaftGroupSchema(BaseModel):
+    """Response model for the state of a single Raft group"""
+
+    group: str
+    state: str
+    term: int
+    leader: Optional[str] = None
 
 
 class RaftStatusResponseSchema(BaseModel):
@@ -42,6 +84,78 @@ class RaftStatusResponseSchema(BaseModel):
     id: str
     state: str
     term: int
+    # event loop lag, timer drift and handler durations of the node
+    timings: Optional[Dict[str, Dict[str, float]]] = None
+
+
+class RaftStatusEventSchema(RaftStatusResponseSchema):
+    """A status change pushed by a node to the monitor"""
+
+    leader: Optional[str] = None
+    commit_index: Optional[int] = None
+    timestamp: float
+
+
+class RaftStatusBatchSchema(BaseModel):
+    """A batch of status changes pushed by a node to the monitor"""
+
+    events: List[RaftStatusEventSchema]
+
+
+class LeadershipTransferSchema(BaseModel):
+    """Request and response model for a leadership transfer"""
+
+    target: Optional[str] = None
+    group: Optional[str] = None
+
+
+class KeyValueSchema(BaseModel):
+    """Request and response model of the key-value store"""
+
+    key: Optional[str] = None
+    value: Optional[str] = None
+    index: Optional[int] = None  # log index of the write
+
+
+class LockRequestSchema(BaseModel):
+    """Request model to acquire a lock"""
+
+    owner: str
+    ttl_millis: int = Field(gt=0)
+
+
+class LockRenewSchema(BaseModel):
+    """Request model to renew or release a lock"""
+
+    lease_id: str
+
+
+class LockSchema(BaseModel):
+    """Response model for a lock, owner is unset if the lock is free"""
+
+    name: str
+    owner: Optional[str] = None
+    lease_id: Optional[str] = None
+    ttl_millis: Optional[int] = None
+    remaining_millis: Optional[int] = None
+    revision: int = 0
+
+
+class WatchEventSchema(BaseModel):
+    """A change of the leader, the term or a key"""
+
+    index: int
+    kind: str
+    key: str
+    value: Optional[str] = None
+    timestamp: float
+
+
+class WatchResponseSchema(BaseModel):
+    """Response model for a watch, resume from `index` on the next call"""
+
+    index: int
+    events: List[WatchEventSchema]
 
 
 @dataclasses.dataclass
@@ -0,0 +1,221 @@
+"""Client of the key-value store of a cluster.
+
+Writes are only accepted by the leader. A follower passes writes on to the
+leader and names it in the `X-Raft-Leader` header of the answer, a node that
+can not answers with `421` and the leader it knows, if any. The client sends
+further requests to the node named, or else tries the next node, so most
+requests take a single hop. Reads are answered by any node. An overloaded
+leader answers with `429` or `503` and `Retry-After`, passed on as
+`ClientError.retry_after`.
+
+Every write is sent with the session id of the client and a new sequence
+number, retries on other nodes reuse it. So a write whose answer got lost,
+e.g. on a leader change, applies once even if it reached two leaders.
+
+"""
+import logging
+import uuid
+from collections import Counter
+from http import HTTPStatus
+from typing import Any, Dict, Optional, Sequence
+from urllib.parse import urlparse
+
+import requests
+
+from app.raft.forwarding import LEADER_HEADER
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class ClientError(Exception):
+    """
+    A request failed on all nodes tried.
+
+    Parameters
+    ----------
+    kind : str
+        HTTP status name of the answer, e.g. `SERVICE_UNAVAILABLE`, or
+        `TIMEOUT` and `CONNECTION` if no node answered
+    message : str
+        description of the error
+    status_code : Optional[int]
+        HTTP status of the last answer, None if no node answered
+    retry_after : Optional[float]
+        seconds to wait before retrying as asked by the node, None if not asked
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        message: str,
+        status_code: Optional[int] = None,
+        retry_after: Optional[float] = None,
+    ):
+        super().__init__(message)
+        self.kind = kind
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class KeyValueClient:
+    """
+    Reads and writes keys, finding the leader for writes.
+
+    Not thread-safe, use one client per thread.
+
+    Parameters
+    ----------
+    nodes : Sequence[str]
+        base URLs of the nodes, e.g. `http://localhost:8001`
+    timeout : float, optional
+        request timeout in seconds, by default 5.0
+    session : Optional[requests.Session], optional
+        HTTP session, by default a new one
+    session_id : Optional[str], optional
+        client session of the writes, by default a random one
+    """
+
+    def __init__(
+        self,
+        nodes: Sequence[str],
+        timeout: float = 5.0,
+        session: Optional[requests.Session] = None,
+        session_id: Optional[str] = None,
+    ):
+        if not nodes:
+            raise ValueError("No nodes given.")
+        self.nodes = [node.rstrip("/") for node in nodes]
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.redirects: Counter = Counter()  # nodes skipped, by reason
+        self.session_id = session_id or uuid.uuid4().hex
+        self.sequence = 0  # of the last write
+        self._current = 0  # node the last request succeeded on, or the leader
+
+    def put(self, key: str, value: Any) -> Dict[str, Any]:
+        """
+        Set the value of a key.
+
+        Parameters
+        ----------
+        key : str
+            key to set
+        value : Any
+            JSON-serializable value
+
+        Returns
+        -------
+        Dict[str, Any]
+            key, value and log index of the write
+
+        Raises
+        ------
+        ClientError
+            when no node accepted the write
+        """
+        return self._request("PUT", key, json={"value": value}, params=self._next())
+
+    def delete(self, key: str) -> Dict[str, Any]:
+        """
+        Delete a key.
+
+        Parameters
+        ----------
+        key : str
+            key to delete
+
+        Returns
+        -------
+        Dict[str, Any]
+            key and log index of the delete
+
+        Raises
+        ------
+        ClientError
+            when no node accepted the delete
+        """
+        return self._request("DELETE", key, params=self._next())
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Get the value of a key, as applied on the node asked.
+
+        Parameters
+        ----------
+        key : str
+            key to read
+
+        Returns
+        -------
+        Optional[Any]
+            the value, None if the key does not exist
+
+        Raises
+        ------
+        ClientError
+            when no node answered
+        """
+        try:
+            return self._request("GET", key)["value"]
+        except ClientError as error:
+            if error.status_code == 404:
+                return None
+            raise
+
+    def _next(self) -> Dict[str, Any]:
+        """Session parameters of a new write."""
+        self.sequence += 1
+        return {"session": self.session_id, "sequence": self.sequence}
+
+    def _hint(self, leader: Optional[str], default: int) -> int:
+        """Index of the node named leader by a node, `default` if unknown."""
+        for index, node in enumerate(self.nodes):
+            if leader and urlparse(node).netloc == leader:
+                return index
+        return default
+
+    def _request(self, method: str, key: str, **kwargs) -> Dict[str, Any]:
+        """Send a request, moving on to the leader named or the next node."""
+        error = ClientError("CONNECTION", "No node tried.")
+        current = self._current
+        for _ in range(len(self.nodes)):
+            node = self.nodes[current]
+            following = (current + 1) % len(self.nodes)
+            try:
+                response = self.session.request(
+                    method, f"{node}/api/v1/kv/{key}", timeout=self.timeout, **kwargs
+                )
+            except requests.Timeout as timeout:
+                error = ClientError("TIMEOUT", str(timeout))
+                self.redirects[error.kind] += 1
+                current = following
+                continue
+            except requests.RequestException as failure:
+                error = ClientError("CONNECTION", str(failure))
+                self.redirects[error.kind] += 1
+                current = following
+                continue
+            if response.status_code == 200:
+                # answered by the leader if a follower forwarded the request
+                self._current = self._hint(response.headers.get(LEADER_HEADER), current)
+                return response.json()["data"]
+            details: Dict[str, Any] = {}
+            try:
+                message = response.json()["error"]["message"]
+                details = response.json()["error"].get("details") or {}
+            except (ValueError, KeyError, TypeError, AttributeError):
+                message = response.text
+            try:
+                kind = HTTPStatus(response.status_code).name
+            except ValueError:
+                kind = str(response.status_code)
+            try:
+                retry_after: Optional[float] = float(response.headers["Retry-After"])
+            except (KeyError, ValueError):
+                retry_after = None
+            error = ClientError(kind, message, response.status_code, retry_after)
+            if response.status_code != HTTPStatus.MISDIRECTED_REQUEST:
+                raise error
+            self.redirects[kind] += 1  # not the leader, try the one it knows
+            current = self._hint(details.get("leader"), following)
+        raise error
@@ -11,6 +11,9 @@ import structlog
 
 from pydantic import BaseSettings
 
+from app.logs import record_extras
+from app.raft.tracing import add_trace_ids
+
 
 class Settings(BaseSettings):
     """
@@ -40,14 +43,44 @@ class Settings(BaseSettings):
     ROOT_PATH: str = ""
     APP_NAME: str = "consensus-cluster-service"
     LOGGING: str = "DEBUG"
+    LOG_QUEUE_SIZE = 10000  # records waiting for the writer thread, 0 writes inline
+    LOG_SAMPLE_PER_SECOND = 1.0  # per heartbeat message, 0 logs every heartbeat
 
     SCRIPT_LEADER_PATH: str
     SCRIPT_FOLLOWER_PATH: str
+    SCRIPT_TIMEOUT_MILLIS = 60000
+
+    MONITOR_URL: str | None = None
+    MONITOR_PUSH_INTERVAL_MILLIS = 100
+    MONITOR_KEEPALIVE_MILLIS = 1000  # status resent while nothing changes
 
     ### RAFT SPECIFIC SETTINGS ###
     ELECTION_TIMEOUT_LOWER_MILLIS = 3000
     ELECTION_TIMEOUT_UPPER_MILLIS = 5000
-    HEARTBEAT_REPEAT_MILLIS = 500
+    HEARTBEAT_REPEAT_MILLIS = 500  # until peer RTTs are measured
+    HEARTBEAT_MIN_MILLIS = 100
+    HEARTBEAT_MAX_MILLIS = 1000
+    PRE_VOTE = True
+    CHECK_QUORUM = True
+    WATCH_MAX_EVENTS = 10000
+    RAFT_GROUPS = ""  # comma separated names of groups besides "default"
+    PEERS = ""  # comma separated host:port of all nodes, instead of DNS
+    LOG_DIR = "/tmp/raft"  # nosec (bandit: one subdirectory per host)
+    LOG_DURABILITY = "always"  # always, group or none
+    LOG_GROUP_COMMIT_MILLIS = 0
+    LOG_GROUP_COMMIT_BYTES = 1048576
+    LOG_SEGMENT_BYTES = 67108864
+    LOG_CACHE_BYTES = 8388608  # recent entries served to followers from memory
+    CATCHUP_MAX_BYTES = 1048576  # entries per request to a follower
+    MAX_PENDING_PROPOSALS = 1000  # writes waiting per group, further get 429
+    MAX_UNCOMMITTED_ENTRIES = 10000  # log ahead of the commit index, then 503
+    MAX_SESSIONS = 10000  # client sessions deduplicating writes, LRU evicted
+    SESSION_TTL_MILLIS = 3600000  # idle client sessions are evicted after
+    FORWARD_TO_LEADER = True  # followers pass writes on to the leader
+    HEARTBEAT_COALESCE_MILLIS = 5
+    SLOW_ROUND_MILLIS = 1000  # heartbeat round logging its stack, 0 disables
+    TRACE_FILE = ""  # OTLP/JSON lines file of the spans, empty disables tracing
+    WORKER_SOCKET = ""  # Unix socket of the Raft owner, set with uvicorn --workers
 
     LOGGING_CONFIG: Dict = {
         "version": 1,
@@ -57,7 +90,7 @@ class Settings(BaseSettings):
                 "()": structlog.stdlib.ProcessorFormatter,
                 "processors": [
                     structlog.stdlib.ProcessorFormatter.remove_processors_meta,
-                    structlog.processors.JSONRenderer()
+                    structlog.processors.JSONRenderer(),
                     # structlog.processors.LogfmtRenderer()
                     # structlog.dev.ConsoleRenderer(
                     #    colors=True, exception_formatter=structlog.dev.rich_traceback
@@ -66,6 +99,8 @@ class Settings(BaseSettings):
                 "foreign_pre_chain": [
                     structlog.stdlib.add_log_level,
                     structlog.processors.TimeStamper("iso", utc=True),
+                    add_trace_ids,
+                    record_extras,
                 ],
             }
         },
@@ -0,0 +1,202 @@
+"""Logging off the hot path.
+
+* Records of every heartbeat are sampled: they are marked with
+  `extra=SAMPLED` and `SamplingFilter` lets only a few per second and message
+  through, the next record passed on carries the number suppressed. Access
+  log lines of append requests are sampled per path.
+* `start_queue_logging` moves rendering and writing to listener threads.
+  Callers only put the record into a bounded queue, so a slow stdout does not
+  block heartbeats. Records are dropped and counted while the queue is full.
+
+Message arguments are rendered in the listener thread, so log immutable
+values only.
+
+"""
+
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional
+
+from app.raft.tracing import current_context
+
+SAMPLED = {"sampled": True}  # `extra` of records logged on every heartbeat
+HEARTBEAT_PATHS = ("/api/v1/raft/log",)  # access log lines sampled as well
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Rate-limit records marked as sampled, per message.
+
+    Parameters
+    ----------
+    per_second : float, optional
+        records per second and message let through, 0 lets all through, by
+        default 1.0
+    """
+
+    def __init__(self, per_second: float = 1.0):
+        super().__init__()
+        self.per_second = per_second
+        self._lock = threading.Lock()
+        # message -> start of the current second, records passed, suppressed
+        self._windows: Dict[str, List] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """
+        Decide if a record is passed on.
+
+        Parameters
+        ----------
+        record : logging.LogRecord
+            the record
+
+        Returns
+        -------
+        bool
+            False to suppress it
+        """
+        key = self._key(record)
+        if not self.per_second or key is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.setdefault(key, [now, 0, 0])
+            if now - window[0] >= 1.0:
+                window[0], window[1] = now, 0
+            if window[1] >= self.per_second:
+                window[2] += 1
+                return False
+            window[1] += 1
+            suppressed, window[2] = window[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+    @staticmethod
+    def _key(record: logging.LogRecord) -> Optional[str]:
+        """Message or request path a record is sampled by, None if not sampled."""
+        if getattr(record, "sampled", False):
+            return str(record.msg)
+        if (
+            record.name == "uvicorn.access"
+            and isinstance(record.args, tuple)
+            and len(record.args) > 2
+            and str(record.args[2]).startswith(HEARTBEAT_PATHS)
+        ):
+            return str(record.args[2]).split("?", 1)[0]
+        return None
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Puts records into a bounded queue without rendering them.
+
+    Parameters
+    ----------
+    records : queue.Queue
+        queue read by the listener thread
+    """
+
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Keep the record as is, but note the span it was logged in."""
+        context = current_context()
+        if context is not None:
+            record.trace_id = context.trace_id
+            record.span_id = context.span_id
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Queue the record, drop it if the queue is full."""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return
+        if self.dropped:
+            with self._lock:
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                self._report(dropped)
+
+    def _report(self, dropped: int) -> None:
+        """Queue a warning about dropped records, if there is room."""
+        warning = logging.LogRecord(
+            __name__,
+            logging.WARNING,
+            __file__,
+            0,
+            "dropped %s log records, queue full",
+            (dropped,),
+            None,
+        )
+        try:
+            self.queue.put_nowait(warning)
+        except queue.Full:
+            with self._lock:
+                self.dropped += dropped
+
+
+def start_queue_logging(
+    max_records: int, loggers: Optional[List[logging.Logger]] = None
+) -> List[QueueListener]:
+    """
+    Let listener threads render and write the records of all loggers.
+
+    Every handler of the configured loggers is replaced by a queue handler,
+    read by a listener thread passing the records on to the handler. Filters
+    of the handler run before a record is queued.
+
+    Parameters
+    ----------
+    max_records : int
+        size of each queue, further records are dropped
+    loggers : Optional[List[logging.Logger]], optional
+        loggers to change, by default the root logger and all others
+
+    Returns
+    -------
+    List[QueueListener]
+        the started listeners, one per handler, stop them to flush the queues
+    """
+    if loggers is None:
+        loggers = [logging.getLogger()] + [
+            logger
+            for logger in logging.root.manager.loggerDict.values()
+            if isinstance(logger, logging.Logger)
+        ]
+    queued: Dict[logging.Handler, logging.Handler] = {}
+    listeners = []
+    for logger in loggers:
+        for target in logger.handlers:
+            if isinstance(target, logging.NullHandler):
+                queued[target] = target  # libraries discarding their records
+            elif target not in queued:
+                handler = DroppingQueueHandler(queue.Queue(max_records))
+                handler.filters, target.filters = target.filters, []
+                listener = QueueListener(
+                    handler.queue, target, respect_handler_level=True
+                )
+                listener.start()
+                listeners.append(listener)
+                queued[target] = handler
+        logger.handlers = [queued[target] for target in logger.handlers]
+    return listeners
+
+
+def record_extras(_, __, event_dict: Dict) -> Dict:
+    """structlog processor adding trace ids and suppressed count of a record."""
+    record = event_dict.get("_record")
+    for key in ("trace_id", "span_id", "suppressed"):
+        value = getattr(record, key, None)
+        if value is not None:
+            event_dict[key] = value
+    return event_dict
@@ -6,25 +6,70 @@
 
 """
 
-import datetime
+import asyncio
+import atexit
+import functools
 import logging
 import logging.config
-import random
+import os
 import sys
+import threading
 
 from fastapi import FastAPI
 from fastapi.applications import State as FastAPIState
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
+from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 from starlette.responses import JSONResponse
 
 from app.api.exceptions import ApiException, BadRequestException
 from app.api.models import ApiErrorResponse
+from app.api.v1.admin_endpoints import admin_router
 from app.api.v1.consensus_endpoints import consensus_router
+from app.api.v1.kv_endpoints import kv_router
+from app.api.v1.lock_endpoints import lock_router
 from app.config import Settings, get_settings
-from app.raft.discovery import discover_replicas, get_replica_name_by_hostname
+from app.logs import SamplingFilter, start_queue_logging
+from app.raft.admission import AdmissionControl
+from app.raft.discovery import (
+    discover_replicas,
+    get_replica_name_by_hostname,
+    static_replicas,
+)
+from app.raft.forwarding import LeaderForwarder
 from app.raft.functions import FollowerExecutorThread, State
+from app.raft.groups import DEFAULT_GROUP, HeartbeatCoalescer
+from app.raft.kv import KeyValueStore
+from app.raft.leases import LeaseTable
+from app.raft.metrics import Metrics
+from app.raft.pacing import HeartbeatPacer
+from app.raft.profiling import SlowRoundWatchdog, monitor_loop_lag
+from app.raft.reporter import StatusReporterThread, status_event
+from app.raft.scripts import ScriptRunner
+from app.raft.sessions import SessionTable
+from app.raft.status import NodeStatus, current_status
+from app.raft.storage import WriteAheadLog
+from app.raft.timer import ElectionTimer
+from app.raft.tracing import SERVER, TRACEPARENT, SpanContext, Tracer
+from app.raft.watch import WatchHub
+from app.workers import OwnerForwarder, OwnerServer, OwnerView, claim_ownership
+
+# values of the node shared by all of its Raft groups
+NODE_ATTRIBUTES = (
+    "app_name",
+    "id",
+    "replicas",
+    "heartbeat_repeat",
+    "pre_vote",
+    "check_quorum",
+    "heartbeats",
+    "pacer",
+    "catchup_bytes",
+    "metrics",
+    "tracer",
+    "watchdog",
+)
 
 
 def create_app(settings: Settings) -> FastAPI:
@@ -46,6 +91,9 @@ def create_app(settings: Settings) -> FastAPI:
         root_path=settings.ROOT_PATH,
     )
     lcl_app.include_router(consensus_router, prefix="/api/v1/raft", tags=["raft", "v1"])
+    lcl_app.include_router(admin_router, prefix="/api/v1/admin", tags=["admin", "v1"])
+    lcl_app.include_router(lock_router, prefix="/api/v1/locks", tags=["locks", "v1"])
+    lcl_app.include_router(kv_router, prefix="/api/v1/kv", tags=["kv", "v1"])
 
     return lcl_app
 
@@ -66,42 +114,222 @@ def logging_setup(settings: Settings):
     lcl_logger.setLevel(log_level)
 
     logging.config.dictConfig(settings.LOGGING_CONFIG)
+    # the handlers are shared by all loggers, heartbeat records are sampled
+    sampling = SamplingFilter(settings.LOG_SAMPLE_PER_SECOND)
+    for handler in logging.getLogger("app").handlers:
+        handler.addFilter(sampling)
+    if settings.LOG_QUEUE_SIZE:
+        # render and write in a thread, a blocked stdout does not delay Raft
+        for listener in start_queue_logging(settings.LOG_QUEUE_SIZE):
+            atexit.register(listener.stop)
 
 
 def raft_setup(state: FastAPIState, settings: Settings):
     """Set values needed for Raft"""
-    state.app_name = get_replica_name_by_hostname(settings.HOSTNAME)
     state.id = settings.HOSTNAME  # own id
-    state.state = State.FOLLOWER  # state of own state machine
-    state.leader_script = settings.SCRIPT_LEADER_PATH
-    state.follower_script = settings.SCRIPT_FOLLOWER_PATH
-    state.term = 0  # current term
-    # discover other services
-    state.replicas = discover_replicas(settings.APP_NAME, state.id)
+    if settings.PEERS:
+        # fixed nodes, HOSTNAME is the own host:port
+        state.app_name = settings.HOSTNAME
+        state.replicas = static_replicas(settings.PEERS, settings.HOSTNAME)
+    else:
+        state.app_name = get_replica_name_by_hostname(settings.HOSTNAME)
+        # discover other services
+        state.replicas = discover_replicas(settings.APP_NAME, state.id)
     if len(state.replicas) % 2 != 0:
         # there is an even number of nodes in the cluster (counting self) - this
         # can't work
         raise ValueError("Even number of nodes in cluster.")
-    state.vote = None  # id of the node we voted for
-    state.timeout = datetime.timedelta(
-        milliseconds=random.randrange(  # nosec (bandit: not used for security/crypto)
-            settings.ELECTION_TIMEOUT_LOWER_MILLIS,
-            settings.ELECTION_TIMEOUT_UPPER_MILLIS,
-        )
-    )
     state.heartbeat_repeat = (
         settings.HEARTBEAT_REPEAT_MILLIS / 1000
     )  # need to be float seconds
+    state.pre_vote = settings.PRE_VOTE  # only campaign if a majority would vote
+    state.check_quorum = settings.CHECK_QUORUM  # leader steps down w/o majority
+    # spans of rounds and RPCs, continued by the peers via traceparent headers
+    state.tracer = Tracer(settings.HOSTNAME, settings.TRACE_FILE or None)
+    # one request per peer for the heartbeats of all groups
+    state.heartbeats = HeartbeatCoalescer(
+        settings.HEARTBEAT_COALESCE_MILLIS / 1000, tracer=state.tracer
+    )
+    state.pacer = HeartbeatPacer(  # heartbeat interval adapted to peer RTT
+        settings.HEARTBEAT_MIN_MILLIS / 1000,
+        settings.HEARTBEAT_MAX_MILLIS / 1000,
+        state.heartbeat_repeat,
+        settings.ELECTION_TIMEOUT_LOWER_MILLIS / 1000,
+    )
+    state.catchup_bytes = settings.CATCHUP_MAX_BYTES  # per request to a lagging peer
+    state.metrics = Metrics()  # counters and gauges of all groups
+    state.watchdog = SlowRoundWatchdog(  # logs stacks of slow heartbeat rounds
+        settings.SLOW_ROUND_MILLIS / 1000, state.metrics
+    )
+    state.forwarder = None  # passes writes received as follower to the leader
+    if settings.FORWARD_TO_LEADER:
+        state.forwarder = LeaderForwarder(settings.HOSTNAME)
+    state.reporter = None  # pushes status changes to the monitor
+    if settings.MONITOR_URL:
+        state.reporter = StatusReporterThread(
+            settings.MONITOR_URL,
+            settings.MONITOR_PUSH_INTERVAL_MILLIS / 1000,
+            keepalive=settings.MONITOR_KEEPALIVE_MILLIS / 1000,
+        )
+
+    # the app state is the default group, further groups share the node values
+    state.groups = {DEFAULT_GROUP: state}
+    for name in filter(None, map(str.strip, settings.RAFT_GROUPS.split(","))):
+        group = FastAPIState()
+        for attribute in NODE_ATTRIBUTES:
+            setattr(group, attribute, getattr(state, attribute))
+        group.reporter = None  # the monitor shows the default group only
+        raft_group_setup(group, settings, name)
+        state.groups[name] = group
+    raft_group_setup(state, settings, DEFAULT_GROUP)
+    if state.reporter is not None:
+        state.reporter.source = functools.partial(status_event, state)
+        state.reporter.start()
+    # only the default group runs the payload scripts
+    state.leader_script = settings.SCRIPT_LEADER_PATH
+    state.follower_script = settings.SCRIPT_FOLLOWER_PATH
+
+
+def raft_group_setup(state: FastAPIState, settings: Settings, name: str):
+    """Set values of a single Raft group"""
+    state.group = name
+    state.state = State.FOLLOWER  # state of own state machine
+    state.leader_script = None
+    state.follower_script = None
+    state.script_runner = ScriptRunner(settings.SCRIPT_TIMEOUT_MILLIS / 1000)
+    state.log = WriteAheadLog(  # replicated log, term and vote
+        os.path.join(settings.LOG_DIR, settings.HOSTNAME, name),
+        settings.LOG_DURABILITY,
+        settings.LOG_GROUP_COMMIT_MILLIS / 1000,
+        settings.LOG_GROUP_COMMIT_BYTES,
+        settings.LOG_SEGMENT_BYTES,
+        settings.LOG_CACHE_BYTES,
+        state.metrics,
+        state.tracer,
+    )
+    # current term and id of the node we voted for, kept across restarts
+    state.term, state.vote = state.log.hard_state()
+    state.commit_index = 0  # last entry stored on a majority
+    state.last_applied = 0  # last entry applied to the key-value store
+    state.apply_lock = threading.Lock()
+    state.replicate = threading.Event()  # wakes the leader on new entries
+    state.election_timer = ElectionTimer(  # randomized, re-armed every term
+        settings.ELECTION_TIMEOUT_LOWER_MILLIS,
+        settings.ELECTION_TIMEOUT_UPPER_MILLIS,
+    )
     state.leader = None  # id of the node that is leader
+    state.watch = WatchHub(settings.WATCH_MAX_EVENTS)  # leader/term/key changes
+    state.leases = LeaseTable(on_change=state.watch.publish_lease)
+    state.kv = KeyValueStore(
+        on_change=state.watch.publish_value,
+        sessions=SessionTable(  # writes of a client session apply once
+            settings.MAX_SESSIONS, settings.SESSION_TTL_MILLIS / 1000
+        ),
+    )
+    state.admission = AdmissionControl(  # bounds writes waiting on the leader
+        settings.MAX_PENDING_PROPOSALS,
+        settings.MAX_UNCOMMITTED_ENTRIES,
+        settings.HEARTBEAT_MAX_MILLIS / 1000,
+        state.metrics,
+    )
+    state.status = NodeStatus.from_state(state)  # snapshot for request handlers
+
+
+def worker_setup(state: FastAPIState, settings: Settings):
+    """Set values of a worker forwarding to the Raft owner, see `app.workers`"""
+    state.id = settings.HOSTNAME
+    state.app_name = settings.HOSTNAME  # until the owner sent its status
+    state.tracer = Tracer(settings.HOSTNAME)  # spans are recorded by the owner
+    state.metrics = Metrics()  # lag of this worker's event loop
+    state.groups = {DEFAULT_GROUP: state}
+    for name in filter(None, map(str.strip, settings.RAFT_GROUPS.split(","))):
+        state.groups[name] = FastAPIState()
+    for name, group in state.groups.items():
+        group.group = name
+        group.term = 0
+        group.kv = KeyValueStore()  # view of the owner's store
+        group.status = NodeStatus.from_state(group)
+    state.view = OwnerView(state, settings.WORKER_SOCKET)
+    state.worker_server = None
+
+
+async def trace_requests(request: Request, call_next):
+    """
+    Record a span per request, continuing the trace of the sender.
+
+    Parameters
+    ----------
+    request : Request
+        The incoming HTTP request.
+    call_next
+        The next handler.
+
+    Returns
+    -------
+    Response
+        The response of the handler.
+    """
+    parent = SpanContext.from_traceparent(request.headers.get(TRACEPARENT))
+    with request.app.state.tracer.span(
+        f"{request.method} {request.url.path}", SERVER, parent=parent
+    ) as span:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:  # the path template, keys are attributes
+            span.name = f"{request.method} {route.path}"
+        span.set(status_code=response.status_code, **request.path_params)
+    return response
 
 
 app_settings: Settings = get_settings()
 app: FastAPI = create_app(app_settings)
 logging_setup(app_settings)
 logger = logging.getLogger(__name__)
-raft_setup(app.state, app_settings)
-app.state.executor = FollowerExecutorThread(args=(app.state,))
-app.state.executor.start()
+# of several workers, only the one holding the lock runs Raft
+app.state.owner_lock = (
+    claim_ownership(f"{app_settings.WORKER_SOCKET}.lock")
+    if app_settings.WORKER_SOCKET
+    else None
+)
+if app_settings.WORKER_SOCKET and app.state.owner_lock is None:
+    worker_setup(app.state, app_settings)
+    app.add_middleware(
+        OwnerForwarder, path=app_settings.WORKER_SOCKET, view=app.state.view
+    )
+else:
+    raft_setup(app.state, app_settings)
+    if app.state.tracer.enabled:
+        app.add_middleware(BaseHTTPMiddleware, dispatch=trace_requests)
+    for raft_group in app.state.groups.values():
+        raft_group.executor = FollowerExecutorThread(args=(raft_group,))
+        raft_group.executor.start()
+    app.state.view = None
+    app.state.worker_server = (
+        OwnerServer(app, app.state, app_settings.WORKER_SOCKET)
+        if app_settings.WORKER_SOCKET
+        else None
+    )
+
+
+@app.on_event("startup")
+async def attach_watchers():
+    """Let watch requests wait on the event loop of the web server."""
+    # a starved event loop delays the answers to heartbeats and votes
+    app.state.loop_monitor = asyncio.create_task(monitor_loop_lag(app.state.metrics))
+    if app.state.view is not None:  # the owner answers watch requests
+        app.state.view_task = asyncio.create_task(app.state.view.run())
+        return
+    for group in app.state.groups.values():
+        group.watch.attach(asyncio.get_running_loop())
+    if app.state.worker_server is not None:
+        await app.state.worker_server.start()
+
+
+@app.on_event("shutdown")
+async def close_worker_server():
+    """Stop serving the other workers, they answer with 503 until replaced."""
+    if app.state.worker_server is not None:
+        await app.state.worker_server.close()
 
 
 @app.exception_handler(ApiException)
@@ -128,12 +356,15 @@ def api_exception_handler(request: Request, error: ApiException) -> JSONResponse
     json_compatible_response = jsonable_encoder(
         ApiErrorResponse(error=error, apiVersion="1.0"), exclude_none=True
     )
-    # add raft info to error response
-    json_compatible_response["error"]["sender"] = request.app.state.app_name
-    json_compatible_response["error"]["term"] = request.app.state.term
-    json_compatible_response["error"]["id"] = request.app.state.id
+    # add raft info to error response, of the group the request was sent to
+    status = current_status(getattr(request.state, "raft", request.app.state))
+    json_compatible_response["error"]["sender"] = status.app_name
+    json_compatible_response["error"]["term"] = status.term
+    json_compatible_response["error"]["id"] = status.id
     response = JSONResponse(
-        content=json_compatible_response, status_code=error.status_code
+        content=json_compatible_response,
+        status_code=error.status_code,
+        headers={name: str(value) for name, value in error.headers.items()},
     )
     return response
 
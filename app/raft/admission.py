@@ -0,0 +1,127 @@
+"""Admission control of client proposals.
+
+Every write waits on the event loop until it is applied, and every entry the
+followers did not store yet stays in the log of the leader. Without bounds, a
+flood of writes or a slow majority of followers grows both until the node is
+killed or misses its heartbeats. The leader therefore rejects proposals
+
+* with `429` while too many proposals of a group wait to be applied,
+* with `503` while its log is too far ahead of the commit index, since the
+  followers do not keep up,
+
+asking clients to retry after `Retry-After` seconds.
+
+"""
+import math
+import threading
+from typing import Dict, Optional
+
+from app.api.exceptions import ServiceUnavailableException, TooManyRequestsException
+from app.raft.metrics import Metrics
+
+
+class _Pending:
+    """Counts a proposal as pending while it runs."""
+
+    def __init__(self, admission: "AdmissionControl"):
+        self.admission = admission
+
+    def __enter__(self) -> "_Pending":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.admission.release()
+
+
+class AdmissionControl:
+    """
+    Bounds the proposals of a Raft group.
+
+    Parameters
+    ----------
+    max_pending : int
+        proposals waiting to be applied, further ones are rejected with 429,
+        0 for no limit
+    max_uncommitted : int
+        entries the log may be ahead of the commit index, further proposals
+        are rejected with 503, 0 for no limit
+    retry_after : float, optional
+        seconds clients are asked to wait, rounded up, by default 1.0
+    metrics : Optional[Metrics], optional
+        counts rejections as `rejected_proposals_pending` and
+        `rejected_proposals_uncommitted`, by default not counted
+    """
+
+    def __init__(
+        self,
+        max_pending: int,
+        max_uncommitted: int,
+        retry_after: float = 1.0,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.max_pending = max_pending
+        self.max_uncommitted = max_uncommitted
+        self.retry_after = retry_after
+        self.metrics = metrics
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    def admit(self) -> _Pending:
+        """
+        Count a proposal as pending for the duration of a `with` block.
+
+        Returns
+        -------
+        context manager releasing the proposal
+
+        Raises
+        ------
+        TooManyRequestsException
+            when `max_pending` proposals are pending
+        """
+        with self._lock:
+            if not self.max_pending or self.pending < self.max_pending:
+                self.pending += 1
+                return _Pending(self)
+        self._count("rejected_proposals_pending")
+        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+        raise TooManyRequestsException(  # type: ignore
+            message=f"{self.max_pending} writes pending, retry later.",
+            headers=self.headers,
+        )
+
+    def release(self) -> None:
+        """A pending proposal was applied or given up."""
+        with self._lock:
+            self.pending -= 1
+
+    def check_uncommitted(self, uncommitted: int) -> None:
+        """
+        Reject a proposal while the followers do not keep up.
+
+        Parameters
+        ----------
+        uncommitted : int
+            entries of the log after the commit index
+
+        Raises
+        ------
+        ServiceUnavailableException
+            when `max_uncommitted` entries are not committed yet
+        """
+        if self.max_uncommitted and uncommitted >= self.max_uncommitted:
+            self._count("rejected_proposals_uncommitted")
+            # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+            raise ServiceUnavailableException(  # type: ignore
+                message=f"{uncommitted} entries not committed, retry later.",
+                headers=self.headers,
+            )
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """Headers of a rejection."""
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+    def _count(self, name: str) -> None:
+        if self.metrics is not None:
+            self.metrics.increment(name)
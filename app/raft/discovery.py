@@ -80,6 +80,28 @@ def get_replica_name_by_hostname(hostname: str) -> str:
     return get_hostname_by_ip(discover_by_dns(hostname)[0])
 
 
+def static_replicas(peers: str, own_address: str) -> Dict[str, str]:
+    """
+    Use a fixed list of nodes instead of DNS, e.g. for a cluster on localhost.
+
+    Nodes are named by their address, so other nodes reach them by name.
+
+    Parameters
+    ----------
+    peers : str
+        comma separated `host:port` of all nodes, including this one
+    own_address : str
+        `host:port` of this node
+
+    Returns
+    -------
+    Dict[str, str]
+        Map names of the other nodes to their addresses.
+    """
+    addresses = [peer.strip() for peer in peers.split(",") if peer.strip()]
+    return {address: address for address in addresses if address != own_address}
+
+
 def discover_replicas(app_name: str, hostname: str) -> Dict[str, str]:
     """
     Discover all replicas of this service in the same Docker network.
@@ -0,0 +1,98 @@
+"""Writes received by a follower, sent on to the leader.
+
+A follower that knows the leader of a group passes a write on to it and
+answers with the answer of the leader, so clients need not find the leader
+themselves. The name of the leader is added to the answer as `X-Raft-Leader`,
+clients can send the next write there directly. Requests are sent over a
+pool of keep-alive connections and forwarded at most once: a forwarded write
+reaching a node that is no leader either is answered with `421`.
+
+"""
+import logging
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.raft.tracing import TRACEPARENT, current_context
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+LEADER_HEADER = "X-Raft-Leader"  # leader that answered a forwarded write
+FORWARDED_HEADER = "X-Raft-Forwarded-By"  # follower that forwarded a write
+
+
+class LeaderForwarder:
+    """
+    Sends requests on to the leader over pooled connections.
+
+    Thread-safe, shared by all groups of a node.
+
+    Parameters
+    ----------
+    node_id : str
+        id of this node, sent as `X-Raft-Forwarded-By`
+    pool_size : int, optional
+        connections kept per leader, by default 32
+    """
+
+    def __init__(self, node_id: str, pool_size: int = 32):
+        self.node_id = node_id
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+
+    def forward(
+        self,
+        leader: str,
+        method: str,
+        path: str,
+        params: Dict[str, str],
+        body: bytes,
+        content_type: Optional[str],
+        timeout: float,
+    ) -> requests.Response:
+        """
+        Send a request on to the leader.
+
+        Parameters
+        ----------
+        leader : str
+            name of the leader, reachable as `http://<leader>`
+        method : str
+            HTTP method
+        path : str
+            path of the request
+        params : Dict[str, str]
+            query parameters
+        body : bytes
+            request body
+        content_type : Optional[str]
+            content type of the body
+        timeout : float
+            seconds to wait for the answer
+
+        Returns
+        -------
+        requests.Response
+            the answer of the leader
+
+        Raises
+        ------
+        requests.RequestException
+            when the leader could not be reached
+        """
+        headers = {FORWARDED_HEADER: self.node_id}
+        if content_type:
+            headers["Content-Type"] = content_type
+        context = current_context()
+        if context is not None:
+            headers[TRACEPARENT] = context.traceparent
+        return self.session.request(
+            method,
+            f"http://{leader}{path}",
+            params=params,
+            data=body,
+            headers=headers,
+            timeout=timeout,
+        )
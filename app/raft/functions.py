@@ -1,18 +1,34 @@
 """Functions and function container objects for Raft."""
-import datetime
+
 import enum
 import logging
-import subprocess
 import threading
+import time
 from http import HTTPStatus
+from typing import List, Optional
 
 import requests
 from fastapi.applications import State as FastAPIState
 
+from app.api.exceptions import (
+    BadRequestException,
+    NotLeaderException,
+    ServiceUnavailableException,
+)
 from app.api.v1.models import RaftMessageSchema, RaftStateException
+from app.logs import SAMPLED
+from app.raft.kv import KeyValueStore
+from app.raft.profiling import NO_WATCHDOG, SlowRoundWatchdog
+from app.raft.reporter import status_event
+from app.raft.status import NodeStatus, current_status
+from app.raft.storage import LogEntry, RecordRange
+from app.raft.tracing import CLIENT, NO_TRACER, TRACEPARENT, Tracer, current_context
 
 logger: logging.Logger = logging.getLogger(__name__)
 
+MAX_APPEND_ENTRIES = 256  # per append entries request
+CATCHUP_TIMEOUT = 5.0  # seconds, catch-up requests carry up to a segment slice
+
 
 class State(enum.Enum):
     """Possible states a nodes state machine can hold."""
@@ -32,6 +48,10 @@ class StateExecutorThread(threading.Thread):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._stop_evt = threading.Event()
+        if "name" not in kwargs and self._args:
+            # tell the groups apart in thread dumps and profiles
+            group = getattr(self._args[0], "group", None)
+            self.name = f"{type(self).__name__}[{group}]"
 
     def stop(self) -> None:
         """Gracefully stop state executor thread."""
@@ -53,33 +73,44 @@ class FollowerExecutorThread(StateExecutorThread):
 
     def run(self) -> None:
         state = self._args[0]
-        state.state = State.FOLLOWER
-        state.ping_time = datetime.datetime.utcnow()
-        # run payload follower script
-        subprocess.Popen(["/bin/sh", state.follower_script])
-        while not self._stop_evt.wait(timeout=state.heartbeat_repeat):
-            be_follower(state)
+        become_follower(state)
+        # block until the election timer fires, heartbeats push it back
+        while state.election_timer.wait(self._stop_evt):
+            # woke up after the deadline, late if the thread was starved
+            observe(state, "timer_drift_follower", -state.election_timer.remaining())
+            run_handler(state, State.FOLLOWER, be_follower)
+
+    def stop(self) -> None:
+        """Gracefully stop follower executor thread waiting on the timer."""
+        super().stop()
+        self._args[0].election_timer.wake()
 
 
 class CandidateExecutorThread(StateExecutorThread):
-    """Models the behaviour of a node in the State.CANDIDATE state."""
+    """
+    Models the behaviour of a node in the State.CANDIDATE state.
+
+    Set `pre_vote` to False to skip the pre-vote, e.g. on a leadership transfer.
+    """
+
+    def __init__(self, *args, pre_vote: bool = True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pre_vote = pre_vote
 
     def run(self) -> None:
         state = self._args[0]
-        state.state = State.CANDIDATE
-        state.possible_voters = state.replicas.copy()
-        state.actual_voters = []
-        if state.replicas:
-            state.term += 1
-            state.vote = state.id
-            state.my_votes = 1
-        else:
-            # no nodes left except us? no need to be a candidate
+        if self.pre_vote and state.pre_vote and not pre_vote(state):
+            # no majority would vote for us, do not disrupt the cluster
+            logger.info("pre-vote for term %s failed", state.term + 1)
+            return
+        if self._stop_evt.is_set() or not become_candidate(state):
             return
 
-        while not self._stop_evt.wait(timeout=state.heartbeat_repeat):
+        while not timed_wait(
+            state, State.CANDIDATE, self._stop_evt, state.heartbeat_repeat
+        ):
             try:
-                be_candidate(state)
+                run_handler(state, State.CANDIDATE, be_candidate)
             except RaftStateException:  # end of candidature
                 return
 
@@ -89,30 +120,399 @@ class LeaderExecutorThread(StateExecutorThread):
 
     def run(self) -> None:
         state = self._args[0]
-        state.state = State.LEADER
-        # run payload leader script
-        subprocess.Popen(["/bin/sh", state.leader_script])
-        while not self._stop_evt.wait(timeout=state.heartbeat_repeat):
+        if self._stop_evt.is_set():
+            return  # stepped down before the thread started
+        become_leader(state)
+        while True:
+            # ticks are aligned to the clock, so the heartbeats of all groups
+            # led by this node fall into the same coalescing window, proposals
+            # are replicated right away
+            timed_wait(
+                state, State.LEADER, state.replicate, next_tick(state.pacer.interval)
+            )
+            state.replicate.clear()
+            if self._stop_evt.is_set():
+                return
             try:
-                be_leader(state)
+                run_handler(state, State.LEADER, be_leader)
             except RaftStateException:  # end of leadership
                 return
 
+    def stop(self) -> None:
+        """Gracefully stop leader executor thread waiting for the next tick."""
+        super().stop()
+        self._args[0].replicate.set()
+
+
+EXECUTORS = {
+    State.FOLLOWER: FollowerExecutorThread,
+    State.CANDIDATE: CandidateExecutorThread,
+    State.LEADER: LeaderExecutorThread,
+}
+
+
+def executor_for(state: FastAPIState, role: State, **kwargs) -> StateExecutorThread:
+    """
+    Create the executor of `role`, not started yet.
+
+    The executor threads can be replaced with `state.executors`, e.g. by the
+    simulator running all nodes on a virtual clock.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+    role : State
+        role to execute
+    **kwargs
+        passed to the executor, e.g. `pre_vote` of the candidate
+
+    Returns
+    -------
+    StateExecutorThread
+        the executor
+    """
+    return getattr(state, "executors", EXECUTORS)[role](args=(state,), **kwargs)
+
+
+def clock(state: FastAPIState) -> float:
+    """
+    Read the monotonic clock of the node, `state.clock` if set.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+
+    Returns
+    -------
+    float
+        seconds
+    """
+    return getattr(state, "clock", time.monotonic)()
+
+
+def sleep(state: FastAPIState, seconds: float) -> None:
+    """
+    Pause the calling thread, with `state.sleep` if set.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+    seconds : float
+        time to pause
+    """
+    getattr(state, "sleep", time.sleep)(seconds)
+
+
+def transport(state: FastAPIState):
+    """
+    Return the HTTP client of the node, `state.transport` if set.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+
+    Returns
+    -------
+    module or object with the `put` and `post` functions of `requests`
+    """
+    return getattr(state, "transport", requests)
+
+
+def tracer(state: FastAPIState) -> Tracer:
+    """
+    Return the tracer of the node, `state.tracer` if set.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+
+    Returns
+    -------
+    Tracer
+        records spans of rounds and RPCs, a no-op unless configured
+    """
+    return getattr(state, "tracer", NO_TRACER)
+
+
+def watchdog(state: FastAPIState) -> SlowRoundWatchdog:
+    """
+    Return the slow round watchdog of the node, `state.watchdog` if set.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+
+    Returns
+    -------
+    SlowRoundWatchdog
+        logs the stack of slow heartbeat rounds, a no-op unless configured
+    """
+    return getattr(state, "watchdog", NO_WATCHDOG)
+
+
+def observe(state: FastAPIState, name: str, seconds: float) -> None:
+    """
+    Add a duration to a timing of the node, if it has metrics.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+    name : str
+        name of the timing
+    seconds : float
+        the duration
+    """
+    metrics = getattr(state, "metrics", None)
+    if metrics is not None:
+        metrics.observe(name, seconds)
+
+
+def timed_wait(
+    state: FastAPIState, role: State, event: threading.Event, timeout: float
+) -> bool:
+    """
+    Wait for an event of an executor, timing how late a timeout woke it up.
+
+    A starved process wakes up late although the network is fine, recorded as
+    `timer_drift_<role>`.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+    role : State
+        role of the waiting executor
+    event : threading.Event
+        event to wait for
+    timeout : float
+        seconds to wait at most
+
+    Returns
+    -------
+    bool
+        True if the event was set, False on timeout
+    """
+    scheduled = clock(state) + timeout
+    if event.wait(timeout=timeout):
+        return True
+    late = max(0.0, clock(state) - scheduled)
+    observe(state, f"timer_drift_{role.value.lower()}", late)
+    return False
+
+
+def run_handler(state: FastAPIState, role: State, handler) -> None:
+    """
+    Run the handler of a role, timed as `handler_<role>`.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+    role : State
+        role of the calling executor
+    handler : Callable[[FastAPIState], None]
+        e.g. `be_leader`
+    """
+    started = clock(state)
+    try:
+        handler(state)
+    finally:
+        observe(state, f"handler_{role.value.lower()}", clock(state) - started)
+
+
+def next_tick(interval: float) -> float:
+    """
+    Seconds until the next multiple of `interval` on the monotonic clock.
+
+    Parameters
+    ----------
+    interval : float
+        tick interval in seconds
+
+    Returns
+    -------
+    float
+        seconds to wait
+    """
+    return interval - time.monotonic() % interval
+
+
+def status_changed(state: FastAPIState) -> None:
+    """
+    Hook called whenever role, term, vote or leader of this node changed.
+
+    Publishes a new status snapshot for request handlers first.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+    """
+    state.status = NodeStatus.from_state(state)
+    log = getattr(state, "log", None)
+    if log is not None:
+        log.save_hard_state(state.term, state.vote)  # before answering anyone
+    reporter = getattr(state, "reporter", None)
+    if reporter is not None:
+        reporter.report(status_event(state))
+    watch = getattr(state, "watch", None)
+    if watch is not None:
+        watch.publish_status(state.term, state.leader)
+
+
+def become_follower(state: FastAPIState) -> None:
+    """
+    Enter the follower role, run by the follower executor on start.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+    """
+    state.state = State.FOLLOWER
+    state.election_timer.reset()
+    status_changed(state)
+    # run payload follower script, cancels the leader script
+    state.script_runner.run(State.FOLLOWER.value, state.follower_script)
+
+
+def become_candidate(state: FastAPIState) -> bool:
+    """
+    Enter the candidate role in a new term, voting for ourselves.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+
+    Returns
+    -------
+    bool
+        False if there are no other nodes to ask for votes
+    """
+    state.state = State.CANDIDATE
+    state.possible_voters = state.replicas.copy()
+    state.actual_voters = []
+    if not state.replicas:
+        # no nodes left except us? no need to be a candidate
+        return False
+    state.term += 1
+    state.vote = state.id
+    state.leader = None
+    state.my_votes = 1
+    status_changed(state)
+    return True
+
+
+def become_leader(state: FastAPIState) -> None:
+    """
+    Enter the leader role, run by the leader executor on start.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+    """
+    state.state = State.LEADER
+    state.leader = state.app_name
+    state.leader_since = clock(state)
+    state.last_ack = dict.fromkeys(state.replicas, state.leader_since)
+    state.last_append = {}  # when a follower was sent entries last
+    state.next_index = dict.fromkeys(state.replicas, state.log.last_index + 1)
+    state.match_index = dict.fromkeys(state.replicas, 0)
+    status_changed(state)
+    # an entry of the own term commits the entries of previous terms
+    state.log.append(state.term, [KeyValueStore.command(KeyValueStore.NOOP)])
+    # run payload leader script, cancels the follower script
+    state.script_runner.run(State.LEADER.value, state.leader_script)
+
 
 def be_follower(state: FastAPIState) -> None:
     """
-    Start the follower process, while the app is listening for the other nodes.
+    Start a candidature after the election timer of the follower fired.
+
+    A still running candidature of a previous term is stopped first, the timer
+    is re-armed with a fresh random timeout for the upcoming term.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+    """
+    # previous leader (or previous election) timed out, time to be a candidate
+    start_election(state)
+
+
+def start_election(state: FastAPIState, with_pre_vote: bool = True) -> None:
+    """
+    Stop a running candidature and start a new one.
 
     Parameters
     ----------
     state : FastAPIState
         global state object
+    with_pre_vote : bool, optional
+        run a pre-vote before incrementing the term, by default True
     """
-    # check if time since last ping is over
-    if datetime.datetime.utcnow() - state.ping_time > state.timeout:
-        # previous leader timed out, time to be a candidate
-        state.candidature = CandidateExecutorThread(args=(state,))
-        state.candidature.start()
+    previous = getattr(state, "candidature", None)
+    if previous is not None and previous.is_alive():
+        previous.stop()
+    state.election_timer.rearm()
+    state.candidature = executor_for(state, State.CANDIDATE, pre_vote=with_pre_vote)
+    state.candidature.start()
+
+
+def pre_vote(state: FastAPIState) -> bool:
+    """
+    Ask all replicas if they would vote for us in the next term.
+
+    The pre-vote neither increments the term nor makes the replicas change
+    theirs, so a partitioned or slow node can not force a healthy leader to
+    step down.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+
+    Returns
+    -------
+    bool
+        True if a majority would grant its vote
+    """
+    message = RaftMessageSchema.from_state_object(state)
+    message.term += 1
+    votes = 1
+    with tracer(state).span("pre-vote round", group=message.group, term=message.term):
+        for replica in state.replicas.keys():
+            with tracer(state).span("PUT /prevote", CLIENT, peer=replica) as rpc:
+                try:
+                    response = transport(state).put(
+                        f"http://{replica}/api/v1/raft/prevote",
+                        json=message.dict(),
+                        timeout=0.5,
+                        headers=rpc.headers,
+                    )
+                except requests.RequestException as error:
+                    rpc.fail(str(error))
+                    logger.info("got error: %s", str(error))
+                    continue
+                rpc.set(status_code=response.status_code)
+            if response.status_code == HTTPStatus.OK:
+                votes += 1
+                if votes > len(state.replicas) // 2:
+                    return True
+            elif state.term < response.json()["error"]["term"]:
+                term_reset(state, response.json()["error"]["term"])
+                return False
+    return False
 
 
 def be_candidate(state: FastAPIState) -> None:
@@ -130,37 +530,54 @@ def be_candidate(state: FastAPIState) -> None:
     RaftStateException
         when candidature needs to be ended (i.e. becoming leader next)
     """
-    for replica in state.possible_voters.keys():
-        if replica in state.actual_voters:
-            # already voted for us, skip
-            continue
+    status = current_status(state)
+    with tracer(state).span(
+        "vote round",
+        expected=(RaftStateException,),
+        group=status.group,
+        term=status.term,
+    ) as round_span:
+        for replica in state.possible_voters.keys():
+            if replica in state.actual_voters:
+                # already voted for us, skip
+                continue
 
-        # ask replica to vote for us
-        try:
-            response = requests.put(
-                f"http://{replica}/api/v1/raft/vote",
-                json=RaftMessageSchema.from_state_object(state).dict(),
-                timeout=0.5,
-            )
-        except requests.RequestException as error:
-            logger.info("got error: %s", str(error))
-            continue
-        response_data = response.json()
-        if response.status_code == HTTPStatus.OK:
-            # we got a vote
-            state.actual_voters.append(replica)
-            state.my_votes += 1
-            if state.my_votes > len(state.replicas) // 2:
-                # we have the majority
-                logger.info("got majority of votes, becoming leader")
-                state.state = State.LEADER
-                state.executor = LeaderExecutorThread(args=(state,))
-                state.executor.start()
+            # ask replica to vote for us
+            with tracer(state).span("PUT /vote", CLIENT, peer=replica) as rpc:
+                try:
+                    response = transport(state).put(
+                        f"http://{replica}/api/v1/raft/vote",
+                        json=RaftMessageSchema.from_state_object(state).dict(),
+                        timeout=0.5,
+                        headers=rpc.headers,
+                    )
+                except requests.RequestException as error:
+                    rpc.fail(str(error))
+                    logger.info("got error: %s", str(error))
+                    continue
+                rpc.set(status_code=response.status_code)
+            response_data = response.json()
+            if state.state is not State.CANDIDATE:
+                raise RaftStateException()  # stepped down while asking
+            if response.status_code == HTTPStatus.OK:
+                # we got a vote
+                state.actual_voters.append(replica)
+                state.my_votes += 1
+                if state.my_votes > len(state.replicas) // 2:
+                    # we have the majority
+                    logger.info("got majority of votes, becoming leader")
+                    round_span.set(votes=state.my_votes)
+                    state.executor.stop()  # no election timeouts while leader
+                    state.executor = executor_for(state, State.LEADER)
+                    state.state = State.LEADER
+                    # a newer term seen before the executor runs stops the leader
+                    status_changed(state)
+                    state.executor.start()
+                    raise RaftStateException()  # end candidature
+            elif state.term < response_data["error"]["term"]:
+                # we did not get a vote, votes of this term do not count in the next
+                term_reset(state, response_data["error"]["term"], State.CANDIDATE)
                 raise RaftStateException()  # end candidature
-        else:
-            # we did not get a vote
-            if state.term < response_data["error"]["term"]:
-                term_reset(state, response_data["error"]["term"])
 
 
 def be_leader(state: FastAPIState) -> None:
@@ -181,22 +598,708 @@ def be_leader(state: FastAPIState) -> None:
         when candidature needs to be ended (i.e. becoming leader next)
     """
 
+    state.leases.expire()
+    heartbeat = heartbeat_message(state)
     followers = state.replicas.copy()
-    for replica, _ in followers.items():
+    now = clock(state)
+    span = tracer(state).span(
+        "heartbeat round",
+        expected=(RaftStateException,),
+        group=heartbeat["group"],
+        term=heartbeat["term"],
+        commit_index=heartbeat["leader_commit"],
+    )
+    # a round slower than the threshold gets its stack logged while it runs
+    with watchdog(state).watch(f"heartbeat round {heartbeat['group']}"), span:
+        for replica, _ in followers.items():
+            append_to_follower(state, replica, heartbeat, now)
+        advance_commit(state)
+        if state.check_quorum:
+            check_quorum(state)
+
+
+def append_to_follower(
+    state: FastAPIState, replica: str, heartbeat: dict, now: float
+) -> None:
+    """
+    Send the missing entries or a due heartbeat to one follower of `be_leader`.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+    replica : str
+        follower to send to
+    heartbeat : dict
+        as returned by `heartbeat_message`
+    now : float
+        start of the heartbeat round, see `clock`
+
+    Raises
+    ------
+    RaftStateException
+        when the follower knows a newer term
+    """
+    next_index = min(state.next_index.get(replica, 1), state.log.last_index + 1)
+    records = None
+    if state.log.last_index - next_index >= MAX_APPEND_ENTRIES:
+        # far behind, send raw records straight from the log segment
+        records = state.log.records(next_index, state.catchup_bytes)
+    message = append_message(state, replica, heartbeat, with_entries=records is None)
+    if records is not None:
+        match = records.last_index
+    elif message["entries"] or state.pacer.due(
+        state.last_append.get(replica, 0.0), now
+    ):
+        match = message["prev_log_index"] + len(message["entries"])
+    else:
+        return  # got entries recently, no need for a heartbeat
+    with tracer(state).span(
+        "append entries",
+        CLIENT,
+        peer=replica,
+        prev_log_index=message["prev_log_index"],
+        entries=match - message["prev_log_index"],
+    ) as rpc:
+        sent = clock(state)
         try:
-            response = requests.post(
-                f"http://{replica}/api/v1/raft/log",
-                json=RaftMessageSchema.from_state_object(state).dict(),
-                timeout=0.5,
-            )
+            if records is not None:
+                response = send_records(state, replica, message, records)
+            else:
+                # coalesced with the heartbeats of other groups to this replica
+                response = state.heartbeats.send(replica, message)
+                state.pacer.observe(replica, clock(state) - sent)
         except requests.RequestException as error:
-            logger.info("got error: %s", str(error))
-            continue
-        response_data = response.json()
+            rpc.fail(str(error))
+            logger.info("got error: %s", str(error), extra=SAMPLED)
+            return
+        rpc.set(status_code=response.status_code)
+    state.last_append[replica] = sent
+    response_data = response.json()
+    if response.status_code == HTTPStatus.OK:
+        state.last_ack[replica] = clock(state)
+        state.match_index[replica] = max(state.match_index[replica], match)
+        state.next_index[replica] = state.match_index[replica] + 1
+    elif state.term < response_data["error"]["term"]:
+        logger.info("leader got newer term, resetting")
+        term_reset(state, response_data["error"]["term"], State.LEADER)
+        raise RaftStateException()  # end of leadership
+    elif response.status_code == HTTPStatus.CONFLICT:
+        # follower lacks the preceding entry, skip the conflicting term
+        state.next_index[replica] = conflict_next_index(
+            state, message["prev_log_index"], response_data["error"]
+        )
+
+
+def grant_pre_vote(state: FastAPIState, v_req: RaftMessageSchema) -> RaftMessageSchema:
+    """
+    Handle a pre-vote request, without changing term or vote.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object of the group the message is sent to
+    v_req : RaftMessageSchema
+        the received message
+
+    Returns
+    -------
+    RaftMessageSchema
+        the answer to the candidate
+
+    Raises
+    ------
+    BadRequestException
+        when the pre-vote is rejected
+    """
+    if not state.replicas.get(v_req.sender):
+        logger.info("reject unknown node %s", v_req.sender)
+        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+        raise BadRequestException(message=f"Node app_name {v_req.sender} unknown.")  # type: ignore
+
+    status = current_status(state)
+    if v_req.term <= status.term:
+        logger.info("reject outdated term (%s) pre-vote request", v_req.term)
+        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+        raise BadRequestException(message=f"Outdated term: {v_req.term}.")  # type: ignore
+
+    if status.state is State.LEADER or (
+        status.leader is not None
+        and state.election_timer.since_reset() < state.election_timer.lower
+    ):
+        logger.info(
+            "reject pre-vote from %s, leader is alive", v_req.sender, extra=SAMPLED
+        )
+        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+        raise BadRequestException(message=f"Leader {status.leader} is alive.")  # type: ignore
+
+    require_log_up_to_date(state, v_req)
+    return RaftMessageSchema.from_state_object(state)
+
+
+def grant_vote(state: FastAPIState, v_req: RaftMessageSchema) -> RaftMessageSchema:
+    """
+    Handle a vote request, voting at most once per term.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object of the group the message is sent to
+    v_req : RaftMessageSchema
+        the received message
+
+    Returns
+    -------
+    RaftMessageSchema
+        the answer to the candidate
+
+    Raises
+    ------
+    BadRequestException
+        when the vote is rejected
+    """
+    # check if node is known
+    if state.replicas.get(v_req.sender):
+        logger.info("vote requested from %s", v_req.sender)
+    else:
+        # We do not know this node (not discovered)
+        logger.info("reject unknown node %s", v_req.sender)
+        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+        raise BadRequestException(message=f"Node app_name {v_req.sender} unknown.")  # type: ignore
+
+    # check if term is correct
+    status = current_status(state)
+    if v_req.term < status.term:
+        # requests term is out of date, rejecting
+        logger.info("reject outdated term (%s) vote request", v_req.term)
+        # mypy has problems with pydantic.dataclasses, so I am disabling the type check for this instance
+        raise BadRequestException(message=f"Outdated term: {v_req.term}.")  # type: ignore
+
+    if status.term == v_req.term:
+        # terms match
+        logger.debug("current term %s == %s", status.term, v_req.term)
+        if not status.vote or status.vote == v_req.sender:
+            # we want to vote for this node
+            require_log_up_to_date(state, v_req)
+            if not status.vote:
+                state.vote = v_req.sender
+                status_changed(state)
+            return RaftMessageSchema.from_state_object(state)
+
+        # we do not want to vote for this node
+        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+        raise BadRequestException(message=f"Did not vote for {v_req.sender}.")  # type: ignore
+
+    # own term is outdated
+    logger.info("term %s out of date by %s", status.term, (v_req.term - status.term))
+    # if leader, step down, then vote
+    term_reset(state, v_req.term, status.state)
+    require_log_up_to_date(state, v_req)
+    state.vote = v_req.sender
+    status_changed(state)
+    return RaftMessageSchema.from_state_object(state)
+
+
+def timeout_now(state: FastAPIState, t_req: RaftMessageSchema) -> RaftMessageSchema:
+    """
+    Start an election right away, on leadership transfer by the leader.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object of the group the message is sent to
+    t_req : RaftMessageSchema
+        the received message
+
+    Returns
+    -------
+    RaftMessageSchema
+        the answer to the leader
+
+    Raises
+    ------
+    BadRequestException
+        when the sender is not the current leader
+    """
+    status = current_status(state)
+    if status.leader != t_req.sender or status.term != t_req.term:
+        # only the current leader may hand over its leadership
+        logger.info("reject timeout now from %s", t_req.sender)
+        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+        raise BadRequestException(message=f"{t_req.sender} is not leader.")  # type: ignore
+
+    logger.info("leadership transfer from %s, starting election", t_req.sender)
+    start_election(state, with_pre_vote=False)
+    return RaftMessageSchema.from_state_object(state)
+
+
+def append_entries(
+    state: FastAPIState,
+    l_req: RaftMessageSchema,
+    entries: Optional[List[LogEntry]] = None,
+) -> RaftMessageSchema:
+    """
+    Handle a heartbeat / log append of the leader.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object of the group the message is sent to
+    l_req : RaftMessageSchema
+        the received message
+    entries : Optional[List[LogEntry]], optional
+        entries received as raw records on catch-up, by default the entries of
+        `l_req`
+
+    Returns
+    -------
+    RaftMessageSchema
+        the answer to the leader
+
+    Raises
+    ------
+    BadRequestException
+        when the sender is unknown or its term is outdated
+    """
+    status = current_status(state)
+    if state.replicas.get(l_req.sender):
+        logger.info("heartbeat / log append from %s", l_req.sender, extra=SAMPLED)
+    else:
+        # we do not know this node
+        logger.info("reject unknown node %s", l_req.sender)
+        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+        raise BadRequestException(message=f"Node ID {l_req.sender} unknown.")  # type: ignore
+
+    # check if term is correct
+    if status.term > l_req.term:
+        # term out of date, rejecting
+        logger.info("reject outdated term %s log append", l_req.term, extra=SAMPLED)
+        # mypy has problems with pydantic.dataclasses, so I am disabling the type check for this instance
+        raise BadRequestException(message=f"Outdated term: {l_req.term}")  # type: ignore
+
+    # term is current or newer
+    state.election_timer.reset()
+    term_reset(state, l_req.term, status.state)
+    if status.leader != l_req.sender:
+        state.leader = l_req.sender
+        status_changed(state)
+    if l_req.leases is not None:
+        state.leases.restore(l_req.leases)
+
+    if entries is None:
+        entries = [LogEntry(e.index, e.term, e.data.encode()) for e in l_req.entries]
+    # durable as configured before the leader counts the entries as stored
+    last = state.log.write(l_req.prev_log_index, l_req.prev_log_term, entries)
+    commit(state, min(l_req.leader_commit, last))
+
+    return RaftMessageSchema.from_state_object(state)
+
+
+def heartbeat_message(state: FastAPIState) -> dict:
+    """
+    Build the heartbeat sent by the leader, replicating the lease table.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+
+    Returns
+    -------
+    dict
+        JSON-serializable RaftMessageSchema
+    """
+    message = RaftMessageSchema.from_state_object(state)
+    message.leases = state.leases.snapshot()
+    message.leader_commit = state.commit_index
+    return message.dict()
+
+
+def append_message(
+    state: FastAPIState, replica: str, heartbeat: dict, with_entries: bool = True
+) -> dict:
+    """
+    Add the entries `replica` is missing to a heartbeat.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+    replica : str
+        follower the message is sent to
+    heartbeat : dict
+        as returned by `heartbeat_message`
+    with_entries : bool, optional
+        False to only add the position of the entries, by default True
+
+    Returns
+    -------
+    dict
+        JSON-serializable RaftMessageSchema
+    """
+    next_index = min(state.next_index.get(replica, 1), state.log.last_index + 1)
+    entries = state.log.entries(next_index, MAX_APPEND_ENTRIES) if with_entries else []
+    # bounds the bytes in flight to a follower, at least one entry is sent
+    max_bytes = getattr(state, "catchup_bytes", 0)
+    size = 0
+    for count, entry in enumerate(entries):
+        size += len(entry.data)
+        if count and max_bytes and size > max_bytes:
+            entries = entries[:count]
+            break
+    return {
+        **heartbeat,
+        "prev_log_index": next_index - 1,
+        "prev_log_term": state.log.term_at(next_index - 1),
+        "entries": [
+            {"index": entry.index, "term": entry.term, "data": entry.data.decode()}
+            for entry in entries
+        ],
+    }
+
+
+def send_records(
+    state: FastAPIState, replica: str, message: dict, records: RecordRange
+) -> requests.Response:
+    """
+    Send raw log records to a follower that is far behind.
+
+    The records are posted as they are stored in the log segment, the rest of
+    the message is sent as query parameters.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+    replica : str
+        follower to send to
+    message : dict
+        as returned by `append_message`, without entries
+    records : RecordRange
+        records following `prev_log_index` of the message
+
+    Returns
+    -------
+    requests.Response
+        the answer of the follower
+
+    Raises
+    ------
+    requests.RequestException
+        when the follower could not be reached
+    """
+    params = {
+        key: message[key]
+        for key in (
+            "id",
+            "sender",
+            "term",
+            "group",
+            "prev_log_index",
+            "prev_log_term",
+            "leader_commit",
+        )
+        if message.get(key) is not None
+    }
+    context = current_context()
+    headers = {"Content-Type": "application/octet-stream"}
+    if context is not None:
+        headers[TRACEPARENT] = context.traceparent
+    return transport(state).post(
+        f"http://{replica}/api/v1/raft/log/catchup",
+        params=params,
+        data=records.data,
+        headers=headers,
+        timeout=CATCHUP_TIMEOUT,
+    )
+
+
+def conflict_next_index(state: FastAPIState, prev_log_index: int, error: dict) -> int:
+    """
+    Find the next entry to send after a follower rejected an append.
+
+    The follower hints the term of its conflicting entry and the first index
+    of that term. If the leader has entries of that term, it resends from its
+    last one, otherwise it skips the whole term. Without hints, it retries one
+    entry earlier.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+    prev_log_index : int
+        index of the entry preceding the rejected entries
+    error : dict
+        error of the rejection, hints in `details`
+
+    Returns
+    -------
+    int
+        next index of the follower
+    """
+    details = error.get("details") or {}
+    next_index = prev_log_index
+    if details.get("conflict_index") is not None:
+        next_index = details["conflict_index"]
+        if details.get("conflict_term") is not None:
+            last = state.log.last_index_of_term(details["conflict_term"])
+            if last is not None:
+                next_index = last + 1
+    return max(1, min(next_index, prev_log_index))  # always move back
+
+
+def advance_commit(state: FastAPIState) -> None:
+    """
+    Commit the entries stored on a majority of nodes.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+    """
+    matches = sorted([state.log.last_index, *state.match_index.values()], reverse=True)
+    index = matches[len(state.replicas) // 2]  # stored on a majority
+    if state.log.term_at(index) == state.term:  # only entries of the own term
+        commit(state, index)
+
+
+def commit(state: FastAPIState, index: int) -> None:
+    """
+    Advance the commit index and apply the newly committed entries.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+    index : int
+        index of the last committed entry
+    """
+    with state.apply_lock:
+        if index <= state.commit_index:
+            return
+        state.commit_index = index
+        if state.last_applied >= index:
+            return
+        with tracer(state).span("apply", first=state.last_applied + 1, last=index):
+            while state.last_applied < index:
+                count = min(MAX_APPEND_ENTRIES, index - state.last_applied)
+                for entry in state.log.entries(state.last_applied + 1, count):
+                    state.kv.apply(entry.data, entry.index)
+                    state.last_applied = entry.index
+
+
+def propose(state: FastAPIState, payload: bytes) -> int:
+    """
+    Append a command to the log of the leader and replicate it right away.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+    payload : bytes
+        encoded command
+
+    Returns
+    -------
+    int
+        log index of the command, applied once `last_applied` reaches it
+
+    Raises
+    ------
+    NotLeaderException
+        when this node is not the leader
+    ServiceUnavailableException
+        when too many entries are not committed yet, or leadership is handed
+        over to a follower
+    """
+    require_leader(state)
+    if clock(state) < getattr(state, "transfer_until", 0.0):
+        # the target catches up with a log that does not grow meanwhile
+        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+        raise ServiceUnavailableException(  # type: ignore
+            message="Leadership transfer in progress, retry.",
+            details={"leader": getattr(state, "transfer_target", None)},
+        )
+    admission = getattr(state, "admission", None)
+    if admission is not None:
+        # followers do not keep up, do not let the log run away from them
+        admission.check_uncommitted(state.log.last_index - state.commit_index)
+    index = state.log.append(current_status(state).term, [payload])
+    state.replicate.set()
+    return index
+
+
+def require_log_up_to_date(state: FastAPIState, message: RaftMessageSchema) -> None:
+    """
+    Make sure the log of a candidate is at least as up-to-date as ours, so a
+    leader never lacks committed entries.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+    message : RaftMessageSchema
+        vote or pre-vote request of the candidate
+
+    Raises
+    ------
+    BadRequestException
+        when the log of the candidate is behind
+    """
+    log = getattr(state, "log", None)
+    if log is None:
+        return
+    if (message.last_log_term, message.last_log_index) < (
+        log.last_term,
+        log.last_index,
+    ):
+        logger.info("reject vote for %s, log is outdated", message.sender)
+        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+        raise BadRequestException(message=f"Log of {message.sender} is outdated.")  # type: ignore
+
+
+def check_quorum(state: FastAPIState) -> None:
+    """
+    Step down if a majority of followers did not answer within an election
+    timeout, since they probably elected a new leader already.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+
+    Raises
+    ------
+    RaftStateException
+        when leadership needs to be ended
+    """
+    since = clock(state) - state.election_timer.lower
+    if state.leader_since > since:
+        return  # give followers one election timeout after becoming leader
+    active = 1 + sum(1 for ack in state.last_ack.values() if ack > since)
+    if active <= len(state.replicas) // 2:
+        logger.info("lost contact to majority of followers, stepping down")
+        state.leader = None
+        reset_leader(state)
+        raise RaftStateException()  # end leadership
+
+
+def require_leader(state: FastAPIState) -> None:
+    """
+    Make sure this node is the leader before changing replicated state.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+
+    Raises
+    ------
+    NotLeaderException
+        when this node is not the leader, with the known leader as detail
+    """
+    if state.state is not State.LEADER:
+        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+        raise NotLeaderException(details={"leader": state.leader})  # type: ignore
+
+
+def transfer_leadership(state: FastAPIState, target: Optional[str] = None) -> str:
+    """
+    Hand leadership over to a follower without waiting for an election timeout.
+
+    New proposals are rejected while the target is sent the missing entries
+    until it matches the last entry of the log, within an election timeout.
+    Only then it is told to start an election immediately (TimeoutNow), so its
+    log is up to date and it wins in one round. Its higher term makes this
+    node step down on the next heartbeat.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+    target : Optional[str], optional
+        follower to become the new leader, by default the follower with the
+        most entries
+
+    Returns
+    -------
+    str
+        name of the follower that starts the election
+
+    Raises
+    ------
+    NotLeaderException
+        when this node is not the leader
+    BadRequestException
+        when the target is unknown
+    ServiceUnavailableException
+        when the target did not catch up in time or could not be reached
+    """
+    require_leader(state)
+    if target is None:
+        target = max(state.match_index, key=state.match_index.get, default=None)
+    if target not in state.replicas:
+        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+        raise BadRequestException(message=f"Node {target} unknown.")  # type: ignore
+
+    deadline = clock(state) + state.election_timer.lower
+    state.transfer_target, state.transfer_until = target, deadline
+    try:
+        catch_up(state, target, deadline)
+        response = transport(state).post(
+            f"http://{target}/api/v1/raft/timeout-now",
+            json=heartbeat_message(state),
+            timeout=0.5,
+        )
         if response.status_code != HTTPStatus.OK:
-            logger.info("leader got newer term, resetting")
-            if state.term < response_data["error"]["term"]:
-                term_reset(state, response_data["error"]["term"])
+            raise requests.RequestException(f"timeout-now: {response.status_code}")
+    except requests.RequestException as error:
+        state.transfer_until = 0.0  # accept proposals again
+        logger.info("leadership transfer to %s failed: %s", target, str(error))
+        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+        raise ServiceUnavailableException(  # type: ignore
+            message=f"Leadership transfer to {target} failed."
+        ) from error
+    # proposals stay rejected until the target won, or gave up
+    state.transfer_until = clock(state) + state.election_timer.lower
+    logger.info("transferred leadership to %s", target)
+    return target
+
+
+def catch_up(state: FastAPIState, target: str, deadline: float) -> None:
+    """
+    Send entries to a follower until it matches the last entry of the log.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+    target : str
+        follower to send to
+    deadline : float
+        time to give up, see `clock`
+
+    Raises
+    ------
+    NotLeaderException
+        when this node stepped down meanwhile
+    requests.RequestException
+        when the follower did not catch up before `deadline`
+    """
+    while state.match_index.get(target, 0) < state.log.last_index:
+        require_leader(state)
+        if clock(state) > deadline:
+            raise requests.Timeout(f"{target} did not catch up.")
+        matched = state.match_index.get(target, 0)
+        # resend entries not acknowledged yet, e.g. ones in flight
+        state.next_index[target] = min(state.next_index[target], matched + 1)
+        try:
+            append_to_follower(state, target, heartbeat_message(state), clock(state))
+        except RaftStateException as error:  # the target knows a newer term
+            require_leader(state)
+            raise requests.RequestException(f"{target} is in a newer term.") from error
+        if state.match_index.get(target, 0) == matched:
+            sleep(state, min(state.pacer.interval, max(0.0, deadline - clock(state))))
 
 
 def reset_candidate(state: FastAPIState) -> None:
@@ -211,8 +1314,9 @@ def reset_candidate(state: FastAPIState) -> None:
     # stop running election
     if state.candidature.is_alive():
         state.candidature.stop()
-    state.ping_time = datetime.datetime.utcnow()
+    state.election_timer.reset()
     state.state = State.FOLLOWER  # now we are only a follower
+    status_changed(state)
 
 
 def reset_leader(state: FastAPIState) -> None:
@@ -227,7 +1331,7 @@ def reset_leader(state: FastAPIState) -> None:
     if state.executor.is_alive():
         state.executor.stop()  # stop leadership
     state.state = State.FOLLOWER
-    state.executor = FollowerExecutorThread(args=(state,))
+    state.executor = executor_for(state, State.FOLLOWER)
     state.executor.start()  # start becoming a follower
 
 
@@ -248,10 +1352,13 @@ def term_reset(
     current_role : State
         the role, this reset was triggered in
     """
-    logger.debug("resetting current term: %s", state.term)
+    logger.debug("resetting current term: %s", state.term, extra=SAMPLED)
     if next_term > state.term:
         logger.debug("term update: %s -> %s", state.term, next_term)
         state.term = next_term
+        state.vote = None  # no vote cast in the new term yet
+        state.election_timer.rearm()  # fresh random timeout per term
+        status_changed(state)
     if current_role is State.CANDIDATE:
         reset_candidate(state)
     elif current_role is State.LEADER:
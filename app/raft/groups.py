@@ -0,0 +1,219 @@
+"""Multiple independent Raft groups in one node process.
+
+Every group is a state object of its own with term, role, leader, election
+timer and lease table. The default group is the app state itself, further
+groups are configured with `RAFT_GROUPS`. Heartbeats of all groups a node
+leads are coalesced into one request per peer.
+
+"""
+
+import concurrent.futures
+import logging
+import threading
+import zlib
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import requests
+from fastapi.applications import State as FastAPIState
+from starlette.requests import Request
+
+from app.api.exceptions import NotFoundException
+from app.raft.tracing import CLIENT, NO_TRACER, SpanContext, Tracer, current_context
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+DEFAULT_GROUP = "default"
+
+
+def resolve_group(node_state: FastAPIState, name: Optional[str]) -> FastAPIState:
+    """
+    Return the state object of a Raft group.
+
+    Parameters
+    ----------
+    node_state : FastAPIState
+        app state, also the state of the default group
+    name : Optional[str]
+        name of the group, None for the default group
+
+    Returns
+    -------
+    FastAPIState
+        state of the group
+
+    Raises
+    ------
+    NotFoundException
+        when the group is not configured on this node
+    """
+    group = node_state.groups.get(name or DEFAULT_GROUP)
+    if group is None:
+        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+        raise NotFoundException(message=f"Raft group {name} unknown.")  # type: ignore
+    return group
+
+
+def group_for_key(node_state: FastAPIState, key: str) -> FastAPIState:
+    """
+    Return the state of the Raft group responsible for `key`.
+
+    Keys are distributed over the groups by a CRC32 hash, so every node maps a
+    key to the same group as long as all nodes run the same groups.
+
+    Parameters
+    ----------
+    node_state : FastAPIState
+        app state, also the state of the default group
+    key : str
+        key to look up, e.g. a lock name
+
+    Returns
+    -------
+    FastAPIState
+        state of the group
+    """
+    names = sorted(node_state.groups)
+    return node_state.groups[names[zlib.crc32(key.encode()) % len(names)]]
+
+
+def bind_request(request: Request, state: FastAPIState) -> FastAPIState:
+    """
+    Remember the group a request is handled in, so error responses carry the
+    term of that group.
+
+    Parameters
+    ----------
+    request : Request
+        The Starlette/FastAPI request object.
+    state : FastAPIState
+        state of the group
+
+    Returns
+    -------
+    FastAPIState
+        the same state, for chaining
+    """
+    request.state.raft = state
+    return state
+
+
+class GroupResponse(NamedTuple):
+    """Response of a peer to the message of a single group in a batch."""
+
+    status_code: int
+    body: Dict[str, Any]
+
+    def json(self) -> Dict[str, Any]:
+        """Return the response body, like `requests.Response.json`."""
+        return self.body
+
+
+class HeartbeatCoalescer:
+    """
+    Sends heartbeats of all groups to the same peer in one request.
+
+    A heartbeat waits up to `linger` seconds for heartbeats of other groups to
+    the same peer. A single heartbeat is sent to `/api/v1/raft/log` as before,
+    several are sent to `/api/v1/raft/log/batch`.
+
+    Parameters
+    ----------
+    linger : float
+        seconds to wait for heartbeats of other groups
+    timeout : float
+        request timeout in seconds
+    tracer : Optional[Tracer], optional
+        records a span per request, child of the span sending the first
+        heartbeat and linked to the others, by default not recorded
+    """
+
+    def __init__(
+        self, linger: float, timeout: float = 0.5, tracer: Optional[Tracer] = None
+    ):
+        self.linger = linger
+        self.timeout = timeout
+        self.tracer = tracer or NO_TRACER
+        self._lock = threading.Lock()
+        self._pending: Dict[str, List[Tuple[dict, concurrent.futures.Future]]] = {}
+        self._contexts: Dict[str, List[SpanContext]] = {}  # of the senders
+
+    def send(self, replica: str, message: dict) -> GroupResponse:
+        """
+        Send the heartbeat of one group and wait for the answer of the peer.
+
+        Parameters
+        ----------
+        replica : str
+            peer to send to
+        message : dict
+            JSON-serializable RaftMessageSchema
+
+        Returns
+        -------
+        GroupResponse
+            status code and body of the answer for this group
+
+        Raises
+        ------
+        requests.RequestException
+            when the peer could not be reached
+        """
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        context = current_context()
+        with self._lock:
+            batch = self._pending.setdefault(replica, [])
+            batch.append((message, future))
+            first = len(batch) == 1
+            if context is not None:
+                self._contexts.setdefault(replica, []).append(context)
+        if first:
+            flush = threading.Timer(self.linger, self._flush, args=(replica,))
+            flush.daemon = True
+            flush.start()
+        try:
+            return future.result(timeout=self.linger + self.timeout + 0.1)
+        except concurrent.futures.TimeoutError as error:
+            raise requests.Timeout(str(error)) from error
+
+    def _flush(self, replica: str) -> None:
+        """Send all pending heartbeats to `replica`."""
+        with self._lock:
+            batch = self._pending.pop(replica, [])
+            contexts = self._contexts.pop(replica, [])
+        endpoint = "log" if len(batch) == 1 else "log/batch"
+        span = self.tracer.span(
+            f"POST /{endpoint}",
+            CLIENT,
+            parent=contexts[0] if contexts else None,
+            links=contexts[1:],
+            peer=replica,
+            groups=len(batch),
+        )
+        try:
+            with span:
+                if len(batch) == 1:
+                    response = requests.post(
+                        f"http://{replica}/api/v1/raft/log",
+                        json=batch[0][0],
+                        timeout=self.timeout,
+                        headers=span.headers,
+                    )
+                    results = [GroupResponse(response.status_code, response.json())]
+                else:
+                    response = requests.post(
+                        f"http://{replica}/api/v1/raft/log/batch",
+                        json={"messages": [message for message, _ in batch]},
+                        timeout=self.timeout,
+                        headers=span.headers,
+                    )
+                    response.raise_for_status()
+                    results = [
+                        GroupResponse(item["status_code"], item)
+                        for item in response.json()["data"]
+                    ]
+        except (requests.RequestException, ValueError, KeyError) as error:
+            for _, future in batch:
+                future.set_exception(requests.RequestException(str(error)))
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,148 @@
+"""Key-value store replicated through the Raft log.
+
+Writes are proposed to the leader, appended to its log and applied on every
+node once committed. Reads are answered from the local copy, so they may lag
+behind the leader. Writes of a client session apply once, see
+`app.raft.sessions`.
+
+"""
+import json
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from app.raft.sessions import SessionTable
+
+
+class KeyValueStore:
+    """
+    State machine applying committed log entries.
+
+    Parameters
+    ----------
+    on_change : Optional[Callable[[str, Optional[str]], None]], optional
+        called with key and new value on every change, value None if deleted
+    sessions : Optional[SessionTable], optional
+        last write per client session, by default a table with default limits
+    """
+
+    SET = "set"
+    DELETE = "delete"
+    NOOP = "noop"
+
+    def __init__(
+        self,
+        on_change: Optional[Callable[[str, Optional[str]], None]] = None,
+        sessions: Optional[SessionTable] = None,
+    ):
+        self._on_change = on_change
+        self.sessions = sessions if sessions is not None else SessionTable()
+        self._lock = threading.Lock()
+        self._data: Dict[str, str] = {}
+
+    @classmethod
+    def command(
+        cls,
+        op: str,
+        key: Optional[str] = None,
+        value: Any = None,
+        session: Optional[str] = None,
+        sequence: Optional[int] = None,
+        timestamp: Optional[float] = None,
+    ) -> bytes:
+        """
+        Encode a command as log entry payload.
+
+        Parameters
+        ----------
+        op : str
+            SET, DELETE or NOOP
+        key : Optional[str], optional
+            key to change
+        value : Any, optional
+            new value for SET
+        session : Optional[str], optional
+            client session of the write, by default none
+        sequence : Optional[int], optional
+            sequence number of the write in the session
+        timestamp : Optional[float], optional
+            time of the leader, evicts idle sessions
+
+        Returns
+        -------
+        bytes
+            the payload
+        """
+        command = {"op": op, "key": key, "value": value}
+        if session is not None:
+            command.update(session=session, sequence=sequence, time=timestamp)
+        return json.dumps(command, separators=(",", ":")).encode()
+
+    def apply(self, data: bytes, index: int = 0) -> None:
+        """
+        Apply a committed log entry.
+
+        Parameters
+        ----------
+        data : bytes
+            payload created by `command`
+        index : int, optional
+            log index of the entry, recorded for its client session
+        """
+        command = json.loads(data)
+        if command.get("session") is not None and not self.sessions.record(
+            command["session"], command["sequence"], index, command["time"]
+        ):
+            return  # retry of a write applied before
+        key = command["key"]
+        with self._lock:
+            if command["op"] == self.SET:
+                self._data[key] = command["value"]
+            elif command["op"] == self.DELETE:
+                self._data.pop(key, None)
+            else:
+                return
+        if self._on_change is not None:
+            self._on_change(
+                key, command["value"] if command["op"] == self.SET else None
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Return the value of `key`.
+
+        Parameters
+        ----------
+        key : str
+            key to look up
+
+        Returns
+        -------
+        Optional[str]
+            the value, None if the key does not exist
+        """
+        with self._lock:
+            return self._data.get(key)
+
+    def snapshot(self) -> Dict[str, str]:
+        """
+        Return a copy of all keys and values.
+
+        Returns
+        -------
+        Dict[str, str]
+            values by key
+        """
+        with self._lock:
+            return dict(self._data)
+
+    def restore(self, data: Dict[str, str]) -> None:
+        """
+        Replace all keys and values, without calling `on_change`.
+
+        Parameters
+        ----------
+        data : Dict[str, str]
+            values by key, e.g. a `snapshot` of another store
+        """
+        with self._lock:
+            self._data = dict(data)
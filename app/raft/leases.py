@@ -0,0 +1,321 @@
+"""Named locks with a time to live, granted by the leader.
+
+The leader keeps all leases in memory and expires them from a heap ordered by
+deadline. Followers receive a snapshot of the table with every heartbeat, so
+any node can answer who holds a lock, and a new leader continues with the
+leases of its predecessor.
+
+"""
+import heapq
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from app.api.exceptions import ConflictException, NotFoundException
+
+
+class Lease(NamedTuple):
+    """A lock held by `owner` until `deadline` on the monotonic clock."""
+
+    name: str
+    owner: str
+    lease_id: str
+    ttl: float
+    deadline: float
+    revision: int
+
+
+class LeaseTable:
+    """
+    In-memory table of leases, expired in deadline order.
+
+    Every change increases the table revision. The revision of the last change
+    of every lock name is kept, so watchers can wait for changes after a given
+    revision.
+
+    Parameters
+    ----------
+    clock : Callable[[], float], optional
+        monotonic clock in seconds, by default `time.monotonic`
+    on_change : Optional[Callable[[str, Optional[Lease]], None]], optional
+        called with name and current lease on every change of a lock
+    """
+
+    def __init__(
+        self,
+        clock: Callable[[], float] = time.monotonic,
+        on_change: Optional[Callable[[str, Optional[Lease]], None]] = None,
+    ):
+        self._clock = clock
+        self._on_change = on_change
+        self._lock = threading.Lock()
+        self._leases: Dict[str, Lease] = {}
+        self._heap: List[Tuple[float, str, str]] = []
+        self._revisions: Dict[str, int] = {}
+        self.revision = 0
+
+    def acquire(self, name: str, owner: str, ttl: float) -> Lease:
+        """
+        Acquire the lock `name` for `ttl` seconds.
+
+        Acquiring a lock held by the same owner renews it.
+
+        Parameters
+        ----------
+        name : str
+            name of the lock
+        owner : str
+            client that wants to hold the lock
+        ttl : float
+            time to live in seconds
+
+        Returns
+        -------
+        Lease
+            the granted lease
+
+        Raises
+        ------
+        ConflictException
+            when the lock is held by another owner
+        """
+        with self._lock:
+            self._expire()
+            lease = self._leases.get(name)
+            if lease is not None and lease.owner != owner:
+                # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+                raise ConflictException(  # type: ignore
+                    message=f"Lock {name} is held by {lease.owner}.",
+                    details={"remaining_millis": self.remaining_millis(lease)},
+                )
+            lease_id = lease.lease_id if lease is not None else uuid.uuid4().hex
+            return self._grant(name, owner, lease_id, ttl)
+
+    def renew(self, name: str, lease_id: str) -> Lease:
+        """
+        Extend a lease by its time to live.
+
+        Parameters
+        ----------
+        name : str
+            name of the lock
+        lease_id : str
+            id of the lease returned on acquire
+
+        Returns
+        -------
+        Lease
+            the renewed lease
+
+        Raises
+        ------
+        NotFoundException
+            when the lease expired or was released
+        """
+        with self._lock:
+            lease = self._held(name, lease_id)
+            return self._grant(name, lease.owner, lease_id, lease.ttl)
+
+    def release(self, name: str, lease_id: str) -> None:
+        """
+        Release a lease before it expires.
+
+        Parameters
+        ----------
+        name : str
+            name of the lock
+        lease_id : str
+            id of the lease returned on acquire
+
+        Raises
+        ------
+        NotFoundException
+            when the lease expired or was released
+        """
+        with self._lock:
+            self._held(name, lease_id)
+            self._delete(name)
+
+    def get(self, name: str) -> Optional[Lease]:
+        """
+        Return the lease currently held on lock `name`.
+
+        Parameters
+        ----------
+        name : str
+            name of the lock
+
+        Returns
+        -------
+        Optional[Lease]
+            the lease, None if the lock is free
+        """
+        with self._lock:
+            self._expire()
+            return self._leases.get(name)
+
+    def name_revision(self, name: str) -> int:
+        """
+        Return the revision of the last change of lock `name`.
+
+        Parameters
+        ----------
+        name : str
+            name of the lock
+
+        Returns
+        -------
+        int
+            revision, 0 if the lock never changed
+        """
+        with self._lock:
+            return self._revisions.get(name, 0)
+
+    def expire(self) -> List[str]:
+        """
+        Drop all leases whose deadline has passed.
+
+        Returns
+        -------
+        List[str]
+            names of the expired locks
+        """
+        with self._lock:
+            return self._expire()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Serialize the table for replication to followers.
+
+        Deadlines are converted into remaining milliseconds, since monotonic
+        clocks of different nodes are not comparable.
+
+        Returns
+        -------
+        Dict[str, Any]
+            table revision and all leases
+        """
+        with self._lock:
+            self._expire()
+            return {
+                "revision": self.revision,
+                "leases": [
+                    {
+                        "name": lease.name,
+                        "owner": lease.owner,
+                        "lease_id": lease.lease_id,
+                        "ttl_millis": int(lease.ttl * 1000),
+                        "remaining_millis": self.remaining_millis(lease),
+                        "revision": lease.revision,
+                    }
+                    for lease in self._leases.values()
+                ],
+            }
+
+    def restore(self, snapshot: Dict[str, Any]) -> None:
+        """
+        Replace the table with a snapshot received from the leader.
+
+        Parameters
+        ----------
+        snapshot : Dict[str, Any]
+            as returned by `snapshot`
+        """
+        now = self._clock()
+        with self._lock:
+            if snapshot["revision"] == self.revision:
+                return  # nothing changed since the last heartbeat
+            leases = {
+                entry["name"]: Lease(
+                    entry["name"],
+                    entry["owner"],
+                    entry["lease_id"],
+                    entry["ttl_millis"] / 1000,
+                    now + entry["remaining_millis"] / 1000,
+                    entry["revision"],
+                )
+                for entry in snapshot["leases"]
+            }
+            changed = [
+                name
+                for name in self._leases.keys() | leases.keys()
+                if self._leases.get(name) != leases.get(name)
+            ]
+            for name in self._leases.keys() - leases.keys():
+                self._revisions[name] = snapshot["revision"]  # released or expired
+            for lease in leases.values():
+                self._revisions[lease.name] = lease.revision
+            self._leases = leases
+            self._heap = [
+                (lease.deadline, name, lease.lease_id) for name, lease in leases.items()
+            ]
+            heapq.heapify(self._heap)
+            self.revision = snapshot["revision"]
+            for name in changed:
+                self._notify(name)
+
+    def remaining_millis(self, lease: Lease) -> int:
+        """
+        Time left until `lease` expires.
+
+        Parameters
+        ----------
+        lease : Lease
+            lease to check
+
+        Returns
+        -------
+        int
+            milliseconds, 0 if already expired
+        """
+        return max(0, int((lease.deadline - self._clock()) * 1000))
+
+    def _held(self, name: str, lease_id: str) -> Lease:
+        """Return the lease `lease_id` on lock `name`. Needs `_lock`."""
+        self._expire()
+        lease = self._leases.get(name)
+        if lease is None or lease.lease_id != lease_id:
+            # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+            raise NotFoundException(message=f"Lease {lease_id} on {name} not held.")  # type: ignore
+        return lease
+
+    def _bump(self, name: str) -> int:
+        """Increase the revision on a change of `name`. Needs `_lock`."""
+        self.revision += 1
+        self._revisions[name] = self.revision
+        return self.revision
+
+    def _notify(self, name: str) -> None:
+        """Report the change of `name`. Needs `_lock`."""
+        if self._on_change is not None:
+            self._on_change(name, self._leases.get(name))
+
+    def _grant(self, name: str, owner: str, lease_id: str, ttl: float) -> Lease:
+        """Store a new or extended lease. Needs `_lock`."""
+        lease = Lease(name, owner, lease_id, ttl, self._clock() + ttl, 0)
+        lease = lease._replace(revision=self._bump(name))
+        self._leases[name] = lease
+        heapq.heappush(self._heap, (lease.deadline, name, lease_id))
+        self._notify(name)
+        return lease
+
+    def _delete(self, name: str) -> None:
+        """Remove the lease on `name`. Needs `_lock`."""
+        del self._leases[name]
+        self._bump(name)
+        self._notify(name)
+
+    def _expire(self) -> List[str]:
+        """Pop all passed deadlines from the heap. Needs `_lock`."""
+        now = self._clock()
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, name, lease_id = heapq.heappop(self._heap)
+            lease = self._leases.get(name)
+            # renewed leases leave outdated entries in the heap, skip those
+            if lease is not None and lease.lease_id == lease_id:
+                if lease.deadline == deadline:
+                    self._delete(name)
+                    expired.append(name)
+        return expired
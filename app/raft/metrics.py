@@ -0,0 +1,103 @@
+"""Counters, gauges and timings of a node.
+
+Components count events, e.g. log cache hits, in the metrics object of the
+node, shared by all of its Raft groups. The values are served by
+`GET /api/v1/admin/metrics`.
+
+"""
+import threading
+from typing import Any, Dict, List
+
+
+class Metrics:
+    """Thread-safe registry of counters, gauges and timings."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._gauges: Dict[str, float] = {}
+        self._timings: Dict[str, List[float]] = {}  # count, total, max, last
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """
+        Add to a counter, starting at 0.
+
+        Parameters
+        ----------
+        name : str
+            name of the counter
+        value : int, optional
+            amount to add, by default 1
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def gauge(self, name: str, value: float) -> None:
+        """
+        Set a gauge to its current value.
+
+        Parameters
+        ----------
+        name : str
+            name of the gauge
+        value : float
+            current value
+        """
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, seconds: float) -> None:
+        """
+        Add a duration to a timing.
+
+        Parameters
+        ----------
+        name : str
+            name of the timing
+        seconds : float
+            the duration
+        """
+        with self._lock:
+            timing = self._timings.setdefault(name, [0, 0.0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+            timing[3] = seconds
+
+    def timings(self) -> Dict[str, Dict[str, float]]:
+        """
+        Return all timings.
+
+        Returns
+        -------
+        Dict[str, Dict[str, float]]
+            by name `count`, and `mean_millis`, `max_millis` and `last_millis`
+            of the durations
+        """
+        with self._lock:
+            return {
+                name: {
+                    "count": count,
+                    "mean_millis": total / count * 1000,
+                    "max_millis": longest * 1000,
+                    "last_millis": last * 1000,
+                }
+                for name, (count, total, longest, last) in self._timings.items()
+            }
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Return all values.
+
+        Returns
+        -------
+        Dict[str, Dict[str, Any]]
+            `counters`, `gauges` and `timings`, all by name
+        """
+        timings = self.timings()
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings": timings,
+            }
@@ -0,0 +1,134 @@
+"""Adaptive heartbeat interval of the leader.
+
+The leader measures the round trip time to every follower and derives the
+heartbeat interval from the slowest one, so that a follower still receives a
+heartbeat before its election timeout if two heartbeats in a row are lost.
+On a fast network, this allows fewer heartbeats than a fixed interval.
+
+"""
+import threading
+from typing import Dict
+
+
+class HeartbeatPacer:
+    """
+    Round trip time estimator and heartbeat interval of a node.
+
+    Round trip times are smoothed per follower like TCP does for its
+    retransmission timeout (RFC 6298).
+
+    Parameters
+    ----------
+    min_interval : float
+        lower bound of the heartbeat interval in seconds
+    max_interval : float
+        upper bound of the heartbeat interval in seconds
+    initial : float
+        interval in seconds until a round trip time is measured
+    election_timeout : float
+        lower bound of the election timeout of the followers in seconds
+    alpha : float, optional
+        weight of a new sample in the smoothed round trip time, by default 1/8
+    beta : float, optional
+        weight of a new sample in the round trip time variation, by default 1/4
+    """
+
+    LOST_HEARTBEATS = 2  # lost in a row without an election
+
+    def __init__(
+        self,
+        min_interval: float,
+        max_interval: float,
+        initial: float,
+        election_timeout: float,
+        alpha: float = 0.125,
+        beta: float = 0.25,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial = initial
+        self.election_timeout = election_timeout
+        self.alpha = alpha
+        self.beta = beta
+        self._lock = threading.Lock()
+        self._srtt: Dict[str, float] = {}
+        self._rttvar: Dict[str, float] = {}
+
+    def observe(self, replica: str, rtt: float) -> None:
+        """
+        Add a round trip time sample of `replica`.
+
+        Parameters
+        ----------
+        replica : str
+            follower that answered
+        rtt : float
+            seconds between sending and the answer
+        """
+        with self._lock:
+            srtt = self._srtt.get(replica)
+            if srtt is None:
+                self._srtt[replica] = rtt
+                self._rttvar[replica] = rtt / 2
+                return
+            self._rttvar[replica] += self.beta * (
+                abs(srtt - rtt) - self._rttvar[replica]
+            )
+            self._srtt[replica] = srtt + self.alpha * (rtt - srtt)
+
+    def rto(self, replica: str) -> float:
+        """
+        Round trip time of `replica` including its variation.
+
+        Parameters
+        ----------
+        replica : str
+            follower to check
+
+        Returns
+        -------
+        float
+            seconds, 0.0 if not measured yet
+        """
+        with self._lock:
+            return self._rto(replica) if replica in self._srtt else 0.0
+
+    @property
+    def interval(self) -> float:
+        """
+        Current heartbeat interval in seconds.
+
+        The slowest follower needs to get a heartbeat within the election
+        timeout even if `LOST_HEARTBEATS` heartbeats in a row are lost.
+        """
+        with self._lock:
+            if not self._srtt:
+                return self.initial
+            rto = max(self._rto(replica) for replica in self._srtt)
+        interval = (self.election_timeout - rto) / (self.LOST_HEARTBEATS + 1)
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def due(self, last_append: float, now: float) -> bool:
+        """
+        Check if a follower needs an explicit heartbeat.
+
+        A follower that got an append entries request within the last half
+        interval is skipped, it already knows the leader is alive.
+
+        Parameters
+        ----------
+        last_append : float
+            monotonic time of the last append sent to the follower
+        now : float
+            current monotonic time
+
+        Returns
+        -------
+        bool
+            True if a heartbeat needs to be sent
+        """
+        return now - last_append >= self.interval / 2
+
+    def _rto(self, replica: str) -> float:
+        """Smoothed round trip time plus four variations. Needs `_lock`."""
+        return self._srtt[replica] + 4 * self._rttvar[replica]
@@ -0,0 +1,296 @@
+"""Where the node spends its time.
+
+* `sample_stacks` samples the stacks of all threads for a while, a CPU
+  profile without instrumenting any code.
+* `thread_dump` and `task_dump` show what the executors and the event loop
+  do right now.
+* `measure_loop_lag` measures how late callbacks of the event loop run,
+  `monitor_loop_lag` keeps doing so as timing `event_loop_lag`.
+* `SlowRoundWatchdog` logs the stack of a heartbeat round still running after
+  a threshold, while it is slow.
+
+"""
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional
+
+from app.raft.metrics import Metrics
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+def _frames(frame) -> List[str]:
+    """Functions of a stack, outermost first, as `function (file:line)`."""
+    calls = []
+    while frame is not None:
+        code = frame.f_code
+        calls.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+        frame = frame.f_back
+    return calls[::-1]
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> Dict[str, Any]:
+    """
+    Sample the stacks of all other threads every `interval` seconds.
+
+    Parameters
+    ----------
+    seconds : float
+        duration of the profile
+    interval : float, optional
+        seconds between samples, by default 0.005
+
+    Returns
+    -------
+    Dict[str, Any]
+        `samples` taken and `stacks`, the number of samples per stack in the
+        folded format of flame graph tools, `thread;outer;...;inner`
+    """
+    names = {}
+    stacks: collections.Counter = collections.Counter()
+    own = threading.get_ident()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            if ident not in names:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            thread = names.get(ident, str(ident))
+            stacks[";".join([thread, *_frames(frame)])] += 1
+        samples += 1
+        time.sleep(interval)
+    return {"samples": samples, "stacks": dict(stacks.most_common())}
+
+
+def thread_dump() -> List[Dict[str, Any]]:
+    """
+    Current stack of every thread.
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        name, ident, daemon flag and stack lines per thread
+    """
+    frames = sys._current_frames()
+    return [
+        {
+            "name": thread.name,
+            "ident": thread.ident,
+            "daemon": thread.daemon,
+            "stack": (
+                traceback.format_stack(frames[thread.ident])
+                if thread.ident in frames
+                else []
+            ),
+        }
+        for thread in threading.enumerate()
+    ]
+
+
+def task_dump() -> List[Dict[str, Any]]:
+    """
+    Current stack of every task of the running event loop.
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        name, coroutine and stack lines per task
+    """
+    return [
+        {
+            "name": task.get_name(),
+            "coroutine": repr(task.get_coro()),
+            "stack": [
+                line
+                for frame in task.get_stack()
+                for line in traceback.format_stack(frame, limit=1)
+            ],
+        }
+        for task in asyncio.all_tasks()
+    ]
+
+
+async def measure_loop_lag(seconds: float, interval: float = 0.01) -> Dict[str, float]:
+    """
+    Measure how much later than asked the running event loop wakes up.
+
+    Parameters
+    ----------
+    seconds : float
+        duration of the measurement
+    interval : float, optional
+        seconds between wake-ups, by default 0.01
+
+    Returns
+    -------
+    Dict[str, float]
+        number of `samples`, `mean_millis` and `max_millis` of the lag
+    """
+    loop = asyncio.get_running_loop()
+    lags = []
+    deadline = loop.time() + seconds
+    while loop.time() < deadline:
+        lags.append(await _loop_lag(interval))
+    return {
+        "samples": len(lags),
+        "mean_millis": sum(lags) / len(lags) * 1000 if lags else 0.0,
+        "max_millis": max(lags, default=0.0) * 1000,
+    }
+
+
+async def monitor_loop_lag(metrics: Metrics, interval: float = 0.1) -> None:
+    """
+    Record the lag of the running event loop as timing, until cancelled.
+
+    Parameters
+    ----------
+    metrics : Metrics
+        metrics of the node, the lag is recorded as `event_loop_lag`
+    interval : float, optional
+        seconds between wake-ups, by default 0.1
+    """
+    while True:
+        metrics.observe("event_loop_lag", await _loop_lag(interval))
+
+
+async def _loop_lag(interval: float) -> float:
+    """Sleep `interval` seconds, return how much later the loop woke up."""
+    loop = asyncio.get_running_loop()
+    asked = loop.time() + interval
+    await asyncio.sleep(interval)
+    return max(0.0, loop.time() - asked)
+
+
+class _Watch:
+    """Registers a round with the watchdog while it runs."""
+
+    def __init__(self, watchdog: "SlowRoundWatchdog", name: str):
+        self.watchdog = watchdog
+        self.name = name
+
+    def __enter__(self) -> "_Watch":
+        self.watchdog.started(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback_) -> None:
+        self.watchdog.finished()
+
+
+class SlowRoundWatchdog:
+    """
+    Logs the stack of a round that runs longer than `threshold` seconds.
+
+    Rounds are registered with `watch`. A daemon thread checks the running
+    rounds every half threshold and logs the stack of a slow round's thread
+    once per round, while it is still running.
+
+    Parameters
+    ----------
+    threshold : float
+        seconds after which a round is slow, 0 disables the watchdog
+    metrics : Optional[Metrics], optional
+        counts slow rounds as `slow_rounds`, by default not counted
+    """
+
+    def __init__(self, threshold: float, metrics: Optional[Metrics] = None):
+        self.threshold = threshold
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        # thread ident -> round name, start, reported
+        self._running: Dict[int, List] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, name: str):
+        """
+        Register a round for the duration of a `with` block.
+
+        Parameters
+        ----------
+        name : str
+            round, e.g. `heartbeat round default`
+
+        Returns
+        -------
+        context manager, a no-op if the watchdog is disabled
+        """
+        if not self.threshold:
+            return _NO_WATCH
+        return _Watch(self, name)
+
+    def started(self, name: str) -> None:
+        """A round started in the calling thread."""
+        with self._lock:
+            self._running[threading.get_ident()] = [name, time.monotonic(), False]
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="SlowRoundWatchdog", daemon=True
+                )
+                self._thread.start()
+
+    def finished(self) -> None:
+        """The round of the calling thread finished."""
+        with self._lock:
+            name, start, reported = self._running.pop(threading.get_ident())
+        if reported:
+            logger.warning(
+                "%s finished after %.0f ms", name, (time.monotonic() - start) * 1000
+            )
+
+    def check(self) -> int:
+        """
+        Log the stacks of rounds that became slow since the last check.
+
+        Returns
+        -------
+        int
+            number of rounds reported
+        """
+        now = time.monotonic()
+        with self._lock:
+            slow = [
+                (ident, running)
+                for ident, running in self._running.items()
+                if not running[2] and now - running[1] >= self.threshold
+            ]
+            for _, running in slow:
+                running[2] = True
+        frames = sys._current_frames()
+        for ident, (name, start, _) in slow:
+            stack = (
+                "".join(traceback.format_stack(frames[ident]))
+                if ident in frames
+                else ""
+            )
+            logger.warning(
+                "%s running for %.0f ms, stack:\n%s", name, (now - start) * 1000, stack
+            )
+            if self.metrics is not None:
+                self.metrics.increment("slow_rounds")
+        return len(slow)
+
+    def _run(self) -> None:
+        """Check the running rounds forever."""
+        while True:
+            time.sleep(self.threshold / 2)
+            self.check()
+
+
+class _NoWatch:
+    """Stands in for a watch while the watchdog is disabled."""
+
+    def __enter__(self) -> "_NoWatch":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback_) -> None:
+        pass
+
+
+_NO_WATCH = _NoWatch()
+NO_WATCHDOG = SlowRoundWatchdog(0.0)
@@ -0,0 +1,118 @@
+"""Push status changes of this node to the monitor.
+
+Instead of waiting to be polled, a node can report every transition of its
+role, term or leader to the monitor as it happens. Transitions are queued,
+coalesced and sent in batches by a background thread, so the Raft loop never
+waits on the monitor. While nothing changes, the current status is resent
+every `keepalive` seconds, so the monitor notices a node that stopped pushing.
+
+"""
+
+import collections
+import logging
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import requests
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class StatusReporterThread(threading.Thread):
+    """
+    Sends queued status events to the monitor ingest endpoint in batches.
+
+    Events that do not change role, term or leader compared to the previously
+    queued event are coalesced. If the monitor is unreachable, the oldest
+    events are dropped once `max_pending` is reached. Set `source` to a
+    callable returning the current status to send keepalives.
+    """
+
+    def __init__(
+        self,
+        monitor_url: str,
+        interval: float,
+        max_pending: int = 1000,
+        keepalive: float = 1.0,
+        **kwargs,
+    ):
+        super().__init__(daemon=True, **kwargs)
+        self.url = f"{monitor_url.rstrip('/')}/ingest"
+        self.interval = interval
+        self.keepalive = keepalive
+        self.source: Optional[Callable[[], Dict[str, Any]]] = None
+        self._sent = time.monotonic()  # of the last batch
+        self._pending: Deque[Dict[str, Any]] = collections.deque(maxlen=max_pending)
+        self._last: Dict[str, Any] | None = None
+        self._lock = threading.Lock()
+        self._stop_evt = threading.Event()
+
+    def report(self, event: Dict[str, Any]) -> None:
+        """
+        Queue a status event for the next batch.
+
+        Parameters
+        ----------
+        event : Dict[str, Any]
+            status of this node, needs a `timestamp` key
+        """
+        key = {k: v for k, v in event.items() if k not in ("timestamp", "commit_index")}
+        with self._lock:
+            if key == self._last:
+                return  # role, term and leader did not change, coalesce
+            self._last = key
+            self._pending.append(event)
+
+    def stop(self) -> None:
+        """Stop sending batches after the current one."""
+        self._stop_evt.set()
+
+    def run(self) -> None:
+        while not self._stop_evt.wait(timeout=self.interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """Send all pending events in one batch, requeue them on error."""
+        with self._lock:
+            batch: List[Dict[str, Any]] = list(self._pending)
+            self._pending.clear()
+        if not batch:
+            if self.source is None or time.monotonic() - self._sent < self.keepalive:
+                return
+            batch = [self.source()]  # still alive, nothing changed
+        self._sent = time.monotonic()
+        try:
+            requests.post(self.url, json={"events": batch}, timeout=0.5)
+        except requests.RequestException as error:
+            logger.info("could not push status to monitor: %s", str(error))
+            with self._lock:
+                # newest events win if the queue overflows
+                self._pending = collections.deque(
+                    batch + list(self._pending), maxlen=self._pending.maxlen
+                )
+
+
+def status_event(state) -> Dict[str, Any]:
+    """
+    Build a status event from the state object.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+
+    Returns
+    -------
+    Dict[str, Any]
+        role, term, leader and commit index of this node with a unix timestamp
+    """
+    return {
+        "app_name": state.app_name.split(".", maxsplit=1)[0],
+        "id": state.id,
+        "state": state.state.value,
+        "term": state.term,
+        "leader": state.leader,
+        "commit_index": getattr(state, "commit_index", 0),
+        "timestamp": time.time(),
+    }
@@ -0,0 +1,164 @@
+"""Supervised execution of the leader / follower payload scripts."""
+import collections
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+from typing import Any, Deque, Dict, List, NamedTuple, Optional
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class ScriptResult(NamedTuple):
+    """Outcome of a single payload script run."""
+
+    role: str
+    script: str
+    pid: int
+    started: float
+    duration: float
+    exit_code: Optional[int]
+    timed_out: bool
+    cancelled: bool
+
+
+class _ScriptRun:
+    """A running payload script and its supervision flags."""
+
+    def __init__(self, role: str, script: str, process: subprocess.Popen):
+        self.role = role
+        self.script = script
+        self.process = process
+        self.started = time.time()
+        self.started_monotonic = time.monotonic()
+        self.timed_out = False
+        self.cancelled = False
+
+
+class ScriptRunner:
+    """
+    Runs the payload script of the current role without blocking the Raft loop.
+
+    Every script runs in its own process group and is supervised by a daemon
+    thread, which reaps the process, kills it after `timeout` seconds and
+    records exit code and duration. Starting the script of a new role cancels
+    the script of the previous role first.
+
+    Parameters
+    ----------
+    timeout : float
+        seconds after which a script is terminated
+    grace : float, optional
+        seconds between SIGTERM and SIGKILL, by default 1.0
+    max_results : int, optional
+        number of results to keep, by default 100
+    """
+
+    def __init__(self, timeout: float, grace: float = 1.0, max_results: int = 100):
+        self.timeout = timeout
+        self.grace = grace
+        self._lock = threading.Lock()
+        self._current: Optional[_ScriptRun] = None
+        self._results: Deque[ScriptResult] = collections.deque(maxlen=max_results)
+
+    def run(self, role: str, script: Optional[str]) -> None:
+        """
+        Cancel the script of the previous role and start `script` in background.
+
+        Parameters
+        ----------
+        role : str
+            role the script is run for
+        script : Optional[str]
+            path of the shell script, nothing is started if unset
+        """
+        with self._lock:
+            if self._current is not None:
+                self._cancel(self._current)
+                self._current = None
+            if not script:
+                return
+            try:
+                process = subprocess.Popen(  # nosec (bandit: configured by operator)
+                    ["/bin/sh", script], start_new_session=True
+                )
+            except OSError as error:
+                logger.warning("could not start %s script: %s", role, str(error))
+                return
+            script_run = _ScriptRun(role, script, process)
+            self._current = script_run
+        threading.Thread(
+            target=self._supervise, args=(script_run,), daemon=True
+        ).start()
+
+    def results(self) -> List[Dict[str, Any]]:
+        """
+        Return the results of the last script runs.
+
+        Returns
+        -------
+        List[Dict[str, Any]]
+            script results, oldest first
+        """
+        with self._lock:
+            return [result._asdict() for result in self._results]
+
+    def _cancel(self, script_run: _ScriptRun) -> None:
+        """Terminate a script that is still running, kill it after `grace`."""
+        if script_run.process.poll() is not None:
+            return
+        script_run.cancelled = True
+        self._signal(script_run.process, signal.SIGTERM)
+        killer = threading.Timer(
+            self.grace, self._signal, args=(script_run.process, signal.SIGKILL)
+        )
+        killer.daemon = True
+        killer.start()
+
+    @staticmethod
+    def _signal(process: subprocess.Popen, signum: int) -> None:
+        """Send `signum` to the process group of a still running script."""
+        if process.poll() is not None:
+            return
+        try:
+            os.killpg(process.pid, signum)
+        except ProcessLookupError:
+            pass  # exited in between
+
+    def _supervise(self, script_run: _ScriptRun) -> None:
+        """Wait for the script to exit or time out and record its result."""
+        process = script_run.process
+        try:
+            process.wait(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            script_run.timed_out = True
+            self._signal(process, signal.SIGTERM)
+            try:
+                process.wait(timeout=self.grace)
+            except subprocess.TimeoutExpired:
+                self._signal(process, signal.SIGKILL)
+                process.wait()
+        result = ScriptResult(
+            role=script_run.role,
+            script=script_run.script,
+            pid=process.pid,
+            started=script_run.started,
+            duration=time.monotonic() - script_run.started_monotonic,
+            exit_code=process.returncode,
+            timed_out=script_run.timed_out,
+            cancelled=script_run.cancelled,
+        )
+        with self._lock:
+            self._results.append(result)
+            if self._current is script_run:
+                self._current = None
+        log = logger.info if process.returncode == 0 else logger.warning
+        log(
+            "%s script %s exited with %s after %.3fs",
+            script_run.role,
+            script_run.script,
+            process.returncode,
+            result.duration,
+        )
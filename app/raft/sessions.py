@@ -0,0 +1,117 @@
+"""Client sessions making retried writes apply once.
+
+A client sends every write with its session id and a sequence number that
+grows by one per write and stays the same on retries. When a write is
+applied, the key-value store records the sequence number and the log index
+of the write per session. A retry of an applied write, e.g. after a leader
+change, is answered with the recorded index, or skipped when applied if it
+was appended to the log twice.
+
+The table is part of the replicated state: it only changes when entries are
+applied, and its eviction uses the time the leader stamped into the entry, so
+every node evicts the same sessions and rebuilds the same table from the log.
+Sessions are evicted least recently used first when there are more than
+`max_sessions`, and when idle for `ttl` seconds. A retry of an evicted
+session is applied again.
+
+"""
+import collections
+import threading
+from typing import List, Optional
+
+from app.api.exceptions import ConflictException
+
+
+class SessionTable:
+    """
+    Last applied write per client session.
+
+    Parameters
+    ----------
+    max_sessions : int, optional
+        sessions kept, least recently used ones are evicted, by default 10000
+    ttl : float, optional
+        seconds of leader time after which an idle session is evicted, by
+        default one hour
+    """
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 3600.0):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # session -> last sequence, its log index, leader time, least recent first
+        self._sessions: collections.OrderedDict = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def lookup(self, session: str, sequence: int) -> Optional[int]:
+        """
+        Find the log index of a write applied before.
+
+        Parameters
+        ----------
+        session : str
+            session id of the client
+        sequence : int
+            sequence number of the write
+
+        Returns
+        -------
+        Optional[int]
+            log index of the write, None if it was not applied yet
+
+        Raises
+        ------
+        ConflictException
+            when the session applied a later write already, the result of
+            this one is not kept
+        """
+        with self._lock:
+            last: Optional[List] = self._sessions.get(session)
+        if last is None or sequence > last[0]:
+            return None
+        if sequence == last[0]:
+            return last[1]
+        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+        raise ConflictException(  # type: ignore
+            message=f"Write {sequence} of session {session} superseded.",
+            details={"sequence": last[0]},
+        )
+
+    def record(self, session: str, sequence: int, index: int, now: float) -> bool:
+        """
+        Record a write being applied, unless it was applied before.
+
+        Parameters
+        ----------
+        session : str
+            session id of the client
+        sequence : int
+            sequence number of the write
+        index : int
+            log index of the write
+        now : float
+            time the leader stamped into the write, in seconds
+
+        Returns
+        -------
+        bool
+            False if the write is a duplicate and must not be applied
+        """
+        with self._lock:
+            last = self._sessions.get(session)
+            if last is not None:
+                self._sessions.move_to_end(session)
+                if sequence <= last[0]:
+                    return False
+            self._sessions[session] = [sequence, index, now]
+            self._sessions.move_to_end(session)
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if len(self._sessions) <= self.max_sessions and (
+                    oldest[2] >= now - self.ttl
+                ):
+                    break
+                self._sessions.popitem(last=False)
+        return True
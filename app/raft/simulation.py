@@ -0,0 +1,755 @@
+"""Deterministic simulation of a Raft cluster.
+
+All nodes of a cluster run in one thread on a virtual clock. They run the Raft
+code of the service, only its executor threads, its clock and its HTTP client
+are replaced (`state.executors`, `state.clock`, `state.sleep` and
+`state.transport`). The simulated network delays, drops and partitions
+messages, and delivers some of them late, after newer ones. Nodes crash and restart from their write-ahead
+log. All randomness is drawn from one seed, so a failing run is replayed
+exactly with the same seed.
+
+After every event the safety properties of Raft are checked:
+
+* election safety: at most one leader per term
+* leader completeness: a new leader holds all committed entries
+* log matching: logs with an entry of the same index and term are identical
+  up to that entry
+* state machine safety: a committed entry is never lost or replaced
+
+`python -m app.raft.simulation --seeds 100` simulates 100 clusters and prints
+the seeds of the failing runs.
+
+"""
+
+import argparse
+import functools
+import heapq
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+import requests
+from fastapi.applications import State as FastAPIState
+
+from app.api.exceptions import ApiException
+from app.api.v1.models import RaftMessageSchema, RaftStateException
+from app.raft import functions
+from app.raft.functions import State
+from app.raft.groups import DEFAULT_GROUP
+from app.raft.kv import KeyValueStore
+from app.raft.leases import LeaseTable
+from app.raft.pacing import HeartbeatPacer
+from app.raft.scripts import ScriptRunner
+from app.raft.status import current_status
+from app.raft.storage import WriteAheadLog, decode_records
+from app.raft.timer import ElectionTimer
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class InvariantViolation(AssertionError):
+    """Raised when the simulated cluster breaks a safety property of Raft."""
+
+
+class VirtualClock:
+    """Monotonic clock that only moves when the simulation advances it."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        """
+        Let time pass, e.g. while a request is on the network.
+
+        Parameters
+        ----------
+        seconds : float
+            time to pass
+        """
+        self.now += seconds
+
+
+class SimulatedResponse(NamedTuple):
+    """Answer of a simulated node, like `requests.Response`."""
+
+    status_code: int
+    body: Dict[str, Any]
+
+    def json(self) -> Dict[str, Any]:
+        """Return the response body, like `requests.Response.json`."""
+        return self.body
+
+
+class SimulatedNetwork:
+    """
+    Delivers requests between the nodes of a simulation.
+
+    A request is answered right away, after a random latency. It may be
+    dropped, or delivered late while the sender runs into its timeout, so it
+    arrives after newer requests. Nodes on different sides of a partition can
+    not reach each other.
+
+    Parameters
+    ----------
+    simulation : Simulation
+        the simulation delivering late requests and holding the nodes
+    latency : float, optional
+        mean one-way latency in seconds, by default 2 ms
+    drop : float, optional
+        probability that a request is lost, by default 0.02
+    late : float, optional
+        probability that a request is delivered late, by default 0.02
+    max_late : float, optional
+        maximum delay of a late request in seconds, by default 2.0
+    """
+
+    def __init__(
+        self,
+        simulation: "Simulation",
+        latency: float = 0.002,
+        drop: float = 0.02,
+        late: float = 0.02,
+        max_late: float = 2.0,
+    ):
+        self.simulation = simulation
+        self.latency = latency
+        self.drop = drop
+        self.late = late
+        self.max_late = max_late
+        self.sides: Dict[str, int] = {}  # partition side of a node, 0 if unset
+
+    def partition(self, sides: Dict[str, int]) -> None:
+        """
+        Split the network, only nodes on the same side reach each other.
+
+        Parameters
+        ----------
+        sides : Dict[str, int]
+            side of every node
+        """
+        self.sides = dict(sides)
+
+    def heal(self) -> None:
+        """Remove the partition."""
+        self.sides = {}
+
+    def connected(self, sender: str, target: str) -> bool:
+        """
+        Check if `sender` can reach `target`.
+
+        Parameters
+        ----------
+        sender : str
+            sending node
+        target : str
+            receiving node
+
+        Returns
+        -------
+        bool
+            True if both are on the same side of the partition and `target` runs
+        """
+        return (
+            self.sides.get(sender, 0) == self.sides.get(target, 0)
+            and self.simulation.nodes.get(target) is not None
+        )
+
+    def send(
+        self,
+        sender: str,
+        url: str,
+        json: Optional[dict] = None,
+        params: Optional[dict] = None,
+        data: Any = None,
+        timeout: float = 0.5,
+        **_,
+    ) -> SimulatedResponse:
+        """
+        Send a request of `sender`, like `requests.post`.
+
+        Parameters
+        ----------
+        sender : str
+            sending node
+        url : str
+            `http://<node>/api/v1/raft/<endpoint>`
+        json : Optional[dict], optional
+            message body
+        params : Optional[dict], optional
+            query parameters
+        data : Any, optional
+            raw body
+        timeout : float, optional
+            time the sender waits for an answer
+
+        Returns
+        -------
+        SimulatedResponse
+            the answer
+
+        Raises
+        ------
+        requests.RequestException
+            when the request or its answer was lost
+        """
+        simulation = self.simulation
+        target, endpoint = url[len("http://") :].split("/api/v1/raft/", 1)
+        if data is not None:
+            data = bytes(data)  # the view of the log segment may be released
+        if not self.connected(sender, target):
+            simulation.clock.advance(self.latency)
+            raise requests.ConnectionError(f"{target} unreachable from {sender}.")
+        roll = simulation.rng.random()
+        if roll < self.drop:
+            simulation.clock.advance(timeout)
+            raise requests.Timeout(f"{endpoint} to {target} lost.")
+        if roll < self.drop + self.late:
+            delay = simulation.rng.uniform(0, self.max_late)
+            request = (sender, target, endpoint, json, params, data)
+            simulation.schedule(delay, functools.partial(self._deliver_late, *request))
+            simulation.clock.advance(timeout)
+            raise requests.Timeout(f"{endpoint} to {target} delayed.")
+        simulation.clock.advance(simulation.rng.uniform(0, 2 * self.latency))
+        return self.deliver(target, endpoint, json, params, data)
+
+    def deliver(
+        self,
+        target: str,
+        endpoint: str,
+        json: Optional[dict],
+        params: Optional[dict],
+        data: Optional[bytes],
+    ) -> SimulatedResponse:
+        """
+        Handle a request on `target`, like the endpoints of the service.
+
+        Parameters
+        ----------
+        target : str
+            receiving node
+        endpoint : str
+            path below `/api/v1/raft/`
+        json : Optional[dict]
+            message body
+        params : Optional[dict]
+            query parameters
+        data : Optional[bytes]
+            raw body
+
+        Returns
+        -------
+        SimulatedResponse
+            the answer, with the term of `target` on errors
+        """
+        state = self.simulation.nodes[target]
+        try:
+            if endpoint == "log/catchup":
+                answer = functions.append_entries(
+                    state, RaftMessageSchema(**params), decode_records(data)
+                )
+            else:
+                handler = {
+                    "prevote": functions.grant_pre_vote,
+                    "vote": functions.grant_vote,
+                    "log": functions.append_entries,
+                    "timeout-now": functions.timeout_now,
+                }[endpoint]
+                answer = handler(state, RaftMessageSchema(**json))
+        except ApiException as error:
+            return SimulatedResponse(
+                error.status_code,
+                {
+                    "error": {
+                        "id": error.id,
+                        "message": error.message,
+                        "details": error.details,
+                        "term": current_status(state).term,
+                    }
+                },
+            )
+        return SimulatedResponse(200, {"data": answer.dict()})
+
+    def _deliver_late(self, sender: str, target: str, *request) -> None:
+        """Deliver a delayed request, the answer is lost."""
+        if self.connected(sender, target):
+            self.deliver(target, *request)
+
+
+class _Transport:
+    """HTTP client and heartbeat sender of one simulated node."""
+
+    def __init__(self, network: SimulatedNetwork, name: str):
+        self.network = network
+        self.name = name
+
+    def put(self, url: str, **kwargs) -> SimulatedResponse:
+        """Send a request, like `requests.put`."""
+        return self.network.send(self.name, url, **kwargs)
+
+    post = put
+
+    def send(self, replica: str, message: dict) -> SimulatedResponse:
+        """Send a heartbeat, like `HeartbeatCoalescer.send`."""
+        return self.put(f"http://{replica}/api/v1/raft/log", json=message)
+
+
+class _Executor:
+    """Runs the steps of an executor thread as events of the simulation."""
+
+    def __init__(self, simulation: "Simulation", args: tuple, pre_vote: bool = True):
+        self.simulation = simulation
+        self.state = args[0]
+        self.pre_vote = pre_vote
+        self._alive = False
+
+    def start(self) -> None:
+        """Run the executor, like `Thread.start`."""
+        self._alive = True
+        self.after(0.0, self.run)
+
+    def stop(self) -> None:
+        """Stop the executor, pending steps are skipped."""
+        self._alive = False
+
+    def is_alive(self) -> bool:
+        """Check if the executor still runs, like `Thread.is_alive`."""
+        return self._alive
+
+    def after(self, delay: float, step: Callable[[], None]) -> None:
+        """Run `step` after `delay` seconds, unless stopped by then."""
+        self.simulation.schedule(delay, functools.partial(self._run_step, step))
+
+    def _run_step(self, step: Callable[[], None]) -> None:
+        if self._alive and not self.state.crashed:
+            step()
+
+    def run(self) -> None:
+        """First step of the executor."""
+        raise NotImplementedError
+
+
+class _Follower(_Executor):
+    """Steps of `FollowerExecutorThread`."""
+
+    def run(self) -> None:
+        functions.become_follower(self.state)
+        self._wait()
+
+    def _wait(self) -> None:
+        self.after(max(0.0, self.state.election_timer.remaining()), self._timeout)
+
+    def _timeout(self) -> None:
+        if self.state.election_timer.expired():
+            functions.be_follower(self.state)
+        self._wait()
+
+
+class _Candidate(_Executor):
+    """Steps of `CandidateExecutorThread`."""
+
+    def run(self) -> None:
+        state = self.state
+        if self.pre_vote and state.pre_vote and not functions.pre_vote(state):
+            self._alive = False  # no majority would vote for us
+            return
+        if not self._alive or not functions.become_candidate(state):
+            self._alive = False
+            return
+        self.after(state.heartbeat_repeat, self._campaign)
+
+    def _campaign(self) -> None:
+        try:
+            functions.be_candidate(self.state)
+        except RaftStateException:  # end of candidature
+            self._alive = False
+            return
+        self.after(self.state.heartbeat_repeat, self._campaign)
+
+
+class _Leader(_Executor):
+    """Steps of `LeaderExecutorThread`."""
+
+    def run(self) -> None:
+        functions.become_leader(self.state)
+        self.after(self.state.pacer.interval, self._lead)
+
+    def wake(self) -> None:
+        """Replicate new entries right away, like setting `state.replicate`."""
+        self.after(0.0, functools.partial(self._lead, tick=False))
+
+    def _lead(self, tick: bool = True) -> None:
+        self.state.replicate.clear()
+        try:
+            functions.be_leader(self.state)
+        except RaftStateException:  # end of leadership
+            self._alive = False
+            return
+        if tick:
+            self.after(self.state.pacer.interval, self._lead)
+
+
+class SimulationResult(NamedTuple):
+    """Summary of a simulation run."""
+
+    seed: int
+    seconds: float
+    events: int
+    terms: int
+    leaders: int
+    committed: int
+    crashes: int
+    partitions: int
+
+
+class Simulation:
+    """
+    A cluster of Raft nodes on a virtual clock with a simulated network.
+
+    Parameters
+    ----------
+    seed : int
+        seed of all random decisions, the same seed replays the same run
+    directory : str
+        directory for the write-ahead logs of the nodes
+    nodes : int, optional
+        cluster size, by default 5
+    election_timeout : Tuple[int, int], optional
+        bounds of the election timeout in milliseconds, by default the
+        defaults of the service
+    heartbeat_millis : int, optional
+        heartbeat interval until round trip times are measured
+    fault_interval : float, optional
+        mean seconds between crashes, restarts, partitions and leadership
+        transfers, by default 10
+    propose_interval : float, optional
+        mean seconds between writes to the key-value store, by default 0.2
+    **network
+        passed to `SimulatedNetwork`, e.g. `drop` or `late`
+    """
+
+    def __init__(
+        self,
+        seed: int,
+        directory: str,
+        nodes: int = 5,
+        election_timeout: Tuple[int, int] = (3000, 5000),
+        heartbeat_millis: int = 500,
+        fault_interval: float = 10.0,
+        propose_interval: float = 0.2,
+        **network,
+    ):
+        self.seed = seed
+        self.directory = directory
+        self.election_timeout = election_timeout
+        self.heartbeat_millis = heartbeat_millis
+        self.fault_interval = fault_interval
+        self.propose_interval = propose_interval
+        self.rng = random.Random(seed)
+        self.clock = VirtualClock()
+        self.network = SimulatedNetwork(self, **network)
+        self.names = [f"node_{i + 1}" for i in range(nodes)]
+        self.nodes: Dict[str, Optional[FastAPIState]] = {}
+        self.events = 0
+        self.crashes = 0
+        self.partitions = 0
+        self._queue: List[Tuple[float, int, Callable[[], None]]] = []
+        self._sequence = 0
+        self._leaders: Dict[int, str] = {}  # leader of every term seen
+        self._committed: List[Tuple[int, bytes]] = []  # term and data by index
+        self._verified: Dict[str, int] = {}  # committed entries checked per node
+        self._complete: Set[Tuple[str, int]] = set()  # leaders checked per term
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> None:
+        """
+        Run `callback` after `delay` seconds of virtual time.
+
+        Parameters
+        ----------
+        delay : float
+            seconds from now
+        callback : Callable[[], None]
+            event to run
+        """
+        self._sequence += 1  # events at the same time run in order of scheduling
+        heapq.heappush(self._queue, (self.clock() + delay, self._sequence, callback))
+
+    def run(self, seconds: float) -> SimulationResult:
+        """
+        Simulate the cluster for `seconds` of virtual time.
+
+        Parameters
+        ----------
+        seconds : float
+            virtual time to simulate
+
+        Returns
+        -------
+        SimulationResult
+            summary of the run
+
+        Raises
+        ------
+        InvariantViolation
+            when a safety property of Raft is broken
+        """
+        if not self.nodes:
+            for name in self.names:
+                self._boot(name)
+            self.schedule(
+                self.rng.expovariate(1 / self.propose_interval), self._propose
+            )
+            self.schedule(self.rng.expovariate(1 / self.fault_interval), self._fault)
+        end = self.clock() + seconds
+        while self._queue and self._queue[0][0] <= end:
+            when, _, callback = heapq.heappop(self._queue)
+            self.clock.now = max(self.clock.now, when)  # requests may run late
+            callback()
+            self.events += 1
+            self.check()
+        self.clock.now = max(self.clock.now, end)
+        self.check_logs()
+        return SimulationResult(
+            self.seed,
+            self.clock(),
+            self.events,
+            max(self._leaders, default=0),
+            len(self._leaders),
+            len(self._committed),
+            self.crashes,
+            self.partitions,
+        )
+
+    def close(self) -> None:
+        """Close the logs of all running nodes."""
+        for name, state in self.nodes.items():
+            if state is not None:
+                state.log.close()
+                self.nodes[name] = None
+
+    def check(self) -> None:
+        """
+        Check election safety, leader completeness and state machine safety.
+
+        Raises
+        ------
+        InvariantViolation
+            when a safety property of Raft is broken
+        """
+        for name, state in self.nodes.items():
+            if state is None:
+                continue
+            if state.state is State.LEADER and state.leader == name:
+                leader = self._leaders.setdefault(state.term, name)
+                if leader != name:
+                    self._violation(
+                        f"{leader} and {name} are both leader in term {state.term}"
+                    )
+                if (name, state.term) not in self._complete:
+                    self._check_complete(name, state)
+            self._check_committed(name, state)
+
+    def check_logs(self) -> None:
+        """
+        Check log matching of all running nodes.
+
+        Raises
+        ------
+        InvariantViolation
+            when two logs agree on the term of an entry but differ before it
+        """
+        logs = {
+            name: state.log.entries(1, state.log.last_index)
+            for name, state in self.nodes.items()
+            if state is not None
+        }
+        for name, log in logs.items():
+            for other, other_log in logs.items():
+                if other <= name:
+                    continue
+                matching = [
+                    i
+                    for i in range(min(len(log), len(other_log)))
+                    if log[i].term == other_log[i].term
+                ]
+                if (
+                    matching
+                    and log[: matching[-1] + 1] != other_log[: matching[-1] + 1]
+                ):
+                    self._violation(f"logs of {name} and {other} do not match")
+
+    def _check_committed(self, name: str, state: FastAPIState) -> None:
+        """Compare newly committed entries of a node to the other nodes."""
+        verified = self._verified[name]
+        if state.commit_index <= verified:
+            return
+        for entry in state.log.entries(verified + 1, state.commit_index - verified):
+            if entry.index <= len(self._committed):
+                if self._committed[entry.index - 1] != (entry.term, entry.data):
+                    self._violation(f"{name} committed a different entry {entry.index}")
+            else:
+                self._committed.append((entry.term, entry.data))
+        self._verified[name] = state.commit_index
+
+    def _check_complete(self, name: str, state: FastAPIState) -> None:
+        """Make sure a new leader holds all committed entries."""
+        entries = state.log.entries(1, len(self._committed))
+        if [(entry.term, entry.data) for entry in entries] != self._committed:
+            self._violation(f"leader {name} of term {state.term} lacks entries")
+        self._complete.add((name, state.term))
+
+    def _violation(self, message: str) -> None:
+        raise InvariantViolation(f"seed {self.seed} at {self.clock():.3f}s: {message}")
+
+    def _boot(self, name: str) -> None:
+        """Start a node, recovering term, vote and log of a previous run."""
+        if self.nodes.get(name) is not None:
+            return  # restarted already
+        state = FastAPIState()
+        state.app_name = name
+        state.id = name
+        state.group = DEFAULT_GROUP
+        state.replicas = {other: other for other in self.names if other != name}
+        state.heartbeat_repeat = self.heartbeat_millis / 1000
+        state.pre_vote = True
+        state.check_quorum = True
+        state.clock = self.clock
+        state.sleep = self.clock.advance
+        state.transport = state.heartbeats = _Transport(self.network, name)
+        state.pacer = HeartbeatPacer(
+            0.1, 1.0, state.heartbeat_repeat, self.election_timeout[0] / 1000
+        )
+        state.catchup_bytes = 1 << 20
+        state.executors = {
+            State.FOLLOWER: functools.partial(_Follower, self),
+            State.CANDIDATE: functools.partial(_Candidate, self),
+            State.LEADER: functools.partial(_Leader, self),
+        }
+        state.crashed = False
+        state.reporter = None
+        state.watch = None
+        state.state = State.FOLLOWER
+        state.leader = None
+        state.leader_script = None
+        state.follower_script = None
+        state.script_runner = ScriptRunner(1.0)
+        state.log = WriteAheadLog(
+            os.path.join(self.directory, name), WriteAheadLog.NONE, cache_bytes=1 << 20
+        )
+        state.term, state.vote = state.log.hard_state()
+        state.commit_index = 0
+        state.last_applied = 0
+        state.apply_lock = threading.Lock()
+        state.replicate = threading.Event()
+        state.election_timer = ElectionTimer(
+            *self.election_timeout, clock=self.clock, rng=self.rng
+        )
+        state.leases = LeaseTable(clock=self.clock)
+        state.kv = KeyValueStore()
+        state.status = None
+        self.nodes[name] = state
+        self._verified[name] = 0
+        state.executor = functions.executor_for(state, State.FOLLOWER)
+        state.executor.start()
+
+    def _propose(self) -> None:
+        """Write to the key-value store on a random leader."""
+        leaders = [
+            state
+            for state in self.nodes.values()
+            if state is not None and state.state is State.LEADER
+        ]
+        if leaders:
+            state = self.rng.choice(leaders)
+            key = f"k{self.rng.randrange(10)}"
+            command = KeyValueStore.command(KeyValueStore.SET, key, self.events)
+            try:
+                functions.propose(state, command)
+            except ApiException:
+                pass  # stepped down in between
+            else:
+                if isinstance(state.executor, _Leader):
+                    state.executor.wake()
+        self.schedule(self.rng.expovariate(1 / self.propose_interval), self._propose)
+
+    def _fault(self) -> None:
+        """Crash or restart a node, change the partition or transfer leadership."""
+        running = [name for name, state in self.nodes.items() if state is not None]
+        crashed = [name for name, state in self.nodes.items() if state is None]
+        fault = self.rng.choice(["crash", "restart", "partition", "heal", "transfer"])
+        if fault == "crash" and running:
+            name = self.rng.choice(running)
+            state = self.nodes[name]
+            state.crashed = True  # pending steps of its executors are skipped
+            state.log.close()
+            self.nodes[name] = None
+            self.crashes += 1
+            self.schedule(self.rng.uniform(1, 30), functools.partial(self._boot, name))
+        elif fault == "restart" and crashed:
+            self._boot(self.rng.choice(crashed))
+        elif fault == "partition":
+            self.network.partition({name: self.rng.randrange(2) for name in self.names})
+            self.partitions += 1
+        elif fault == "heal":
+            self.network.heal()
+        elif fault == "transfer":
+            for name in running:
+                state = self.nodes[name]
+                if state.state is State.LEADER and state.leader == name:
+                    try:
+                        functions.transfer_leadership(state)
+                    except ApiException:
+                        pass  # target unreachable
+                    break
+        self.schedule(self.rng.expovariate(1 / self.fault_interval), self._fault)
+
+
+def main() -> int:
+    """Simulate clusters with consecutive seeds, report failing seeds."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("--seeds", type=int, default=10, help="number of runs")
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--nodes", type=int, default=5)
+    parser.add_argument("--seconds", type=float, default=3600, help="per run")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    failed = []
+    started = time.perf_counter()
+    simulated = 0.0
+    for seed in range(args.first_seed, args.first_seed + args.seeds):
+        with tempfile.TemporaryDirectory() as directory:
+            simulation = Simulation(seed, directory, args.nodes)
+            try:
+                result = simulation.run(args.seconds)
+            except InvariantViolation as violation:
+                print(f"FAILED {violation}")
+                failed.append(seed)
+                continue
+            finally:
+                simulation.close()
+        simulated += result.seconds
+        print(
+            f"seed {seed}: {result.events} events, {result.terms} terms, "
+            f"{result.committed} committed, {result.crashes} crashes, "
+            f"{result.partitions} partitions"
+        )
+    elapsed = time.perf_counter() - started
+    print(
+        f"{args.seeds - len(failed)}/{args.seeds} runs passed, "
+        f"{simulated / elapsed:.0f} simulated seconds per second"
+    )
+    if failed:
+        print("replay with --first-seed <seed> --seeds 1:", *failed)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
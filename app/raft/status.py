@@ -0,0 +1,101 @@
+"""Immutable snapshot of role, term and leader of a node.
+
+Executor threads change the fields of the state object one by one. Request
+handlers read the snapshot instead, which is replaced as a whole on every
+transition, so they always see role, term, vote and leader of the same
+moment with a single attribute lookup.
+
+"""
+from typing import Any, Optional
+
+from fastapi.applications import State as FastAPIState
+
+
+class NodeStatus:
+    """
+    Role, term, vote and leader of a node (of a Raft group) at one moment.
+
+    Parameters
+    ----------
+    app_name : Optional[str]
+        name of the node
+    id : Optional[str]
+        id of the node
+    group : Optional[str]
+        Raft group, None for a node without groups
+    state : Any
+        role of the node, a `functions.State`
+    term : int
+        current term
+    vote : Optional[str]
+        node voted for in the current term
+    leader : Optional[str]
+        known leader
+    """
+
+    __slots__ = ("app_name", "id", "group", "state", "term", "vote", "leader")
+
+    def __init__(
+        self,
+        app_name: Optional[str],
+        id: Optional[str],
+        group: Optional[str],
+        state: Any,
+        term: int,
+        vote: Optional[str],
+        leader: Optional[str],
+    ):
+        for name, value in zip(
+            self.__slots__, (app_name, id, group, state, term, vote, leader)
+        ):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    @classmethod
+    def from_state(cls, state: FastAPIState) -> "NodeStatus":
+        """
+        Take a snapshot of the state object.
+
+        Parameters
+        ----------
+        state : FastAPIState
+            global state object
+
+        Returns
+        -------
+        NodeStatus
+            the snapshot
+        """
+        return cls(
+            getattr(state, "app_name", None),
+            getattr(state, "id", None),
+            getattr(state, "group", None),
+            getattr(state, "state", None),
+            state.term,
+            getattr(state, "vote", None),
+            getattr(state, "leader", None),
+        )
+
+
+def current_status(state: FastAPIState) -> NodeStatus:
+    """
+    Return the last published snapshot, or take one if none was published.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        global state object
+
+    Returns
+    -------
+    NodeStatus
+        the snapshot
+    """
+    status = getattr(state, "status", None)
+    return status if status is not None else NodeStatus.from_state(state)
@@ -0,0 +1,674 @@
+"""Write-ahead log of the Raft entries.
+
+Entries are appended to segment files as records of a fixed header and the
+JSON encoded command. A segment is sealed once it reaches its size limit and
+a new one is started. How an append is made durable is configurable:
+
+* `always`: every append is followed by an fsync before it returns.
+* `group`: concurrent appends share an fsync (group commit). Appends arriving
+  while an fsync runs are made durable together by the next one, which can
+  additionally wait a short window for more appends.
+* `none`: appends return once written to the OS, which flushes them later.
+
+The most recently used entries are kept in memory up to a size limit, so
+replicating the tail of the log to followers does not read from disk.
+Segments are read through `mmap`. Only every `INDEX_INTERVAL`-th record
+offset is kept in memory (sparse index), the records in between are found by
+skipping headers. A follower catching up gets a range of raw records sliced
+from the mapping, without copying it into Python objects.
+
+Term and vote of the node are kept next to the log, since they need to
+survive a restart as well.
+
+"""
+
+import bisect
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from app.api.exceptions import ConflictException
+from app.raft.metrics import Metrics
+from app.raft.tracing import NO_TRACER, Tracer
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# index, term, length and CRC32 of the payload
+RECORD_HEADER = struct.Struct("<QQII")
+INDEX_INTERVAL = 64  # records between two offsets in the sparse index
+SEGMENT_FILE = re.compile(r"^(\d{20})\.log$")
+
+
+class LogEntry(NamedTuple):
+    """A command in the replicated log."""
+
+    index: int
+    term: int
+    data: bytes
+
+
+class RecordRange(NamedTuple):
+    """Raw records of consecutive entries, a view into a mapped segment."""
+
+    first_index: int
+    last_index: int
+    data: memoryview
+
+
+def encode_records(entries: Sequence[LogEntry]) -> bytes:
+    """
+    Encode entries as records, the format of the segments.
+
+    Parameters
+    ----------
+    entries : Sequence[LogEntry]
+        entries to encode
+
+    Returns
+    -------
+    bytes
+        the records
+    """
+    records = []
+    for entry in entries:
+        header = RECORD_HEADER.pack(
+            entry.index, entry.term, len(entry.data), zlib.crc32(entry.data)
+        )
+        records += [header, entry.data]
+    return b"".join(records)
+
+
+def decode_records(data: bytes) -> List[LogEntry]:
+    """
+    Decode records received from the leader.
+
+    Parameters
+    ----------
+    data : bytes
+        records as returned by `WriteAheadLog.records`
+
+    Returns
+    -------
+    List[LogEntry]
+        the entries
+
+    Raises
+    ------
+    ValueError
+        when a record is incomplete or corrupt
+    """
+    entries = []
+    offset = 0
+    for entry, offset in _scan(data, 0):
+        entries.append(entry)
+    if offset != len(data):
+        raise ValueError(f"Corrupt record at byte {offset}.")
+    return entries
+
+
+def _scan(data, offset: int) -> Iterator[Tuple[LogEntry, int]]:
+    """Yield valid entries and the offset after them, stop at a torn record."""
+    while offset + RECORD_HEADER.size <= len(data):
+        index, term, length, crc = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        payload = bytes(data[start : start + length])
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            return
+        offset = start + length
+        yield LogEntry(index, term, payload), offset
+
+
+class _Segment:
+    """A log file holding consecutive entries from `first_index` on."""
+
+    def __init__(self, directory: str, first_index: int):
+        self.first_index = first_index
+        self.path = os.path.join(directory, f"{first_index:020d}.log")
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.size = 0
+        self.sparse: List[int] = []  # offset of every INDEX_INTERVAL-th record
+        self.sealed = False
+        self._mapped: Optional[mmap.mmap] = None
+
+    def mapping(self):
+        """Map the file read-only, sealed segments are mapped only once."""
+        if self._mapped is not None:
+            return self._mapped
+        if self.size == 0:
+            return b""
+        mapped = mmap.mmap(self.fd, self.size, access=mmap.ACCESS_READ)
+        if self.sealed:
+            if hasattr(mapped, "madvise"):
+                # read ahead on catch-up, pages are reclaimed before the tail
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            self._mapped = mapped
+        return mapped
+
+    def locate(self, mapped, index: int) -> int:
+        """Offset of the record of `index`, skipping from the sparse index."""
+        position = index - self.first_index
+        offset = self.sparse[position // INDEX_INTERVAL]
+        for _ in range(position % INDEX_INTERVAL):
+            offset += RECORD_HEADER.size + RECORD_HEADER.unpack_from(mapped, offset)[2]
+        return offset
+
+    def appended(self, count: int, offsets: List[int]) -> None:
+        """Add the offsets of records to the sparse index."""
+        for offset in offsets:
+            if count % INDEX_INTERVAL == 0:
+                self.sparse.append(offset)
+            count += 1
+
+    def unmap(self) -> None:
+        """Drop the mapping before the file is truncated or removed."""
+        mapped, self._mapped = self._mapped, None
+        if mapped is not None:
+            try:
+                mapped.close()
+            except BufferError:
+                pass  # still sent to a follower, unmapped once released
+
+    def close(self) -> None:
+        """Unmap and close the file."""
+        self.unmap()
+        os.close(self.fd)
+
+
+class _TailCache:
+    """Least recently used entries of the log, bounded by their payload size."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[int, LogEntry]" = OrderedDict()
+
+    def add(self, entries: Sequence[LogEntry]) -> None:
+        """Cache newly written entries, evicting the least recently used."""
+        if not self.max_bytes:
+            return
+        for entry in entries:
+            self._entries[entry.index] = entry
+            self.size += len(entry.data)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted.data)
+
+    def get(self, start: int, end: int) -> Optional[List[LogEntry]]:
+        """Entries `start` to `end`, None unless all of them are cached."""
+        try:
+            found = [self._entries[index] for index in range(start, end + 1)]
+        except KeyError:
+            return None
+        for index in range(start, end + 1):
+            self._entries.move_to_end(index)
+        return found
+
+    def truncate(self, index: int) -> None:
+        """Drop the entry at `index` and all following."""
+        for dropped in [i for i in self._entries if i >= index]:
+            self.size -= len(self._entries.pop(dropped).data)
+
+
+class WriteAheadLog:
+    """
+    Append-only Raft log with configurable durability.
+
+    Parameters
+    ----------
+    directory : str
+        directory holding the log and the hard state, created if missing
+    durability : str, optional
+        `always`, `group` or `none`, by default `always`
+    group_window : float, optional
+        seconds an fsync waits for further appends in `group` mode, by
+        default 0.0
+    group_bytes : int, optional
+        pending bytes that end the window early in `group` mode
+    segment_bytes : int, optional
+        size after which a new segment is started, by default 64 MiB
+    cache_bytes : int, optional
+        payload size of the entries kept in memory, by default 0 (no cache)
+    metrics : Optional[Metrics], optional
+        counts cache hits and misses, by default not counted
+    tracer : Optional[Tracer], optional
+        records a span per fsync of appended entries, by default not recorded
+    """
+
+    ALWAYS = "always"
+    GROUP = "group"
+    NONE = "none"
+    STATE_FILE = "hardstate.json"
+
+    def __init__(
+        self,
+        directory: str,
+        durability: str = ALWAYS,
+        group_window: float = 0.0,
+        group_bytes: int = 1 << 20,
+        segment_bytes: int = 64 << 20,
+        cache_bytes: int = 0,
+        metrics: Optional[Metrics] = None,
+        tracer: Optional[Tracer] = None,
+    ):
+        if durability not in (self.ALWAYS, self.GROUP, self.NONE):
+            raise ValueError(f"Unknown durability {durability}.")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.durability = durability
+        self.group_window = group_window
+        self.group_bytes = group_bytes
+        self.segment_bytes = segment_bytes
+        self.metrics = metrics
+        self.tracer = tracer or NO_TRACER
+        self._cache = _TailCache(cache_bytes)
+        self._cond = threading.Condition()
+        self._segments: List[_Segment] = []
+        self._firsts: List[int] = []  # first index of every segment
+        self._terms: List[int] = []  # term of entry i + 1
+        self._recover()
+        self._written = sum(segment.size for segment in self._segments)
+        self._synced = self._written
+        self._flushing = False
+        self._hard_state = self._load_hard_state()
+
+    @property
+    def last_index(self) -> int:
+        """Index of the last entry, 0 if the log is empty."""
+        return len(self._terms)
+
+    @property
+    def last_term(self) -> int:
+        """Term of the last entry, 0 if the log is empty."""
+        terms = self._terms
+        return terms[-1] if terms else 0
+
+    def term_at(self, index: int) -> Optional[int]:
+        """
+        Return the term of the entry at `index`.
+
+        Parameters
+        ----------
+        index : int
+            index of the entry
+
+        Returns
+        -------
+        Optional[int]
+            the term, 0 for index 0, None if there is no such entry
+        """
+        if index == 0:
+            return 0
+        with self._cond:
+            return self._terms[index - 1] if 0 < index <= len(self._terms) else None
+
+    def last_index_of_term(self, term: int) -> Optional[int]:
+        """
+        Return the index of the last entry of `term`.
+
+        Parameters
+        ----------
+        term : int
+            term to look up
+
+        Returns
+        -------
+        Optional[int]
+            the index, None if the log has no entry of `term`
+        """
+        with self._cond:
+            # terms never decrease along the log
+            index = bisect.bisect_right(self._terms, term)
+            return index if index and self._terms[index - 1] == term else None
+
+    def append(self, term: int, payloads: Sequence[bytes]) -> int:
+        """
+        Append new entries of the leader, durable as configured.
+
+        Parameters
+        ----------
+        term : int
+            current term of the leader
+        payloads : Sequence[bytes]
+            encoded commands
+
+        Returns
+        -------
+        int
+            index of the last appended entry
+        """
+        with self._cond:
+            first = len(self._terms) + 1
+            entries = [
+                LogEntry(first + i, term, payload) for i, payload in enumerate(payloads)
+            ]
+            position = self._write(entries)
+            self._commit(position)
+            return self.last_index
+
+    def write(
+        self, prev_index: int, prev_term: int, entries: Sequence[LogEntry]
+    ) -> int:
+        """
+        Store entries received from the leader, durable as configured.
+
+        Entries already in the log are skipped, a conflicting suffix of the log
+        is truncated first.
+
+        Parameters
+        ----------
+        prev_index : int
+            index of the entry preceding `entries`
+        prev_term : int
+            term of that entry on the leader
+        entries : Sequence[LogEntry]
+            consecutive entries following `prev_index`
+
+        Returns
+        -------
+        int
+            index of the last entry sent by the leader
+
+        Raises
+        ------
+        ConflictException
+            when the log does not contain the entry preceding `entries`, with
+            `conflict_term` and `conflict_index` as details: the term of the
+            entry at `prev_index` and the first index of that term, or None
+            and the index after the last entry if the log is shorter
+        """
+        with self._cond:
+            term = self._term_at(prev_index)
+            if term != prev_term:
+                if term is None:
+                    conflict_index = len(self._terms) + 1
+                else:
+                    conflict_index = bisect.bisect_left(self._terms, term) + 1
+                # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+                raise ConflictException(  # type: ignore
+                    message=f"Log mismatch at index {prev_index}.",
+                    details={"conflict_term": term, "conflict_index": conflict_index},
+                )
+            new = []
+            for entry in entries:
+                if new or self._term_at(entry.index) != entry.term:
+                    new.append(entry)
+            if new:
+                if new[0].index <= len(self._terms):
+                    self._truncate(new[0].index)
+                position = self._write(new)
+                self._commit(position)
+            return prev_index + len(entries)
+
+    def entries(self, start: int, max_entries: int) -> List[LogEntry]:
+        """
+        Read up to `max_entries` entries from `start` on, from memory if all
+        of them are cached.
+
+        Parameters
+        ----------
+        start : int
+            index of the first entry
+        max_entries : int
+            maximum number of entries
+
+        Returns
+        -------
+        List[LogEntry]
+            the entries, empty if `start` is after the last entry
+        """
+        entries: List[LogEntry] = []
+        with self._cond:
+            end = min(len(self._terms), start + max_entries - 1)
+            index = max(start, 1)
+            if index > end:
+                return entries
+            cached = self._cache.get(index, end)
+            if self.metrics is not None:
+                hit = cached is not None
+                self.metrics.increment("log_cache_hits" if hit else "log_cache_misses")
+            if cached is not None:
+                return cached
+            while index <= end:
+                segment = self._segment(index)
+                mapped = segment.mapping()
+                last = min(end, self._segment_last(segment))
+                scan = _scan(mapped, segment.locate(mapped, index))
+                for (entry, _), _ in zip(scan, range(last - index + 1)):
+                    entries.append(entry)
+                index = last + 1
+        return entries
+
+    def records(self, start: int, max_bytes: int) -> Optional[RecordRange]:
+        """
+        Slice raw records from `start` on out of a segment, without copying.
+
+        The range ends at `max_bytes`, but holds at least one record, and never
+        spans more than one segment.
+
+        Parameters
+        ----------
+        start : int
+            index of the first entry
+        max_bytes : int
+            size limit of the range
+
+        Returns
+        -------
+        Optional[RecordRange]
+            the records, None if `start` is after the last entry
+        """
+        with self._cond:
+            if not 1 <= start <= len(self._terms):
+                return None
+            segment = self._segment(start)
+            mapped = segment.mapping()
+            begin = offset = segment.locate(mapped, start)
+            last = start - 1
+            while last < self._segment_last(segment):
+                length = RECORD_HEADER.unpack_from(mapped, offset)[2]
+                size = RECORD_HEADER.size + length
+                if last >= start and offset + size - begin > max_bytes:
+                    break
+                offset += size
+                last += 1
+            return RecordRange(start, last, memoryview(mapped)[begin:offset])
+
+    def hard_state(self) -> Tuple[int, Optional[str]]:
+        """
+        Return term and vote stored before the last restart.
+
+        Returns
+        -------
+        Tuple[int, Optional[str]]
+            term and vote, 0 and None for a new node
+        """
+        return self._hard_state
+
+    def save_hard_state(self, term: int, vote: Optional[str]) -> None:
+        """
+        Store term and vote, if they changed, durable unless mode is `none`.
+
+        Parameters
+        ----------
+        term : int
+            current term
+        vote : Optional[str]
+            node voted for in the current term
+        """
+        with self._cond:
+            if (term, vote) == self._hard_state:
+                return
+            path = os.path.join(self.directory, self.STATE_FILE)
+            with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+                json.dump({"term": term, "vote": vote}, file)
+                file.flush()
+                if self.durability != self.NONE:
+                    os.fsync(file.fileno())
+            os.replace(f"{path}.tmp", path)
+            self._hard_state = (term, vote)
+
+    def close(self) -> None:
+        """Flush and close the log."""
+        with self._cond:
+            os.fsync(self._segments[-1].fd)
+            for segment in self._segments:
+                segment.close()
+
+    def _term_at(self, index: int) -> Optional[int]:
+        """Term of the entry at `index`. Needs `_cond`."""
+        if index == 0:
+            return 0
+        return self._terms[index - 1] if index <= len(self._terms) else None
+
+    def _segment(self, index: int) -> _Segment:
+        """Segment holding the entry at `index`. Needs `_cond`."""
+        return self._segments[bisect.bisect_right(self._firsts, index) - 1]
+
+    def _segment_last(self, segment: _Segment) -> int:
+        """Index of the last entry of `segment`. Needs `_cond`."""
+        if segment is self._segments[-1]:
+            return len(self._terms)
+        return self._segments[self._segments.index(segment) + 1].first_index - 1
+
+    def _write(self, entries: Sequence[LogEntry]) -> int:
+        """Write entries at the end of the log. Needs `_cond`."""
+        if entries[0].index != len(self._terms) + 1:
+            raise ValueError(f"Gap in log before index {entries[0].index}.")
+        active = self._segments[-1]
+        if active.size >= self.segment_bytes:
+            active = self._roll(entries[0].index)
+        count = entries[0].index - active.first_index
+        offsets = []
+        offset = active.size
+        for entry in entries:
+            offsets.append(offset)
+            offset += RECORD_HEADER.size + len(entry.data)
+        os.pwrite(active.fd, encode_records(entries), active.size)
+        active.appended(count, offsets)
+        self._terms += [entry.term for entry in entries]
+        self._cache.add(entries)
+        self._written += offset - active.size
+        active.size = offset
+        if self._written - self._synced >= self.group_bytes:
+            self._cond.notify_all()  # wake the group commit early
+        return self._written
+
+    def _roll(self, first_index: int) -> _Segment:
+        """Seal the active segment and start a new one. Needs `_cond`."""
+        sealed = self._segments[-1]
+        if self.durability != self.NONE:
+            os.fdatasync(sealed.fd)
+            self._synced = self._written
+        sealed.sealed = True
+        active = _Segment(self.directory, first_index)
+        self._segments.append(active)
+        self._firsts.append(first_index)
+        return active
+
+    def _commit(self, position: int) -> None:
+        """Wait until the log is durable up to `position`. Needs `_cond`."""
+        if self.durability == self.NONE:
+            return
+        if self.durability == self.ALWAYS:
+            with self.tracer.span("fsync", bytes=max(0, position - self._synced)):
+                os.fdatasync(self._segments[-1].fd)
+            self._synced = max(self._synced, position)
+            return
+        # a truncation may have dropped the end of the range waited for
+        while self._synced < min(position, self._written):
+            if self._flushing:
+                self._cond.wait()  # another append issues the fsync
+                continue
+            self._flushing = True
+            if self.group_window and self._written - self._synced < self.group_bytes:
+                self._cond.wait(self.group_window)  # let other appends join
+            target = self._written
+            fd = self._segments[-1].fd  # older segments are synced on roll
+            pending = target - self._synced
+            self._cond.release()
+            try:
+                with self.tracer.span("fsync", bytes=pending):
+                    os.fdatasync(fd)
+            finally:
+                self._cond.acquire()
+                self._synced = max(self._synced, target)
+                self._flushing = False
+                self._cond.notify_all()
+
+    def _truncate(self, index: int) -> None:
+        """Drop the entry at `index` and all following. Needs `_cond`."""
+        logger.info("truncating log from index %s", index)
+        segment = self._segment(index)
+        while self._segments[-1] is not segment:
+            dropped = self._segments.pop()
+            self._firsts.pop()
+            dropped.close()
+            os.unlink(dropped.path)
+        mapped = segment.mapping()
+        offset = segment.locate(mapped, index)
+        del mapped
+        segment.unmap()
+        os.ftruncate(segment.fd, offset)
+        if self.durability != self.NONE:
+            os.fdatasync(segment.fd)
+        kept = index - segment.first_index
+        del segment.sparse[(kept + INDEX_INTERVAL - 1) // INDEX_INTERVAL :]
+        segment.size = offset
+        segment.sealed = False
+        del self._terms[index - 1 :]
+        self._cache.truncate(index)
+        self._written = self._synced = sum(s.size for s in self._segments)
+
+    def _recover(self) -> None:
+        """Index the segments, drop a torn record at the end of the log."""
+        firsts = sorted(
+            int(match.group(1))
+            for match in map(SEGMENT_FILE.match, os.listdir(self.directory))
+            if match
+        )
+        for first in firsts or [1]:
+            if first != len(self._terms) + 1:
+                # entries missing in between, the rest of the log is unusable
+                logger.warning("dropping segment %s after a gap", first)
+                os.unlink(os.path.join(self.directory, f"{first:020d}.log"))
+                continue
+            segment = _Segment(self.directory, first)
+            size = os.fstat(segment.fd).st_size
+            segment.size = size
+            offsets = []
+            offset = 0
+            for entry, end in _scan(segment.mapping(), 0):
+                if entry.index != len(self._terms) + 1:
+                    break
+                offsets.append(offset)
+                self._terms.append(entry.term)
+                offset = end
+            segment.appended(0, offsets)
+            if offset < size:
+                logger.warning(
+                    "dropping %s bytes after index %s", size - offset, len(self._terms)
+                )
+                os.ftruncate(segment.fd, offset)
+                segment.size = offset
+            if self._segments:
+                self._segments[-1].sealed = True
+            self._segments.append(segment)
+            self._firsts.append(first)
+
+    def _load_hard_state(self) -> Tuple[int, Optional[str]]:
+        """Read term and vote, 0 and None if never stored."""
+        try:
+            with open(
+                os.path.join(self.directory, self.STATE_FILE), encoding="utf-8"
+            ) as file:
+                stored = json.load(file)
+        except FileNotFoundError:
+            return 0, None
+        return stored["term"], stored["vote"]
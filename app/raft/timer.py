@@ -0,0 +1,119 @@
+"""Election timer on the monotonic clock."""
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+
+class ElectionTimer:
+    """
+    Deadline-based election timer.
+
+    Instead of polling the time since the last heartbeat, a follower blocks in
+    `wait` until the deadline has passed. Heartbeats push the deadline back
+    with `reset`, a new term draws a fresh random timeout with `rearm`, so
+    repeated split votes do not happen with the same timeouts.
+
+    Parameters
+    ----------
+    lower_millis : int
+        lower bound of the randomized election timeout
+    upper_millis : int
+        upper bound of the randomized election timeout
+    clock : Callable[[], float], optional
+        monotonic clock in seconds, by default `time.monotonic`
+    rng : Optional[random.Random], optional
+        source of the random timeouts, by default the `random` module
+    """
+
+    def __init__(
+        self,
+        lower_millis: int,
+        upper_millis: int,
+        clock: Callable[[], float] = time.monotonic,
+        rng: Optional[random.Random] = None,
+    ):
+        self.lower = lower_millis / 1000
+        self.upper = upper_millis / 1000
+        self._clock = clock
+        self._rng = rng
+        self._cond = threading.Condition()
+        self.timeout = self.lower
+        self.last_reset = self._clock()
+        self.deadline = self.last_reset + self.timeout
+        self.rearm()
+
+    def rearm(self) -> None:
+        """Draw a new random timeout and restart the timer with it."""
+        with self._cond:
+            # bandit: not used for security/crypto
+            rng = self._rng or random
+            self.timeout = rng.uniform(self.lower, self.upper)  # nosec
+            self.reset()
+
+    def reset(self) -> None:
+        """Restart the timer with the current timeout, e.g. on a heartbeat."""
+        with self._cond:
+            self.last_reset = self._clock()
+            self.deadline = self.last_reset + self.timeout
+            self._cond.notify_all()
+
+    def since_reset(self) -> float:
+        """
+        Time since the timer was last reset, e.g. since the last heartbeat.
+
+        Returns
+        -------
+        float
+            seconds since the last reset
+        """
+        return self._clock() - self.last_reset
+
+    def remaining(self) -> float:
+        """
+        Time left until the deadline.
+
+        Returns
+        -------
+        float
+            seconds until the timer fires, negative if already expired
+        """
+        return self.deadline - self._clock()
+
+    def expired(self) -> bool:
+        """
+        Check if the deadline has passed.
+
+        Returns
+        -------
+        bool
+            True if the timer fired
+        """
+        return self.remaining() <= 0
+
+    def wake(self) -> None:
+        """Wake up all waiting threads, so they can check their stop flags."""
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait(self, stop_evt: threading.Event) -> bool:
+        """
+        Block until the deadline has passed or `stop_evt` is set.
+
+        Parameters
+        ----------
+        stop_evt : threading.Event
+            stop flag of the waiting executor, needs a call to `wake` after set
+
+        Returns
+        -------
+        bool
+            True if the timer fired, False if the waiter was stopped
+        """
+        with self._cond:
+            while not stop_evt.is_set():
+                remaining = self.remaining()
+                if remaining <= 0:
+                    return True
+                self._cond.wait(remaining)
+            return False
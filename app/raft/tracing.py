@@ -0,0 +1,325 @@
+"""Spans of Raft rounds and RPCs, linked across nodes.
+
+A span measures one operation, e.g. a heartbeat round of the leader, the
+append entries request to a single follower, the handling of that request on
+the follower and the fsync it waits for. The span of the sender travels in
+the W3C `traceparent` header of the request, so the spans of all nodes taking
+part in a round share one trace.
+
+Finished spans are written to a file, one OTLP/JSON object per line as read by
+the `otlpjsonfile` receiver of the OpenTelemetry collector. Without a file,
+spans are not recorded at all.
+
+"""
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple, Type
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+TRACEPARENT = "traceparent"
+TRACEPARENT_FORMAT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+# OTLP span kinds and status codes
+INTERNAL = 1
+SERVER = 2
+CLIENT = 3
+STATUS_ERROR = 2
+
+
+class SpanContext(NamedTuple):
+    """Identifies a span across nodes."""
+
+    trace_id: str
+    span_id: str
+
+    @property
+    def traceparent(self) -> str:
+        """Value of the `traceparent` header, sampled."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    @classmethod
+    def from_traceparent(cls, header: Optional[str]) -> Optional["SpanContext"]:
+        """
+        Parse a `traceparent` header.
+
+        Parameters
+        ----------
+        header : Optional[str]
+            header value
+
+        Returns
+        -------
+        Optional[SpanContext]
+            the context, None if missing or malformed
+        """
+        match = TRACEPARENT_FORMAT.match(header or "")
+        if match is None or match.group(1) == "0" * 32:
+            return None
+        return cls(match.group(1), match.group(2))
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("span", default=None)
+
+
+def current_context() -> Optional[SpanContext]:
+    """
+    Context of the span open in this thread or task.
+
+    Returns
+    -------
+    Optional[SpanContext]
+        the context, None outside of a span
+    """
+    span = _current.get()
+    return span.context if span is not None else None
+
+
+def add_trace_ids(_, __, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """structlog processor adding trace and span id of the open span."""
+    context = current_context()
+    if context is not None:
+        event_dict["trace_id"] = context.trace_id
+        event_dict["span_id"] = context.span_id
+    return event_dict
+
+
+class Span:
+    """
+    A timed operation, the current span of its thread while open.
+
+    Created by `Tracer.span`, use as context manager.
+    """
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        kind: int,
+        parent: Optional[SpanContext],
+        links: Sequence[SpanContext],
+        expected: Tuple[Type[BaseException], ...],
+        attributes: Dict[str, Any],
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.context = SpanContext(
+            parent.trace_id if parent is not None else os.urandom(16).hex(),
+            os.urandom(8).hex(),
+        )
+        self.links = list(links)
+        self.expected = expected
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.start = 0
+        self.end = 0
+        self._token: Optional[contextvars.Token] = None
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """Headers passing this span on to the receiver of a request."""
+        return {TRACEPARENT: self.context.traceparent}
+
+    def set(self, **attributes: Any) -> None:
+        """Add attributes, e.g. the status code of an answer."""
+        self.attributes.update(attributes)
+
+    def fail(self, message: str) -> None:
+        """Mark the span as failed."""
+        self.error = message
+
+    def __enter__(self) -> "Span":
+        self.start = time.time_ns()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.end = time.time_ns()
+        if self._token is not None:
+            _current.reset(self._token)
+        if exc_type is not None and issubclass(exc_type, self.expected):
+            self.attributes["ended_by"] = exc_type.__name__
+        elif exc_type is not None and self.error is None:
+            self.fail(f"{exc_type.__name__}: {exc}")
+        self.tracer.export(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Span as OTLP/JSON."""
+        span: Dict[str, Any] = {
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": _otlp_attributes(self.attributes),
+        }
+        if self.parent is not None:
+            span["parentSpanId"] = self.parent.span_id
+        if self.links:
+            span["links"] = [
+                {"traceId": link.trace_id, "spanId": link.span_id}
+                for link in self.links
+            ]
+        if self.error is not None:
+            span["status"] = {"code": STATUS_ERROR, "message": self.error}
+        return span
+
+
+class _NoSpan:
+    """Stands in for a span while tracing is disabled."""
+
+    context = None
+    headers: Dict[str, str] = {}
+
+    def set(self, **attributes: Any) -> None:
+        """Ignore attributes."""
+
+    def fail(self, message: str) -> None:
+        """Ignore failures."""
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    """
+    Creates spans and writes them to a JSON lines file.
+
+    Parameters
+    ----------
+    service_name : str, optional
+        `service.name` of the spans, e.g. the node id
+    path : Optional[str], optional
+        file the spans are appended to, by default spans are not recorded
+    """
+
+    def __init__(self, service_name: str = "", path: Optional[str] = None):
+        self.service_name = service_name
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+
+    @property
+    def enabled(self) -> bool:
+        """Whether spans are recorded."""
+        return self._file is not None
+
+    def span(
+        self,
+        name: str,
+        kind: int = INTERNAL,
+        parent: Optional[SpanContext] = None,
+        links: Sequence[SpanContext] = (),
+        expected: Tuple[Type[BaseException], ...] = (),
+        **attributes: Any,
+    ):
+        """
+        Start a span, as child of `parent` or else of the current span.
+
+        Parameters
+        ----------
+        name : str
+            operation, e.g. `heartbeat round`
+        kind : int, optional
+            `INTERNAL`, `SERVER` or `CLIENT`, by default `INTERNAL`
+        parent : Optional[SpanContext], optional
+            parent span, e.g. read from the `traceparent` header of a request
+        links : Sequence[SpanContext], optional
+            further related spans, e.g. all rounds sharing one request
+        expected : Tuple[Type[BaseException], ...], optional
+            exceptions ending the span without failing it, e.g. the one ending
+            a candidature
+        **attributes
+            attributes of the span
+
+        Returns
+        -------
+        Span
+            context manager, a no-op if tracing is disabled
+        """
+        if self._file is None:
+            return NO_SPAN
+        if parent is None:
+            parent = current_context()
+        return Span(self, name, kind, parent, links, expected, attributes)
+
+    def export(self, span: Span) -> None:
+        """
+        Write a finished span.
+
+        Parameters
+        ----------
+        span : Span
+            the span
+        """
+        line = json.dumps(
+            {
+                "resourceSpans": [
+                    {
+                        "resource": {
+                            "attributes": _otlp_attributes(
+                                {"service.name": self.service_name}
+                            )
+                        },
+                        "scopeSpans": [
+                            {"scope": {"name": "app.raft"}, "spans": [span.to_otlp()]}
+                        ],
+                    }
+                ]
+            }
+        )
+        with self._lock:
+            if self._file is None:
+                return
+            try:
+                self._file.write(line + "\n")
+                self._file.flush()
+            except OSError as error:
+                logger.warning("could not write span: %s", str(error))
+
+    def close(self) -> None:
+        """Stop recording and close the file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Attributes as OTLP/JSON key-value list, None values are left out."""
+    converted = []
+    for key, value in attributes.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        converted.append({"key": key, "value": typed})
+    return converted
+
+
+NO_TRACER = Tracer()
@@ -0,0 +1,250 @@
+"""Change notifications for long-polling clients.
+
+Leader, term, lock and key-value changes are appended to a bounded event log with a
+monotonically increasing index. Clients wait for events after the last index
+they have seen. All waiters of a node share a single `asyncio.Event`, which is
+replaced on every change, so thousands of idle watchers cost no CPU and no
+threads.
+
+"""
+import asyncio
+import collections
+import threading
+import time
+from typing import Any, Callable, Deque, List, NamedTuple, Optional, Sequence, Tuple
+
+from app.api.exceptions import GoneException
+
+
+class WatchEvent(NamedTuple):
+    """A change of the leader, the term or a key."""
+
+    index: int
+    kind: str
+    key: str
+    value: Optional[str]
+    timestamp: float
+
+
+class WatchHub:
+    """
+    Bounded event log with asyncio waiters.
+
+    Events can be published from any thread. Waiters live on the event loop
+    passed to `attach`.
+
+    Parameters
+    ----------
+    max_events : int
+        number of events kept for clients resuming from an older index
+    """
+
+    LEADER = "LEADER"
+    TERM = "TERM"
+    KEY = "KEY"
+
+    def __init__(self, max_events: int):
+        self._lock = threading.Lock()
+        self._events: Deque[WatchEvent] = collections.deque(maxlen=max_events)
+        self.index = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._changed: Optional[asyncio.Event] = None
+        self._wake_pending = False
+        self._term: Optional[int] = None
+        self._leader: Optional[str] = None
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Bind the waiters to an event loop, call from within that loop.
+
+        Parameters
+        ----------
+        loop : asyncio.AbstractEventLoop
+            the running event loop of the web server
+        """
+        self._loop = loop
+        self._changed = asyncio.Event()
+
+    def publish(self, kind: str, key: str, value: Optional[str] = None) -> int:
+        """
+        Append an event and wake up all waiters.
+
+        Parameters
+        ----------
+        kind : str
+            LEADER, TERM or KEY
+        key : str
+            key that changed
+        value : Optional[str], optional
+            new value of the key, None if deleted
+
+        Returns
+        -------
+        int
+            index of the event
+        """
+        with self._lock:
+            self.index += 1
+            self._events.append(WatchEvent(self.index, kind, key, value, time.time()))
+            index = self.index
+            if self._loop is None or self._wake_pending:
+                return index  # waiters are woken up already
+            self._wake_pending = True
+        try:
+            self._loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            pass  # event loop closed on shutdown
+        return index
+
+    def publish_status(self, term: int, leader: Optional[str]) -> None:
+        """
+        Publish term and leader of this node, if they changed.
+
+        Parameters
+        ----------
+        term : int
+            current term
+        leader : Optional[str]
+            current leader, None while unknown
+        """
+        with self._lock:
+            term_changed, self._term = term != self._term, term
+            leader_changed, self._leader = leader != self._leader, leader
+        if term_changed:
+            self.publish(self.TERM, "term", str(term))
+        if leader_changed:
+            self.publish(self.LEADER, "leader", leader)
+
+    def publish_lease(self, name: str, lease: Any) -> None:
+        """
+        Publish a change of a lock, used as callback of the lease table.
+
+        Parameters
+        ----------
+        name : str
+            name of the lock
+        lease : Any
+            current lease, None if the lock is free
+        """
+        self.publish(self.KEY, f"locks/{name}", lease.owner if lease else None)
+
+    def publish_value(self, key: str, value: Optional[str]) -> None:
+        """
+        Publish a change of the key-value store, used as its callback.
+
+        Parameters
+        ----------
+        key : str
+            key that changed
+        value : Optional[str]
+            new value, None if deleted
+        """
+        self.publish(self.KEY, f"kv/{key}", value)
+
+    def since(self, index: int, keys: Sequence[str] = ()) -> List[WatchEvent]:
+        """
+        Return all events after `index`, filtered by key.
+
+        Parameters
+        ----------
+        index : int
+            last index known to the client
+        keys : Sequence[str], optional
+            keys to return events for, keys ending with `/` match as prefix,
+            by default all keys
+
+        Returns
+        -------
+        List[WatchEvent]
+            matching events, oldest first
+
+        Raises
+        ------
+        GoneException
+            when events after `index` were already dropped from the log
+        """
+        with self._lock:
+            if self._events and index < self._events[0].index - 1:
+                # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+                raise GoneException(  # type: ignore
+                    message=f"Index {index} compacted.",
+                    details={"index": self.index},
+                )
+            events = [event for event in self._events if event.index > index]
+        return [event for event in events if self._matches(event.key, keys)]
+
+    async def wait_until(self, predicate: Callable[[], Any], timeout: float) -> Any:
+        """
+        Wait until `predicate` returns a truthy value, checked on every change.
+
+        Parameters
+        ----------
+        predicate : Callable[[], Any]
+            condition to wait for
+        timeout : float
+            seconds to wait at most
+
+        Returns
+        -------
+        Any
+            last value returned by `predicate`
+        """
+        deadline = time.monotonic() + timeout
+        while not (result := predicate()):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._changed is None:
+                break
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return result
+
+    async def wait(
+        self, index: int, keys: Sequence[str], timeout: float
+    ) -> Tuple[int, List[WatchEvent]]:
+        """
+        Wait for events after `index`, filtered by key.
+
+        Parameters
+        ----------
+        index : int
+            last index known to the client
+        keys : Sequence[str]
+            keys to wait for, see `since`
+        timeout : float
+            seconds to wait at most
+
+        Returns
+        -------
+        Tuple[int, List[WatchEvent]]
+            index to resume from and the matching events, empty on timeout
+        """
+        checked = index
+
+        def check() -> List[WatchEvent]:
+            nonlocal checked
+            head = self.index  # all events up to head are seen by since()
+            events = self.since(index, keys)
+            checked = head
+            return events
+
+        events = await self.wait_until(check, timeout)
+        return max([checked] + [event.index for event in events]), events
+
+    def _wake(self) -> None:
+        """Wake up all current waiters, runs on the event loop."""
+        with self._lock:
+            self._wake_pending = False
+        changed, self._changed = self._changed, asyncio.Event()
+        if changed is not None:
+            changed.set()
+
+    @staticmethod
+    def _matches(key: str, keys: Sequence[str]) -> bool:
+        if not keys:
+            return True
+        return any(
+            key.startswith(pattern) if pattern.endswith("/") else key == pattern
+            for pattern in keys
+        )
@@ -0,0 +1,494 @@
+"""Several uvicorn workers per node, one of them runs Raft.
+
+With `WORKER_SOCKET` set, every worker process started by
+`uvicorn --workers N` imports `app.main`. The first one to lock
+`<WORKER_SOCKET>.lock` becomes the owner: it runs the Raft groups like a
+single worker and serves the other workers on the Unix socket. The others
+run no Raft at all, they
+
+* forward every request to the owner, which handles it as if it had received
+  it itself, the response is streamed back,
+* answer key-value reads from a local view of the applied key-value stores,
+  pushed by the owner on every change. Like reads answered by a follower, the
+  view may lag behind the leader.
+
+The lock is released when the owner exits, the worker started next in its
+place becomes the owner. Until the other workers reach it again, they answer
+forwarded requests with 503.
+
+Messages on the socket are frames of a JSON header and a raw body, one
+request and its response per connection.
+
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import struct
+from typing import IO, Any, Dict, List, Optional, Set, Tuple
+
+from fastapi.applications import State as FastAPIState
+from starlette.requests import Request
+
+from app.api.exceptions import ApiException, GoneException, ServiceUnavailableException
+from app.raft.functions import State
+from app.raft.kv import KeyValueStore
+from app.raft.status import NodeStatus, current_status
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+FRAME_SIZES = struct.Struct(">II")  # header and body size
+LOCAL_READS = ("/api/v1/kv/",)  # GET answered from the view
+VIEW_REFRESH = 1.0  # seconds between status updates of an unchanged view
+
+
+def claim_ownership(lock_path: str) -> Optional[IO]:
+    """
+    Try to become the owner of the Raft groups of this node.
+
+    Parameters
+    ----------
+    lock_path : str
+        file locked by the owner
+
+    Returns
+    -------
+    Optional[IO]
+        the locked file, keep it open while running Raft, None if another
+        process owns the groups
+    """
+    directory = os.path.dirname(lock_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    lock_file = open(lock_path, "a", encoding="utf-8")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def encode_frame(header: Dict[str, Any], body: bytes = b"") -> bytes:
+    """
+    Encode a frame.
+
+    Parameters
+    ----------
+    header : Dict[str, Any]
+        JSON header, `type` tells the frame apart
+    body : bytes, optional
+        raw body
+
+    Returns
+    -------
+    bytes
+        sizes, header and body
+    """
+    data = json.dumps(header, separators=(",", ":")).encode()
+    return FRAME_SIZES.pack(len(data), len(body)) + data + body
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[Dict[str, Any], bytes]:
+    """
+    Read a frame.
+
+    Parameters
+    ----------
+    reader : asyncio.StreamReader
+        the connection
+
+    Returns
+    -------
+    Tuple[Dict[str, Any], bytes]
+        header and body
+
+    Raises
+    ------
+    asyncio.IncompleteReadError
+        when the connection was closed
+    """
+    header_size, body_size = FRAME_SIZES.unpack(
+        await reader.readexactly(FRAME_SIZES.size)
+    )
+    header = json.loads(await reader.readexactly(header_size))
+    body = await reader.readexactly(body_size) if body_size else b""
+    return header, body
+
+
+def view_status(state: FastAPIState) -> List[Any]:
+    """Role, term, vote and leader of a group as sent with its view."""
+    status = current_status(state)
+    return [
+        status.app_name,
+        status.id,
+        status.state.value if status.state is not None else None,
+        status.term,
+        status.vote,
+        status.leader,
+    ]
+
+
+class OwnerServer:
+    """
+    Serves the other workers of the node, runs in the owner.
+
+    Parameters
+    ----------
+    app
+        the ASGI app handling forwarded requests
+    state : FastAPIState
+        app state, also the state of the default group
+    path : str
+        the Unix socket
+    """
+
+    def __init__(self, app, state: FastAPIState, path: str):
+        self.app = app
+        self.state = state
+        self.path = path
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.StreamWriter] = set()
+
+    async def start(self) -> None:
+        """Listen on the socket, replacing the one of a previous owner."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        logger.info("serving workers on %s", self.path)
+
+    async def close(self) -> None:
+        """Stop listening, close the connections of the views."""
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Answer the request on a new connection."""
+        self._connections.add(writer)
+        try:
+            header, body = await read_frame(reader)
+            if header["type"] == "http":
+                await self._http(header, body, reader, writer)
+            elif header["type"] == "view":
+                await self._view(reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # the worker went away
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _http(
+        self,
+        header: Dict[str, Any],
+        body: bytes,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """Handle a forwarded request with the app."""
+        scope = dict(header["scope"])
+        scope["headers"] = [
+            (name.encode("latin-1"), value.encode("latin-1"))
+            for name, value in scope["headers"]
+        ]
+        scope["query_string"] = scope["query_string"].encode("latin-1")
+        scope["raw_path"] = scope["raw_path"].encode("latin-1")
+        for address in ("client", "server"):
+            if scope.get(address) is not None:
+                scope[address] = tuple(scope[address])
+        received = False
+
+        async def receive() -> Dict[str, Any]:
+            nonlocal received
+            if not received:
+                received = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await reader.read()  # nothing more is sent, wait for the close
+            return {"type": "http.disconnect"}
+
+        async def send(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                writer.write(
+                    encode_frame(
+                        {
+                            "type": "start",
+                            "status": message["status"],
+                            "headers": [
+                                (name.decode("latin-1"), value.decode("latin-1"))
+                                for name, value in message.get("headers", [])
+                            ],
+                        }
+                    )
+                )
+            elif message["type"] == "http.response.body":
+                writer.write(
+                    encode_frame(
+                        {"type": "body", "more": message.get("more_body", False)},
+                        message.get("body", b""),
+                    )
+                )
+            await writer.drain()
+
+        await self.app(scope, receive, send)
+
+    async def _view(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Push the key-value stores of all groups until the worker leaves."""
+        lock = asyncio.Lock()
+        tasks = [
+            asyncio.create_task(self._follow(writer, lock, name, group))
+            for name, group in self.state.groups.items()
+        ]
+        tasks.append(asyncio.create_task(reader.read()))  # returns on close
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()  # raise errors of the followers
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _follow(
+        self,
+        writer: asyncio.StreamWriter,
+        lock: asyncio.Lock,
+        name: str,
+        group: FastAPIState,
+    ) -> None:
+        """Send a snapshot of a group's store, then its changes."""
+        index = None
+        while True:
+            header: Dict[str, Any] = {"type": "view", "group": name}
+            body = b""
+            if index is None:
+                # changes published after the index are sent again, so none
+                # applied in between the two calls is missed
+                index = group.watch.index
+                header["reset"] = True
+                body = json.dumps(group.kv.snapshot()).encode()
+            else:
+                try:
+                    index, events = await group.watch.wait(
+                        index, ("kv/",), VIEW_REFRESH
+                    )
+                except GoneException:  # too far behind, send a snapshot
+                    index = None
+                    continue
+                header["changes"] = [
+                    (event.key[len("kv/") :], event.value) for event in events
+                ]
+            header["status"] = view_status(group)
+            async with lock:
+                writer.write(encode_frame(header, body))
+                await writer.drain()
+
+
+class OwnerView:
+    """
+    Keeps the key-value stores of a worker in sync with the owner.
+
+    Parameters
+    ----------
+    state : FastAPIState
+        app state of the worker, also the state of the default group
+    path : str
+        the Unix socket of the owner
+    retry : float, optional
+        seconds between connection attempts, by default 0.5
+    """
+
+    def __init__(self, state: FastAPIState, path: str, retry: float = 0.5):
+        self.state = state
+        self.path = path
+        self.retry = retry
+        self._synced: set = set()
+
+    @property
+    def ready(self) -> bool:
+        """Whether the stores of all groups were received."""
+        return len(self._synced) == len(self.state.groups)
+
+    async def run(self) -> None:
+        """Follow the owner, reconnecting forever."""
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                await asyncio.sleep(self.retry)
+                continue
+            try:
+                writer.write(encode_frame({"type": "view"}))
+                await writer.drain()
+                while True:
+                    self.apply(*await read_frame(reader))
+            except (asyncio.IncompleteReadError, ConnectionError):
+                logger.warning("lost view of the owner at %s", self.path)
+            finally:
+                self._synced.clear()  # reads go to the owner until synced
+                writer.close()
+            await asyncio.sleep(self.retry)
+
+    def apply(self, header: Dict[str, Any], body: bytes) -> None:
+        """
+        Apply a view frame of the owner.
+
+        Parameters
+        ----------
+        header : Dict[str, Any]
+            group, status and changes or `reset`
+        body : bytes
+            all keys and values of the group with `reset`
+        """
+        group = self.state.groups[header["group"]]
+        if header.get("reset"):
+            group.kv.restore(json.loads(body))
+            self._synced.add(header["group"])
+        for key, value in header.get("changes", ()):
+            if value is None:
+                group.kv.apply(KeyValueStore.command(KeyValueStore.DELETE, key))
+            else:
+                group.kv.apply(KeyValueStore.command(KeyValueStore.SET, key, value))
+        app_name, id_, role, term, vote, leader = header["status"]
+        group.status = NodeStatus(
+            app_name,
+            id_,
+            header["group"],
+            State(role) if role is not None else None,
+            term,
+            vote,
+            leader,
+        )
+
+
+class OwnerForwarder:
+    """
+    ASGI middleware of a worker, forwards requests to the owner.
+
+    Key-value reads are answered from the view once it is synced.
+
+    Parameters
+    ----------
+    app
+        the wrapped ASGI app
+    path : str
+        the Unix socket of the owner
+    view : OwnerView
+        the view of the worker
+    """
+
+    def __init__(self, app, path: str, view: OwnerView):
+        self.app = app
+        self.path = path
+        self.view = view
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or (
+            scope["method"] in ("GET", "HEAD")
+            and scope["path"].startswith(LOCAL_READS)
+            and self.view.ready
+        ):
+            await self.app(scope, receive, send)
+            return
+        try:
+            reader, writer = await asyncio.open_unix_connection(self.path)
+        except OSError as error:
+            logger.warning("owner at %s unreachable: %s", self.path, str(error))
+            await self._unavailable(scope, receive, send)
+            return
+        started = False
+
+        async def send_tracked(message: Dict[str, Any]) -> None:
+            nonlocal started
+            started = True
+            await send(message)
+
+        try:
+            await self._forward(scope, receive, send_tracked, reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            if started:
+                raise
+            logger.warning("owner at %s went away during a request", self.path)
+            await self._unavailable(scope, receive, send)
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _unavailable(scope, receive, send) -> None:
+        """Answer with 503 through the error handler of the app."""
+        # mypy problems with pydantic.dataclasses, so disabling the type check for this instance
+        error = ServiceUnavailableException(  # type: ignore
+            message="Raft owner of this node unreachable, retry."
+        )
+        response = scope["app"].exception_handlers[ApiException](Request(scope), error)
+        if asyncio.iscoroutine(response):
+            response = await response
+        await response(scope, receive, send)
+
+    @staticmethod
+    async def _forward(
+        scope,
+        receive,
+        send,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """Send the request, stream back the response."""
+        chunks = []
+        more = True
+        while more:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            more = message.get("more_body", False)
+        header = {
+            "type": "http",
+            "scope": {
+                key: scope.get(key)
+                for key in (
+                    "type",
+                    "http_version",
+                    "method",
+                    "scheme",
+                    "path",
+                    "root_path",
+                    "client",
+                    "server",
+                )
+            },
+        }
+        header["scope"]["asgi"] = {"version": "3.0"}
+        header["scope"]["raw_path"] = (scope.get("raw_path") or b"").decode("latin-1")
+        header["scope"]["query_string"] = scope["query_string"].decode("latin-1")
+        header["scope"]["headers"] = [
+            (name.decode("latin-1"), value.decode("latin-1"))
+            for name, value in scope["headers"]
+        ]
+        writer.write(encode_frame(header, b"".join(chunks)))
+        await writer.drain()
+        more = True
+        while more:
+            frame, body = await read_frame(reader)
+            if frame["type"] == "start":
+                await send(
+                    {
+                        "type": "http.response.start",
+                        "status": frame["status"],
+                        "headers": [
+                            (name.encode("latin-1"), value.encode("latin-1"))
+                            for name, value in frame["headers"]
+                        ],
+                    }
+                )
+            else:
+                more = frame["more"]
+                await send(
+                    {"type": "http.response.body", "body": body, "more_body": more}
+                )
@@ -0,0 +1,256 @@
+"""Client throughput and latency of a running cluster.
+
+Start a local cluster, see `README.md` # local-cluster, then run from the
+repository root:
+
+    python -m benchmarks.loadgen \
+        --nodes http://localhost:8001,http://localhost:8002,http://localhost:8003 \
+        --concurrency 16 --duration 30 --read-ratio 0.5 --output report.json
+
+Every worker thread sends one request at a time through its own client, and
+waits as long as a node asks with `Retry-After` when it is overloaded. The
+JSON report holds throughput and latency percentiles per operation, and
+errors and redirects by type. Compare it with the report of another commit
+with `--baseline old.json`, the exit code is 1 on a regression.
+
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Sequence
+
+from app.client import ClientError, KeyValueClient
+
+OPERATIONS = ("write", "read")
+
+
+def percentile(latencies: Sequence[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile.
+
+    Parameters
+    ----------
+    latencies : Sequence[float]
+        sorted latencies
+    fraction : float
+        e.g. 0.99 for p99
+
+    Returns
+    -------
+    float
+        the latency, 0.0 without latencies
+    """
+    if not latencies:
+        return 0.0
+    rank = max(1, int(fraction * len(latencies) + 0.999999))
+    return latencies[min(rank, len(latencies)) - 1]
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    """
+    Throughput and latency percentiles of successful requests.
+
+    Parameters
+    ----------
+    latencies : List[float]
+        latencies in seconds
+    elapsed : float
+        duration of the run in seconds
+
+    Returns
+    -------
+    Dict[str, float]
+        count, requests per second and p50, p99 and p999 in milliseconds
+    """
+    ordered = sorted(latencies)
+    return {
+        "count": len(ordered),
+        "throughput": len(ordered) / elapsed if elapsed else 0.0,
+        "p50_millis": percentile(ordered, 0.5) * 1000,
+        "p99_millis": percentile(ordered, 0.99) * 1000,
+        "p999_millis": percentile(ordered, 0.999) * 1000,
+    }
+
+
+def run(
+    nodes: Sequence[str],
+    concurrency: int,
+    duration: float,
+    read_ratio: float,
+    value_size: int,
+    keys: int,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Send writes and reads from `concurrency` threads for `duration` seconds.
+
+    Parameters
+    ----------
+    nodes : Sequence[str]
+        base URLs of the nodes
+    concurrency : int
+        number of worker threads
+    duration : float
+        seconds to send requests
+    read_ratio : float
+        share of reads, between 0 and 1
+    value_size : int
+        size of written values in characters
+    keys : int
+        number of distinct keys
+    seed : int, optional
+        seed of the key and operation choice, by default 0
+
+    Returns
+    -------
+    Dict[str, Any]
+        the report, see module docstring
+    """
+    latencies: Dict[str, List[float]] = {operation: [] for operation in OPERATIONS}
+    errors: Counter = Counter()
+    redirects: Counter = Counter()
+    lock = threading.Lock()
+    value = "x" * value_size
+    deadline = time.perf_counter() + duration
+
+    def worker(number: int) -> None:
+        rng = random.Random(seed * 1000 + number)
+        client = KeyValueClient(nodes)
+        own: Dict[str, List[float]] = {operation: [] for operation in OPERATIONS}
+        failed: Counter = Counter()
+        while time.perf_counter() < deadline:
+            operation = "read" if rng.random() < read_ratio else "write"
+            key = f"loadgen-{rng.randrange(keys)}"
+            started = time.perf_counter()
+            try:
+                if operation == "read":
+                    client.get(key)
+                else:
+                    client.put(key, value)
+            except ClientError as error:
+                failed[f"{operation}.{error.kind}"] += 1
+                if error.retry_after:
+                    time.sleep(min(error.retry_after, deadline - time.perf_counter()))
+                continue
+            own[operation].append(time.perf_counter() - started)
+        with lock:
+            for operation in OPERATIONS:
+                latencies[operation].extend(own[operation])
+            errors.update(failed)
+            redirects.update(client.redirects)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "config": {
+            "nodes": list(nodes),
+            "concurrency": concurrency,
+            "duration": duration,
+            "read_ratio": read_ratio,
+            "value_size": value_size,
+            "keys": keys,
+            "seed": seed,
+        },
+        "elapsed": elapsed,
+        "operations": {
+            operation: summarize(latencies[operation], elapsed)
+            for operation in OPERATIONS
+        },
+        "total": summarize(latencies["write"] + latencies["read"], elapsed),
+        "errors": dict(errors),
+        "redirects": dict(redirects),
+    }
+
+
+def regressions(
+    report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float
+) -> List[str]:
+    """
+    Compare a report with the report of a previous run.
+
+    Parameters
+    ----------
+    report : Dict[str, Any]
+        the new report
+    baseline : Dict[str, Any]
+        the report to compare with
+    tolerance : float
+        allowed relative change, e.g. 0.1 for 10 %
+
+    Returns
+    -------
+    List[str]
+        one line per throughput that dropped or latency that rose by more
+        than `tolerance`, empty without regression
+    """
+    found = []
+    for operation, new in report["operations"].items():
+        old = baseline.get("operations", {}).get(operation)
+        if not old or not old["count"] or not new["count"]:
+            continue
+        if new["throughput"] < old["throughput"] * (1 - tolerance):
+            found.append(
+                f"{operation} throughput {new['throughput']:.1f}/s,"
+                f" was {old['throughput']:.1f}/s"
+            )
+        for metric in ("p50_millis", "p99_millis", "p999_millis"):
+            if new[metric] > old[metric] * (1 + tolerance):
+                found.append(
+                    f"{operation} {metric} {new[metric]:.2f}, was {old[metric]:.2f}"
+                )
+    return found
+
+
+def main() -> None:
+    """Run the load, write the report and compare it with a baseline."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", required=True, help="comma separated base URLs")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--read-ratio", type=float, default=0.5)
+    parser.add_argument("--value-size", type=int, default=64)
+    parser.add_argument("--keys", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="loadgen-report.json")
+    parser.add_argument("--baseline", help="report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    report = run(
+        [node.strip() for node in args.nodes.split(",") if node.strip()],
+        args.concurrency,
+        args.duration,
+        args.read_ratio,
+        args.value_size,
+        args.keys,
+        args.seed,
+    )
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+    for operation, summary in report["operations"].items():
+        print(
+            f"{operation:>5}: {summary['throughput']:8.1f}/s"
+            f"  p50 {summary['p50_millis']:7.2f} ms"
+            f"  p99 {summary['p99_millis']:7.2f} ms"
+            f"  p999 {summary['p999_millis']:7.2f} ms"
+        )
+    print(f"errors: {report['errors']}  redirects: {report['redirects']}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline:
+            found = regressions(report, json.load(baseline), args.tolerance)
+        for line in found:
+            print(f"regression: {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
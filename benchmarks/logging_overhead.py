@@ -0,0 +1,136 @@
+"""Time a log call costs the caller, per handler setup.
+
+Run from the repository root:
+
+    python -m benchmarks.logging_overhead --threads 4 --records 20000
+
+Records are rendered with the JSON formatter of `LOGGING_CONFIG`. The output
+stream sleeps `--write-micros` per line to model a slow or blocked stdout.
+
+* `inline`: the handler renders and writes in the calling thread
+* `queue`: the caller only queues the record, see `start_queue_logging`
+* `queue+sampling`: additionally, heartbeat records are sampled
+
+"""
+
+import argparse
+import io
+import logging
+import statistics
+import threading
+import time
+from typing import Dict, List
+
+import structlog
+
+from app.config import Settings
+from app.logs import SAMPLED, SamplingFilter, start_queue_logging
+
+
+class SlowStream(io.TextIOBase):
+    """Discards lines, taking `delay` seconds for each."""
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+        self.lines = 0
+
+    def write(self, text: str) -> int:
+        self.lines += text.count("\n")
+        if self.delay:
+            time.sleep(self.delay)
+        return len(text)
+
+
+def formatter() -> logging.Formatter:
+    """The JSON formatter configured for the app."""
+    config = Settings.__fields__["LOGGING_CONFIG"].default["formatters"]["default"]
+    return structlog.stdlib.ProcessorFormatter(
+        processors=config["processors"], foreign_pre_chain=config["foreign_pre_chain"]
+    )
+
+
+def run(mode: str, threads: int, records: int, delay: float) -> Dict[str, float]:
+    """
+    Log `records` heartbeat records from each of `threads` threads.
+
+    Parameters
+    ----------
+    mode : str
+        `inline`, `queue` or `queue+sampling`
+    threads : int
+        number of logging threads
+    records : int
+        records per thread
+    delay : float
+        seconds the stream takes per line
+
+    Returns
+    -------
+    Dict[str, float]
+        caller latency percentiles in microseconds, seconds until all callers
+        returned and until all lines were written, lines written
+    """
+    stream = SlowStream(delay)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(formatter())
+    if mode == "queue+sampling":
+        handler.addFilter(SamplingFilter(1.0))
+    logger = logging.getLogger(f"benchmark.{mode}")
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    listeners = start_queue_logging(100000, [logger]) if mode != "inline" else []
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def caller() -> None:
+        own = []
+        for _ in range(records):
+            started = time.perf_counter()
+            logger.info("heartbeat / log append from %s", "node_2", extra=SAMPLED)
+            own.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(own)
+
+    workers = [threading.Thread(target=caller) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    returned = time.perf_counter() - started
+    for listener in listeners:
+        listener.stop()
+    written = time.perf_counter() - started
+    logger.handlers = []
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "p50_micros": quantiles[49] * 1e6,
+        "p99_micros": quantiles[98] * 1e6,
+        "callers_seconds": returned,
+        "written_seconds": written,
+        "lines": stream.lines,
+    }
+
+
+def main() -> None:
+    """Benchmark all modes and print one line per mode."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--write-micros", type=float, default=0.0)
+    args = parser.parse_args()
+    for mode in ("inline", "queue", "queue+sampling"):
+        result = run(mode, args.threads, args.records, args.write_micros / 1e6)
+        print(
+            f"{mode:>14}: p50 {result['p50_micros']:8.1f} us"
+            f"  p99 {result['p99_micros']:8.1f} us"
+            f"  callers {result['callers_seconds']:6.2f} s"
+            f"  written {result['written_seconds']:6.2f} s"
+            f"  lines {result['lines']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
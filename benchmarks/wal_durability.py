@@ -0,0 +1,87 @@
+"""Throughput and latency of the write-ahead log per durability mode.
+
+Run from the repository root:
+
+    python -m benchmarks.wal_durability --writers 8 --appends 500
+
+Every writer thread appends single entries, like concurrent proposals do.
+
+"""
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from app.raft.storage import WriteAheadLog
+
+
+def run(durability: str, writers: int, appends: int, size: int) -> Dict[str, float]:
+    """
+    Append `appends` entries of `size` bytes from each of `writers` threads.
+
+    Parameters
+    ----------
+    durability : str
+        durability mode of the log
+    writers : int
+        number of concurrent threads
+    appends : int
+        appends per thread
+    size : int
+        payload size in bytes
+
+    Returns
+    -------
+    Dict[str, float]
+        appends per second and latency percentiles in milliseconds
+    """
+    payload = b"x" * size
+    latencies: List[float] = []
+    lock = threading.Lock()
+    with tempfile.TemporaryDirectory() as directory:
+        log = WriteAheadLog(directory, durability)
+
+        def writer() -> None:
+            own = []
+            for _ in range(appends):
+                started = time.perf_counter()
+                log.append(1, [payload])
+                own.append(time.perf_counter() - started)
+            with lock:
+                latencies.extend(own)
+
+        threads = [threading.Thread(target=writer) for _ in range(writers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        log.close()
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "appends_per_second": len(latencies) / elapsed,
+        "p50_millis": quantiles[49] * 1000,
+        "p99_millis": quantiles[98] * 1000,
+    }
+
+
+def main() -> None:
+    """Benchmark all durability modes and print one line per mode."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--appends", type=int, default=500)
+    parser.add_argument("--size", type=int, default=128)
+    args = parser.parse_args()
+    for durability in (WriteAheadLog.ALWAYS, WriteAheadLog.GROUP, WriteAheadLog.NONE):
+        result = run(durability, args.writers, args.appends, args.size)
+        print(
+            f"{durability:>6}: {result['appends_per_second']:10.0f} appends/s"
+            f"  p50 {result['p50_millis']:7.3f} ms  p99 {result['p99_millis']:7.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
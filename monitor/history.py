@@ -0,0 +1,207 @@
+"""Bounded time-series history of node roles, terms and elections.
+
+The monitor only keeps the latest snapshot of every node in `nodes_info`. This
+module additionally records every observed sample and every derived election
+event in fixed-size ring buffers, so leadership flapping can be diagnosed after
+the fact while memory usage stays bounded no matter how long the monitor runs.
+
+"""
+
+import collections
+import threading
+from typing import Any, Deque, Dict, List, NamedTuple, Optional
+
+
+class NodeSample(NamedTuple):
+    """Role and term of a single node at a point in time."""
+
+    timestamp: float
+    node: str
+    state: str
+    term: int
+
+
+class ElectionEvent(NamedTuple):
+    """A change of the cluster leadership derived from node samples."""
+
+    timestamp: float
+    kind: str
+    term: int
+    leader: Optional[str]
+    previous_leader: Optional[str]
+    failover_seconds: Optional[float]
+
+
+class ClusterHistory:
+    """
+    Records node samples and election events in fixed-capacity ring buffers.
+
+    Once a buffer is full, the oldest entries are dropped. The leader is
+    derived from the samples: it is the node reporting the `LEADER` role with
+    the highest term.
+    """
+
+    LEADER_ELECTED = "LEADER_ELECTED"
+    LEADER_LOST = "LEADER_LOST"
+    TERM_CHANGED = "TERM_CHANGED"
+
+    def __init__(self, max_samples: int, max_events: int):
+        self._lock = threading.Lock()
+        self._samples: Deque[NodeSample] = collections.deque(maxlen=max_samples)
+        self._events: Deque[ElectionEvent] = collections.deque(maxlen=max_events)
+        self._leader: Optional[str] = None
+        self._leader_lost_at: Optional[float] = None
+        self._leader_seen_at: Optional[float] = None  # last sample as leader
+        self._term = 0
+        self._view: Dict[str, NodeSample] = {}
+
+    def record(self, timestamp: float, nodes: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Record a snapshot of all nodes and derive election events from it.
+
+        Parameters
+        ----------
+        timestamp : float
+            unix time at which the snapshot was taken
+        nodes : Dict[str, Dict[str, Any]]
+            status of every node as returned by its status endpoint
+        """
+        samples = [self._sample(timestamp, info) for info in nodes.values()]
+        with self._lock:
+            self._view = {sample.node: sample for sample in samples}
+            self._samples.extend(samples)
+            self._derive(timestamp)
+
+    def record_node(self, timestamp: float, info: Dict[str, Any]) -> None:
+        """
+        Record the status of a single node, e.g. one pushed by the node itself.
+
+        Parameters
+        ----------
+        timestamp : float
+            unix time at which the node changed its status
+        info : Dict[str, Any]
+            status of the node
+        """
+        sample = self._sample(timestamp, info)
+        with self._lock:
+            self._view[sample.node] = sample
+            self._samples.append(sample)
+            self._derive(timestamp)
+
+    def forget(self, timestamp: float, node: str) -> None:
+        """
+        Remove a node that stopped reporting, e.g. a crashed leader.
+
+        Parameters
+        ----------
+        timestamp : float
+            unix time at which the node was lost
+        node : str
+            app name of the node
+        """
+        with self._lock:
+            if self._view.pop(node, None) is not None:
+                self._derive(timestamp)
+
+    @staticmethod
+    def _sample(timestamp: float, info: Dict[str, Any]) -> NodeSample:
+        return NodeSample(timestamp, info["app_name"], info["state"], int(info["term"]))
+
+    def _derive(self, timestamp: float) -> None:
+        """Emit events for the current view of all nodes. Needs `_lock`."""
+        samples = self._view.values()
+        leaders = [sample for sample in samples if sample.state == "LEADER"]
+        leader = max(leaders, key=lambda sample: sample.term) if leaders else None
+        term = max((sample.term for sample in samples), default=self._term)
+        if term > self._term:
+            self._events.append(
+                ElectionEvent(timestamp, self.TERM_CHANGED, term, None, None, None)
+            )
+            self._term = term
+        self._update_leader(
+            timestamp,
+            leader.node if leader else None,
+            leader.term if leader else term,
+        )
+
+    def _update_leader(self, timestamp: float, leader: Optional[str], term: int):
+        """Emit leader events if the derived leader changed. Needs `_lock`."""
+        if leader == self._leader:
+            if leader is not None:
+                self._leader_seen_at = timestamp
+            return
+        previous = self._leader
+        if previous is not None:
+            self._events.append(
+                ElectionEvent(timestamp, self.LEADER_LOST, term, None, previous, None)
+            )
+            # replaced between two samples, it was lost after it was last seen
+            self._leader_lost_at = timestamp if leader is None else self._leader_seen_at
+        if leader is not None:
+            failover = None
+            if self._leader_lost_at is not None:
+                failover = timestamp - self._leader_lost_at
+            self._events.append(
+                ElectionEvent(
+                    timestamp, self.LEADER_ELECTED, term, leader, previous, failover
+                )
+            )
+            self._leader_lost_at = None
+            self._leader_seen_at = timestamp
+        self._leader = leader
+
+    def query(self, since: float) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Return all samples and events recorded at or after `since`.
+
+        Parameters
+        ----------
+        since : float
+            unix time of the oldest entry to return
+
+        Returns
+        -------
+        Dict[str, List[Dict[str, Any]]]
+            samples and events, oldest first
+        """
+        with self._lock:
+            samples = [s._asdict() for s in self._samples if s.timestamp >= since]
+            events = [e._asdict() for e in self._events if e.timestamp >= since]
+        return {"samples": samples, "events": events}
+
+    def stats(self, since: float, until: float) -> Dict[str, Any]:
+        """
+        Aggregate the election events between `since` and `until`.
+
+        Parameters
+        ----------
+        since : float
+            unix time at which the window starts
+        until : float
+            unix time at which the window ends
+
+        Returns
+        -------
+        Dict[str, Any]
+            leader changes per hour, mean failover time and event counts
+        """
+        with self._lock:
+            events = [e for e in self._events if since <= e.timestamp <= until]
+            leader, term = self._leader, self._term
+        elected = [e for e in events if e.kind == self.LEADER_ELECTED]
+        failovers = [
+            e.failover_seconds for e in elected if e.failover_seconds is not None
+        ]
+        hours = max(until - since, 1.0) / 3600
+        return {
+            "window_seconds": until - since,
+            "leader_changes": len(elected),
+            "leader_changes_per_hour": len(elected) / hours,
+            "term_changes": sum(1 for e in events if e.kind == self.TERM_CHANGED),
+            "mean_failover_seconds": (
+                sum(failovers) / len(failovers) if failovers else None
+            ),
+            "current_leader": leader,
+            "current_term": term,
+        }
@@ -2,7 +2,10 @@
 
 The monitor.main module is a small FastAPI app, that periodically aggregates
 status information on all nodes in the cluster by calling their status
-endpoints.
+endpoints. Nodes configured with `MONITOR_URL` additionally push their status
+changes to the ingest endpoint, in that case polling can be disabled. Both
+keep the nodes by their id. A node that stopped pushing for
+`NODE_TIMEOUT_MILLIS` is dropped, so the loss of a crashed leader is noticed.
 
 A static webpage is then served, which refreshes itself every 1 second and
 displays the cluster status.
@@ -12,6 +15,7 @@ displays the cluster status.
 import logging
 import sys
 import threading
+import time
 
 import dns
 import requests
@@ -19,7 +23,9 @@ from fastapi import FastAPI, Request
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseSettings
 
+from app.api.v1.models import RaftStatusBatchSchema
 from app.raft.discovery import discover_by_dns, get_hostname_by_ip
+from monitor.history import ClusterHistory
 
 
 class Settings(BaseSettings):
@@ -30,6 +36,10 @@ class Settings(BaseSettings):
     BIND_PORT: str
     TEMPLATES_DIR: str
     REFRESH_RATE_MILLIS: int
+    HISTORY_MAX_SAMPLES: int = 50000
+    HISTORY_MAX_EVENTS: int = 5000
+    POLL_NODES: bool = True
+    NODE_TIMEOUT_MILLIS: int = 3000
 
     # set by docker
     HOSTNAME: str
@@ -50,7 +60,16 @@ logging.basicConfig(
     format="%(message)s", stream=sys.stdout, encoding="utf-8", level="DEBUG"
 )
 
-nodes_info = {}
+nodes_info = {
+    "monitor": {
+        "id": settings.HOSTNAME,
+        "app_name": "monitor",
+        "term": "-",
+        "state": "-",
+    }
+}
+history = ClusterHistory(settings.HISTORY_MAX_SAMPLES, settings.HISTORY_MAX_EVENTS)
+last_pushed = {}  # unix time of the last push, by node id
 
 
 def update_node_info(node_info: dict) -> None:
@@ -81,7 +100,8 @@ def update_node_info(node_info: dict) -> None:
     for replica, _ in services.items():
         try:
             response = requests.get(f"http://{replica}/api/v1/raft/", timeout=0.5)
-            node_info_new[replica] = response.json()["data"]
+            data = response.json()["data"]
+            node_info_new[data["id"]] = data
             logging.debug(
                 "response from node %s, status %s", replica, response.status_code
             )
@@ -91,12 +111,58 @@ def update_node_info(node_info: dict) -> None:
 
     node_info.clear()
     node_info.update(dict(sorted(node_info_new.items())))
+    history.record(
+        time.time(), {k: v for k, v in node_info_new.items() if k != "monitor"}
+    )
 
 
-thread = RepeatTimer(
-    settings.REFRESH_RATE_MILLIS / 1000, update_node_info, [nodes_info]
-)
-thread.start()
+def expire_nodes(node_info: dict) -> None:
+    """Drop nodes that stopped pushing their status
+
+    Parameters
+    ----------
+    node_info : dict
+        Dict to be updated
+    """
+    now = time.time()
+    for node_id, pushed in list(last_pushed.items()):
+        if now - pushed > settings.NODE_TIMEOUT_MILLIS / 1000:
+            del last_pushed[node_id]
+            info = node_info.pop(node_id, None)
+            if info is not None:
+                # lost after its last push, the history derives a lost leader
+                history.forget(pushed, info["app_name"])
+
+
+if settings.POLL_NODES:
+    thread = RepeatTimer(
+        settings.REFRESH_RATE_MILLIS / 1000, update_node_info, [nodes_info]
+    )
+    thread.start()
+expiry = RepeatTimer(settings.REFRESH_RATE_MILLIS / 1000, expire_nodes, [nodes_info])
+expiry.start()
+
+
+@app.post("/ingest")
+async def ingest(batch: RaftStatusBatchSchema):
+    """Receive a batch of status changes pushed by a node.
+
+    Parameters
+    ----------
+    batch : RaftStatusBatchSchema
+        status changes, oldest first
+
+    Returns
+    -------
+    Dict[str, int]
+        number of accepted events
+    """
+    for event in sorted(batch.events, key=lambda event: event.timestamp):
+        info = event.dict(exclude={"timestamp", "leader"})
+        nodes_info[event.id] = info
+        last_pushed[event.id] = max(event.timestamp, last_pushed.get(event.id, 0))
+        history.record_node(event.timestamp, info)
+    return {"accepted": len(batch.events)}
 
 
 @app.get("/nodes")
@@ -111,6 +177,41 @@ async def nodes():
     return {"nodes": list(nodes_info.values())}
 
 
+@app.get("/history")
+async def get_history(minutes: float = 5):
+    """Serve recorded node samples and election events.
+
+    Parameters
+    ----------
+    minutes : float
+        how far back in time to look, by default 5
+
+    Returns
+    -------
+    Dict[str, Any]
+        samples and events of the last `minutes` minutes, oldest first
+    """
+    return history.query(time.time() - minutes * 60)
+
+
+@app.get("/history/stats")
+async def get_history_stats(minutes: float = 60):
+    """Serve aggregates over the recorded election events.
+
+    Parameters
+    ----------
+    minutes : float
+        how far back in time to look, by default 60
+
+    Returns
+    -------
+    Dict[str, Any]
+        leader changes per hour, mean failover time and event counts
+    """
+    now = time.time()
+    return history.stats(now - minutes * 60, now)
+
+
 @app.get("/")
 async def root(request: Request):
     """Serve a small webpage displaying status information
@@ -0,0 +1,47 @@
+import pytest
+
+
+class TestAdmissionControl:
+    """Test the bounds of pending and uncommitted proposals."""
+
+    @pytest.mark.asyncio
+    async def test_pending_limit(self):
+        # setup
+        from app.api.exceptions import TooManyRequestsException
+        from app.raft.admission import AdmissionControl
+        from app.raft.metrics import Metrics
+
+        metrics = Metrics()
+        admission = AdmissionControl(2, 0, retry_after=0.2, metrics=metrics)
+
+        # execution
+        with admission.admit(), admission.admit():
+            with pytest.raises(TooManyRequestsException) as rejected:
+                admission.admit()
+        with admission.admit():
+            pending = admission.pending
+
+        # test
+        assert rejected.value.status_code == 429
+        assert rejected.value.headers == {"Retry-After": "1"}
+        assert (pending, admission.pending) == (1, 0)
+        assert metrics.snapshot()["counters"] == {"rejected_proposals_pending": 1}
+
+    @pytest.mark.asyncio
+    async def test_uncommitted_limit(self):
+        # setup
+        from app.api.exceptions import ServiceUnavailableException
+        from app.raft.admission import AdmissionControl
+
+        admission = AdmissionControl(0, 100, retry_after=2.5)
+        unbounded = AdmissionControl(0, 0)
+
+        # execution
+        admission.check_uncommitted(99)
+        unbounded.check_uncommitted(10**9)
+        with pytest.raises(ServiceUnavailableException) as rejected:
+            admission.check_uncommitted(100)
+
+        # test
+        assert rejected.value.status_code == 503
+        assert rejected.value.headers == {"Retry-After": "3"}
@@ -0,0 +1,143 @@
+from unittest import mock
+
+import pytest
+import requests
+
+
+def response(status_code: int, body: dict, headers: dict = None) -> mock.Mock:
+    answer = mock.Mock(status_code=status_code, text="", headers=headers or {})
+    answer.json.return_value = body
+    return answer
+
+
+class TestKeyValueClient:
+    """Test the client and the report of the load generator."""
+
+    @pytest.mark.asyncio
+    async def test_write_moves_on_to_leader(self):
+        # setup
+        from app.client import KeyValueClient
+
+        session = mock.Mock()
+        session.request.side_effect = [
+            requests.ConnectionError("refused"),
+            response(421, {"error": {"message": "This node is not the leader."}}),
+            response(200, {"data": {"key": "a", "value": 1, "index": 7}}),
+            response(200, {"data": {"key": "a", "value": 2, "index": 8}}),
+        ]
+        client = KeyValueClient(
+            ["http://n1", "http://n2/", "http://n3"], session=session
+        )
+
+        # execution
+        first = client.put("a", 1)
+        second = client.put("a", 2)
+
+        # test
+        assert first["index"] == 7 and second["index"] == 8
+        assert client.redirects == {"CONNECTION": 1, "MISDIRECTED_REQUEST": 1}
+        params = [call.kwargs["params"] for call in session.request.call_args_list]
+        assert [param["sequence"] for param in params] == [1, 1, 1, 2]
+        assert {param["session"] for param in params} == {client.session_id}
+        urls = [call.args[1] for call in session.request.call_args_list]
+        assert urls == [
+            "http://n1/api/v1/kv/a",
+            "http://n2/api/v1/kv/a",
+            "http://n3/api/v1/kv/a",
+            "http://n3/api/v1/kv/a",
+        ]
+
+    @pytest.mark.asyncio
+    async def test_write_follows_leader_hint(self):
+        # setup
+        from app.client import KeyValueClient
+        from app.raft.forwarding import LEADER_HEADER
+
+        session = mock.Mock()
+        session.request.side_effect = [
+            response(
+                421,
+                {"error": {"message": "Not the leader.", "details": {"leader": "n3"}}},
+            ),
+            response(200, {"data": {"index": 7}}),
+            response(200, {"data": {"index": 8}}, {LEADER_HEADER: "n2"}),
+            response(200, {"data": {"index": 9}}),
+        ]
+        client = KeyValueClient(
+            ["http://n1", "http://n2", "http://n3"], session=session
+        )
+
+        # execution
+        client.put("a", 1)  # redirected to the leader n3
+        client._current = 0  # e.g. a new client
+        client.put("a", 2)  # forwarded by n1 to the new leader n2
+        client.put("a", 3)
+
+        # test
+        urls = [call.args[1] for call in session.request.call_args_list]
+        assert urls == [
+            "http://n1/api/v1/kv/a",
+            "http://n3/api/v1/kv/a",
+            "http://n1/api/v1/kv/a",
+            "http://n2/api/v1/kv/a",
+        ]
+
+    @pytest.mark.asyncio
+    async def test_errors(self):
+        # setup
+        from app.client import ClientError, KeyValueClient
+
+        session = mock.Mock()
+        session.request.side_effect = [
+            response(404, {"error": {"message": "Key a not found."}}),
+            response(503, {"error": {"message": "Write to a not committed."}}),
+            response(
+                429, {"error": {"message": "1 writes pending."}}, {"Retry-After": "2"}
+            ),
+            requests.Timeout("slow"),
+            requests.Timeout("slow"),
+        ]
+        client = KeyValueClient(["http://n1", "http://n2"], session=session)
+
+        # execution
+        missing = client.get("a")
+        with pytest.raises(ClientError) as unavailable:
+            client.put("a", 1)
+        with pytest.raises(ClientError) as overloaded:
+            client.put("a", 1)
+        with pytest.raises(ClientError) as timeout:
+            client.delete("a")
+
+        # test
+        assert missing is None
+        assert unavailable.value.kind == "SERVICE_UNAVAILABLE"
+        assert unavailable.value.status_code == 503
+        assert unavailable.value.retry_after is None
+        assert overloaded.value.kind == "TOO_MANY_REQUESTS"
+        assert overloaded.value.retry_after == 2.0
+        assert timeout.value.kind == "TIMEOUT"
+        assert timeout.value.status_code is None
+
+    @pytest.mark.asyncio
+    async def test_report(self):
+        # setup
+        from benchmarks.loadgen import percentile, regressions, summarize
+
+        latencies = [n / 1000 for n in range(1000, 0, -1)]
+
+        # execution
+        summary = summarize(latencies, 2.0)
+        baseline = {"operations": {"write": summary}}
+        slower = {"operations": {"write": dict(summary, p99_millis=1500.0)}}
+
+        # test
+        assert percentile([], 0.5) == 0.0
+        assert summary["count"] == 1000
+        assert summary["throughput"] == 500.0
+        assert summary["p50_millis"] == pytest.approx(500.0)
+        assert summary["p99_millis"] == pytest.approx(990.0)
+        assert summary["p999_millis"] == pytest.approx(999.0)
+        assert regressions(baseline, baseline, 0.1) == []
+        assert regressions(slower, baseline, 0.1) == [
+            "write p99_millis 1500.00, was 990.00"
+        ]
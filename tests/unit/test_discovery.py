@@ -122,3 +122,19 @@ class TestDNSDiscovery:
         mock_get_ip.assert_called_once_with(hostname)
         mock_get_hostname.assert_called()
         mock_discover.assert_called_once_with(app_name)
+
+    @pytest.mark.asyncio
+    async def test_static_replicas(self):
+        # setup
+        peers = "localhost:8001, localhost:8002,localhost:8003,"
+
+        # execution
+        from app.raft.discovery import static_replicas
+
+        got = static_replicas(peers, "localhost:8002")
+
+        # test
+        assert got == {
+            "localhost:8001": "localhost:8001",
+            "localhost:8003": "localhost:8003",
+        }
@@ -0,0 +1,95 @@
+from unittest import mock
+
+import pytest
+import requests
+
+
+class TestForwarding:
+    """Test forwarding writes from a follower to the leader."""
+
+    @pytest.mark.asyncio
+    async def test_forward(self):
+        # setup
+        from app.raft.forwarding import FORWARDED_HEADER, LeaderForwarder
+
+        forwarder = LeaderForwarder("node_2", pool_size=4)
+        forwarder.session = mock.Mock()
+
+        # execution
+        forwarder.forward(
+            "node_1",
+            "PUT",
+            "/api/v1/kv/a",
+            {"sequence": "1"},
+            b'{"value": 1}',
+            "application/json",
+            2.0,
+        )
+
+        # test
+        forwarder.session.request.assert_called_once_with(
+            "PUT",
+            "http://node_1/api/v1/kv/a",
+            params={"sequence": "1"},
+            data=b'{"value": 1}',
+            headers={
+                FORWARDED_HEADER: "node_2",
+                "Content-Type": "application/json",
+            },
+            timeout=2.0,
+        )
+
+    @pytest.mark.asyncio
+    async def test_forward_write(self):
+        # setup
+        import httpx
+        from fastapi import FastAPI, Request
+        from starlette.responses import JSONResponse
+
+        from app.api.v1.kv_endpoints import forward_write
+        from app.raft.forwarding import FORWARDED_HEADER, LEADER_HEADER
+        from app.raft.functions import State
+
+        app = FastAPI()
+        app.state.app_name = app.state.id = "node_2"
+        app.state.state = State.FOLLOWER
+        app.state.term = 3
+        app.state.leader = "node_1"
+        app.state.groups = {"default": app.state}
+        app.state.forwarder = mock.Mock()
+        answer = mock.Mock(status_code=200, content=b'{"data": {"index": 7}}')
+        answer.headers = {"content-type": "application/json"}
+        app.state.forwarder.forward.side_effect = [
+            answer,
+            requests.ConnectionError("refused"),
+        ]
+
+        @app.put("/api/v1/kv/{key}")
+        async def put(request: Request, key: str):
+            forwarded = await forward_write(request, key, 1.0)
+            return forwarded or JSONResponse({"local": True})
+
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://node_2"
+        )
+
+        # execution
+        written = await client.put("/api/v1/kv/a?sequence=1", json={"value": 1})
+        unreachable = await client.put("/api/v1/kv/a", json={"value": 1})
+        looped = await client.put(
+            "/api/v1/kv/a", json={"value": 1}, headers={FORWARDED_HEADER: "node_3"}
+        )
+        app.state.state = State.LEADER
+        leader = await client.put("/api/v1/kv/a", json={"value": 1})
+
+        # test
+        assert written.status_code == 200
+        assert written.json() == {"data": {"index": 7}}
+        assert written.headers[LEADER_HEADER] == "node_1"
+        args = app.state.forwarder.forward.call_args_list[0].args
+        assert args[:4] == ("node_1", "PUT", "/api/v1/kv/a", {"sequence": "1"})
+        assert args[6] == 2.0
+        assert unreachable.json() == {"local": True}
+        assert looped.json() == {"local": True}
+        assert leader.json() == {"local": True}
+        assert app.state.forwarder.forward.call_count == 2
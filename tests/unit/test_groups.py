@@ -0,0 +1,114 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+from fastapi.applications import State as FastAPIState
+
+
+class TestGroups:
+    """Test resolving Raft groups and sharding keys over them."""
+
+    @pytest.mark.asyncio
+    async def test_resolve_group(self):
+        # setup
+        from app.api.exceptions import NotFoundException
+        from app.raft.groups import resolve_group
+
+        node = FastAPIState()
+        other = FastAPIState()
+        node.groups = {"default": node, "orders": other}
+
+        # execute / test
+        assert resolve_group(node, None) is node
+        assert resolve_group(node, "default") is node
+        assert resolve_group(node, "orders") is other
+        with pytest.raises(NotFoundException):
+            resolve_group(node, "missing")
+
+    @pytest.mark.asyncio
+    async def test_group_for_key(self):
+        # setup
+        from app.raft.groups import group_for_key
+
+        node = FastAPIState()
+        node.groups = {name: FastAPIState() for name in ("default", "a", "b")}
+
+        # execute
+        got = {group_for_key(node, f"lock-{i}") for i in range(100)}
+
+        # test
+        assert len(got) == 3  # all groups are used
+        assert group_for_key(node, "db") is group_for_key(node, "db")
+
+
+class TestHeartbeatCoalescer:
+    """Test batching heartbeats of several groups to the same peer."""
+
+    @pytest.mark.asyncio
+    @mock.patch("app.raft.groups.requests.post")
+    async def test_single_heartbeat(self, mock_post: mock.Mock):
+        # setup
+        from app.raft.groups import HeartbeatCoalescer
+
+        mock_post.return_value = mock.Mock(status_code=200)
+        mock_post.return_value.json.return_value = {"data": {"term": 1}}
+        coalescer = HeartbeatCoalescer(linger=0.001)
+
+        # execute
+        got = coalescer.send("node_2", {"term": 1})
+
+        # test
+        assert got.status_code == 200
+        assert got.json() == {"data": {"term": 1}}
+        assert mock_post.call_args.args[0] == "http://node_2/api/v1/raft/log"
+
+    @pytest.mark.asyncio
+    @mock.patch("app.raft.groups.requests.post")
+    async def test_batch(self, mock_post: mock.Mock):
+        # setup
+        from app.raft.groups import HeartbeatCoalescer
+
+        mock_post.return_value = mock.Mock(status_code=200)
+        mock_post.return_value.json.return_value = {
+            "data": [
+                {"status_code": 200, "data": {"group": "a"}},
+                {"status_code": 400, "error": {"term": 7}},
+            ]
+        }
+        coalescer = HeartbeatCoalescer(linger=0.2)
+        got = {}
+
+        def send(group: str) -> None:
+            got[group] = coalescer.send("node_2", {"group": group})
+
+        # execute
+        first = threading.Thread(target=send, args=("a",))
+        first.start()
+        while not coalescer._pending:  # make sure "a" is queued first
+            time.sleep(0.001)
+        send("b")
+        first.join()
+
+        # test
+        mock_post.assert_called_once()
+        assert mock_post.call_args.args[0] == "http://node_2/api/v1/raft/log/batch"
+        assert mock_post.call_args.kwargs["json"] == {
+            "messages": [{"group": "a"}, {"group": "b"}]
+        }
+        assert got["a"].status_code == 200
+        assert got["b"].json()["error"]["term"] == 7
+
+    @pytest.mark.asyncio
+    @mock.patch("app.raft.groups.requests.post")
+    async def test_unreachable(self, mock_post: mock.Mock):
+        # setup
+        import requests
+        from app.raft.groups import HeartbeatCoalescer
+
+        mock_post.side_effect = requests.ConnectionError("down")
+        coalescer = HeartbeatCoalescer(linger=0.001)
+
+        # execute / test
+        with pytest.raises(requests.RequestException):
+            coalescer.send("node_2", {"term": 1})
@@ -0,0 +1,104 @@
+from unittest import mock
+import pytest
+
+
+class TestLeaseTable:
+    """Test granting, renewing and expiring leases."""
+
+    @pytest.mark.asyncio
+    async def test_acquire_conflict(self):
+        # setup
+        from app.api.exceptions import ConflictException
+        from app.raft.leases import LeaseTable
+
+        leases = LeaseTable(clock=mock.Mock(return_value=0.0))
+
+        # execution
+        lease = leases.acquire("db", "worker-1", 10)
+
+        # test
+        assert lease.owner == "worker-1"
+        assert lease.deadline == 10
+        assert leases.acquire("db", "worker-1", 10).lease_id == lease.lease_id
+        with pytest.raises(ConflictException):
+            leases.acquire("db", "worker-2", 10)
+
+    @pytest.mark.asyncio
+    async def test_expire_in_deadline_order(self):
+        # setup
+        from app.raft.leases import LeaseTable
+
+        clock = mock.Mock(return_value=0.0)
+        leases = LeaseTable(clock=clock)
+        leases.acquire("a", "worker-1", 5)
+        b = leases.acquire("b", "worker-1", 1)
+        leases.acquire("c", "worker-1", 3)
+        clock.return_value = 0.5
+        leases.renew("b", b.lease_id)  # now expires at 1.5
+
+        # execution
+        clock.return_value = 4.0
+        got = leases.expire()
+
+        # test
+        assert got == ["b", "c"]
+        assert leases.get("a") is not None
+        assert leases.get("b") is None
+
+    @pytest.mark.asyncio
+    async def test_release(self):
+        # setup
+        from app.api.exceptions import NotFoundException
+        from app.raft.leases import LeaseTable
+
+        leases = LeaseTable()
+        lease = leases.acquire("db", "worker-1", 10)
+
+        # execution
+        leases.release("db", lease.lease_id)
+
+        # test
+        assert leases.get("db") is None
+        assert leases.name_revision("db") == 2
+        with pytest.raises(NotFoundException):
+            leases.release("db", lease.lease_id)
+
+    @pytest.mark.asyncio
+    async def test_snapshot_restore(self):
+        # setup
+        from app.raft.leases import LeaseTable
+
+        leader = LeaseTable(clock=mock.Mock(return_value=100.0))
+        follower = LeaseTable(clock=mock.Mock(return_value=7.0))
+        leader.acquire("a", "worker-1", 5)
+        leader.acquire("b", "worker-2", 5)
+        follower.restore(leader.snapshot())
+        leader.release("a", leader.get("a").lease_id)
+
+        # execution
+        follower.restore(leader.snapshot())
+
+        # test
+        assert follower.get("a") is None
+        assert follower.get("b").owner == "worker-2"
+        assert follower.get("b").deadline == 12.0
+        assert follower.revision == leader.revision
+        assert follower.name_revision("a") == leader.name_revision("a")
+
+    @pytest.mark.asyncio
+    async def test_on_change(self):
+        # setup
+        from app.raft.leases import LeaseTable
+
+        clock = mock.Mock(return_value=0.0)
+        on_change = mock.Mock()
+        leases = LeaseTable(clock=clock, on_change=on_change)
+
+        # execution
+        leases.acquire("db", "worker-1", 1)
+        clock.return_value = 2.0
+        leases.expire()
+
+        # test
+        assert on_change.call_args_list[0].args[1].owner == "worker-1"
+        assert on_change.call_args_list[1].args == ("db", None)
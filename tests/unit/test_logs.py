@@ -0,0 +1,120 @@
+import io
+import logging
+import queue
+from unittest import mock
+
+import pytest
+
+
+def make_record(
+    msg: str, name: str = "app.raft", args=(), **extra
+) -> logging.LogRecord:
+    record = logging.LogRecord(name, logging.INFO, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestLogging:
+    """Test sampling and queued logging."""
+
+    @pytest.mark.asyncio
+    @mock.patch("app.logs.time.monotonic")
+    async def test_sampling(self, mock_monotonic: mock.Mock):
+        # setup
+        from app.logs import SamplingFilter
+
+        mock_monotonic.return_value = 100.0
+        sampling = SamplingFilter(per_second=2)
+        heartbeat = "heartbeat / log append from %s"
+
+        # execution
+        first = [
+            sampling.filter(make_record(heartbeat, sampled=True)) for _ in range(5)
+        ]
+        other = sampling.filter(make_record("reject outdated term", sampled=True))
+        unmarked = [sampling.filter(make_record(heartbeat)) for _ in range(5)]
+        mock_monotonic.return_value = 101.0
+        later = make_record(heartbeat, sampled=True)
+        passed = sampling.filter(later)
+
+        # test
+        assert first == [True, True, False, False, False]
+        assert other is True
+        assert all(unmarked)
+        assert passed is True
+        assert later.suppressed == 3
+
+    @pytest.mark.asyncio
+    async def test_sampling_access_log(self):
+        # setup
+        from app.logs import SamplingFilter
+
+        sampling = SamplingFilter(per_second=1)
+        access = '%s - "%s %s HTTP/%s" %d'
+
+        def request(path: str) -> logging.LogRecord:
+            args = ("127.0.0.1:5000", "POST", path, "1.1", 200)
+            return make_record(access, "uvicorn.access", args)
+
+        # execution
+        heartbeats = [sampling.filter(request("/api/v1/raft/log")) for _ in range(3)]
+        batch = sampling.filter(request("/api/v1/raft/log/batch?group=a"))
+        writes = [sampling.filter(request("/api/v1/kv/a")) for _ in range(3)]
+
+        # test
+        assert heartbeats == [True, False, False]
+        assert batch is True
+        assert all(writes)
+
+    @pytest.mark.asyncio
+    async def test_queue_full(self):
+        # setup
+        from app.logs import DroppingQueueHandler
+
+        handler = DroppingQueueHandler(queue.Queue(2))
+
+        # execution
+        for number in range(4):
+            handler.handle(make_record(f"record {number}"))
+        handler.queue.get_nowait()
+        handler.queue.get_nowait()
+        handler.handle(make_record("record 4"))
+
+        # test
+        assert handler.queue.get_nowait().getMessage() == "record 4"
+        warning = handler.queue.get_nowait()
+        assert warning.getMessage() == "dropped 2 log records, queue full"
+        assert warning.levelno == logging.WARNING
+        assert handler.dropped == 0
+
+    @pytest.mark.asyncio
+    async def test_start_queue_logging(self, tmp_path):
+        # setup
+        from app.logs import SamplingFilter, start_queue_logging
+        from app.raft.tracing import Tracer
+
+        stream = io.StringIO()
+        target = logging.StreamHandler(stream)
+        target.setFormatter(logging.Formatter("%(message)s %(trace_id)s"))
+        sampling = SamplingFilter()
+        target.addFilter(sampling)
+        logger = logging.getLogger("test_start_queue_logging")
+        logger.handlers = [target]
+        logger.propagate = False
+        tracer = Tracer("node_1", str(tmp_path / "spans.jsonl"))
+
+        # execution
+        listeners = start_queue_logging(10, [logger])
+        with tracer.span("heartbeat round") as span:
+            logger.warning("sent to %s", "node_2")
+        queued = logger.handlers
+        for listener in listeners:
+            listener.stop()
+        logger.handlers = []
+        tracer.close()
+
+        # test
+        assert queued[0] is not target
+        assert queued[0].filters == [sampling]
+        assert target.filters == []
+        assert stream.getvalue() == f"sent to node_2 {span.context.trace_id}\n"
@@ -0,0 +1,148 @@
+import pytest
+
+
+def node(app_name: str, state: str, term: int) -> dict:
+    return {"app_name": app_name, "id": app_name, "state": state, "term": term}
+
+
+class TestClusterHistory:
+    """Test the bounded election history of the monitor."""
+
+    @pytest.mark.asyncio
+    async def test_ring_buffer_is_bounded(self):
+        # setup
+        from monitor.history import ClusterHistory
+
+        history = ClusterHistory(max_samples=4, max_events=2)
+
+        # execution
+        for second in range(10):
+            history.record(
+                float(second),
+                {"a": node("a", "FOLLOWER", second), "b": node("b", "LEADER", second)},
+            )
+
+        # test
+        got = history.query(0.0)
+        assert len(got["samples"]) == 4
+        assert len(got["events"]) == 2
+        assert got["samples"][0]["timestamp"] == 8.0
+
+    @pytest.mark.asyncio
+    async def test_leader_change_and_failover(self):
+        # setup
+        from monitor.history import ClusterHistory
+
+        history = ClusterHistory(max_samples=100, max_events=100)
+
+        # execution
+        history.record(
+            0.0, {"a": node("a", "LEADER", 1), "b": node("b", "FOLLOWER", 1)}
+        )
+        history.record(
+            1.0, {"a": node("a", "FOLLOWER", 1), "b": node("b", "FOLLOWER", 1)}
+        )
+        history.record(
+            4.0, {"a": node("a", "FOLLOWER", 2), "b": node("b", "LEADER", 2)}
+        )
+
+        # test
+        kinds = [event["kind"] for event in history.query(0.0)["events"]]
+        assert kinds == [
+            "TERM_CHANGED",
+            "LEADER_ELECTED",
+            "LEADER_LOST",
+            "TERM_CHANGED",
+            "LEADER_ELECTED",
+        ]
+        stats = history.stats(0.0, 3600.0)
+        assert stats["leader_changes"] == 2
+        assert stats["leader_changes_per_hour"] == 2
+        assert stats["mean_failover_seconds"] == 3.0
+        assert stats["current_leader"] == "b"
+        assert stats["current_term"] == 2
+
+    @pytest.mark.asyncio
+    async def test_failover_between_samples(self):
+        # setup
+        from monitor.history import ClusterHistory
+
+        history = ClusterHistory(max_samples=100, max_events=100)
+
+        # execution
+        history.record(
+            0.0, {"a": node("a", "LEADER", 1), "b": node("b", "FOLLOWER", 1)}
+        )
+        history.record(
+            1.0, {"a": node("a", "LEADER", 1), "b": node("b", "FOLLOWER", 1)}
+        )
+        history.record(
+            3.0, {"a": node("a", "FOLLOWER", 2), "b": node("b", "LEADER", 2)}
+        )
+
+        # test
+        events = history.query(0.0)["events"]
+        assert [event["kind"] for event in events][-2:] == [
+            "LEADER_LOST",
+            "LEADER_ELECTED",
+        ]
+        assert events[-1]["failover_seconds"] == 2.0  # since a was last seen
+        assert history.stats(0.0, 3600.0)["mean_failover_seconds"] == 2.0
+
+    @pytest.mark.asyncio
+    async def test_forget_silent_leader(self):
+        # setup
+        from monitor.history import ClusterHistory
+
+        history = ClusterHistory(max_samples=100, max_events=100)
+        history.record_node(0.0, node("a", "LEADER", 1))
+        history.record_node(0.0, node("b", "FOLLOWER", 1))
+
+        # execution
+        history.forget(1.0, "a")  # stopped pushing after 1.0
+        history.record_node(4.0, node("b", "LEADER", 2))
+
+        # test
+        events = history.query(0.0)["events"]
+        assert [event["kind"] for event in events][-3:] == [
+            "LEADER_LOST",
+            "TERM_CHANGED",
+            "LEADER_ELECTED",
+        ]
+        assert events[-1]["failover_seconds"] == 3.0
+
+    @pytest.mark.asyncio
+    async def test_query_window(self):
+        # setup
+        from monitor.history import ClusterHistory
+
+        history = ClusterHistory(max_samples=100, max_events=100)
+        history.record(0.0, {"a": node("a", "LEADER", 1)})
+        history.record(100.0, {"a": node("a", "LEADER", 1)})
+
+        # execution
+        got = history.query(50.0)
+
+        # test
+        assert [sample["timestamp"] for sample in got["samples"]] == [100.0]
+        assert got["events"] == []
+
+    @pytest.mark.asyncio
+    async def test_record_single_node(self):
+        # setup
+        from monitor.history import ClusterHistory
+
+        history = ClusterHistory(max_samples=100, max_events=100)
+        history.record(
+            0.0, {"a": node("a", "LEADER", 1), "b": node("b", "FOLLOWER", 1)}
+        )
+
+        # execution
+        history.record_node(0.5, node("b", "CANDIDATE", 2))
+        history.record_node(0.75, node("b", "LEADER", 2))
+
+        # test
+        stats = history.stats(0.0, 1.0)
+        assert stats["current_leader"] == "b"
+        assert stats["current_term"] == 2
+        assert len(history.query(0.0)["samples"]) == 4
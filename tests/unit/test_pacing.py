@@ -0,0 +1,61 @@
+import pytest
+
+
+class TestHeartbeatPacer:
+    """Test adapting the heartbeat interval to round trip times."""
+
+    @pytest.mark.asyncio
+    async def test_initial_interval(self):
+        # setup
+        from app.raft.pacing import HeartbeatPacer
+
+        pacer = HeartbeatPacer(0.1, 1.0, 0.5, 3.0)
+
+        # execute / test
+        assert pacer.interval == 0.5
+        assert pacer.rto("node_2") == 0.0
+
+    @pytest.mark.asyncio
+    async def test_interval_bounds(self):
+        # setup
+        from app.raft.pacing import HeartbeatPacer
+
+        pacer = HeartbeatPacer(0.1, 0.9, 0.5, 3.0)
+
+        # execute
+        pacer.observe("node_2", 0.001)
+        fast = pacer.interval
+        pacer.observe("node_3", 1.0)  # slowest follower decides, RTO 3s
+        slow = pacer.interval
+
+        # test
+        assert fast == 0.9
+        assert slow == 0.1
+
+    @pytest.mark.asyncio
+    async def test_smoothing(self):
+        # setup
+        from app.raft.pacing import HeartbeatPacer
+
+        pacer = HeartbeatPacer(0.01, 1.0, 0.5, 3.0)
+        pacer.observe("node_2", 0.1)
+
+        # execute
+        for _ in range(50):
+            pacer.observe("node_2", 0.3)
+
+        # test
+        assert 0.3 <= pacer.rto("node_2") < 0.35
+        assert pacer.interval == pytest.approx((3.0 - pacer.rto("node_2")) / 3)
+
+    @pytest.mark.asyncio
+    async def test_due(self):
+        # setup
+        from app.raft.pacing import HeartbeatPacer
+
+        pacer = HeartbeatPacer(0.1, 1.0, 0.5, 3.0)
+
+        # execute / test
+        assert pacer.due(0.0, 10.0)
+        assert not pacer.due(9.9, 10.0)
+        assert pacer.due(9.75, 10.0)
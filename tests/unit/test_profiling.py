@@ -0,0 +1,119 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+
+class TestProfiling:
+    """Test stack sampling, dumps and the slow round watchdog."""
+
+    @pytest.mark.asyncio
+    async def test_sample_stacks(self):
+        # setup
+        from app.raft.profiling import sample_stacks, thread_dump
+
+        stop = threading.Event()
+
+        def busy_round() -> None:
+            while not stop.is_set():
+                sum(range(1000))
+
+        worker = threading.Thread(target=busy_round, name="LeaderExecutorThread[a]")
+        worker.start()
+
+        # execution
+        try:
+            profile = sample_stacks(0.05, 0.001)
+            threads = thread_dump()
+        finally:
+            stop.set()
+            worker.join()
+
+        # test
+        assert profile["samples"] > 0
+        busy = [
+            stack
+            for stack in profile["stacks"]
+            if stack.startswith("LeaderExecutorThread[a];") and "busy_round" in stack
+        ]
+        assert busy
+        dumped = next(t for t in threads if t["name"] == "LeaderExecutorThread[a]")
+        assert any("busy_round" in line for line in dumped["stack"])
+
+    @pytest.mark.asyncio
+    async def test_task_dump_and_loop_lag(self):
+        # setup
+        from app.raft.profiling import measure_loop_lag, task_dump
+
+        # execution
+        tasks = task_dump()
+        lag = await measure_loop_lag(0.05, 0.01)
+
+        # test
+        assert any("test_task_dump_and_loop_lag" in task["coroutine"] for task in tasks)
+        assert lag["samples"] >= 1
+        assert lag["max_millis"] >= lag["mean_millis"] >= 0.0
+
+    @pytest.mark.asyncio
+    async def test_monitor_loop_lag(self):
+        # setup
+        import asyncio
+
+        from app.raft.metrics import Metrics
+        from app.raft.profiling import monitor_loop_lag
+
+        metrics = Metrics()
+
+        # execution
+        monitor = asyncio.create_task(monitor_loop_lag(metrics, 0.01))
+        await asyncio.sleep(0.015)
+        time.sleep(0.05)  # blocks the event loop
+        await asyncio.sleep(0.03)
+        monitor.cancel()
+
+        # test
+        lag = metrics.snapshot()["timings"]["event_loop_lag"]
+        assert lag["count"] >= 2
+        assert lag["max_millis"] >= 30
+
+    @pytest.mark.asyncio
+    async def test_watchdog_logs_slow_round(self, caplog):
+        # setup
+        from app.raft.metrics import Metrics
+        from app.raft.profiling import SlowRoundWatchdog
+
+        metrics = Metrics()
+        watchdog = SlowRoundWatchdog(60.0, metrics)
+        watchdog._thread = mock.Mock()  # checked by the test instead
+
+        # execution
+        with watchdog.watch("heartbeat round fast"):
+            fast = watchdog.check()
+        with caplog.at_level("WARNING", logger="app.raft.profiling"):
+            with watchdog.watch("heartbeat round slow"):
+                watchdog.threshold = 0.001
+                time.sleep(0.002)
+                slow = watchdog.check()
+                again = watchdog.check()
+
+        # test
+        assert (fast, slow, again) == (0, 1, 0)
+        assert metrics.snapshot()["counters"] == {"slow_rounds": 1}
+        assert "heartbeat round slow running for" in caplog.text
+        assert "test_watchdog_logs_slow_round" in caplog.text  # the stack
+        assert "heartbeat round slow finished after" in caplog.text
+        assert watchdog._running == {}
+
+    @pytest.mark.asyncio
+    async def test_watchdog_disabled(self):
+        # setup
+        from app.raft.profiling import NO_WATCHDOG
+
+        # execution
+        with NO_WATCHDOG.watch("heartbeat round"):
+            running = dict(NO_WATCHDOG._running)
+
+        # test
+        assert running == {}
+        assert NO_WATCHDOG._thread is None
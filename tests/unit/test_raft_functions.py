@@ -1,4 +1,4 @@
-import datetime
+import time
 from unittest import mock
 import threading
 import pytest
@@ -12,14 +12,17 @@ class TestRaftFunctions:
     async def test_term_reset_case_candidate(self):
         # setup
         from app.raft.functions import State
+        from app.raft.timer import ElectionTimer
 
-        test_time = datetime.datetime.utcnow()
+        clock = mock.Mock(return_value=0.0)
         state = FastAPIState()
         state.state = State.CANDIDATE
         state.term = 0
         state.candidature = threading.Thread()
         state.executor = threading.Thread()
-        state.ping_time = test_time
+        state.election_timer = ElectionTimer(3000, 5000, clock=clock)
+        test_deadline = state.election_timer.deadline
+        clock.return_value = 1.0
 
         # execution
         from app.raft.functions import reset_candidate
@@ -28,7 +31,7 @@ class TestRaftFunctions:
 
         # test
         assert state.state is State.FOLLOWER
-        assert state.ping_time != test_time
+        assert state.election_timer.deadline == test_deadline + 1.0
 
     @pytest.mark.asyncio
     @mock.patch(follower_executor_thread)
@@ -36,7 +39,6 @@ class TestRaftFunctions:
         # setup
         from app.raft.functions import State
 
-        test_time = datetime.datetime.utcnow()
         state = FastAPIState()
         state.term = 0
         state.candidature = threading.Thread()
@@ -56,10 +58,12 @@ class TestRaftFunctions:
     async def test_term_reset_case_follower(self):
         # setup
         from app.raft.functions import State
+        from app.raft.timer import ElectionTimer
 
         state = FastAPIState()
         state.term = 0
         state.state = State.FOLLOWER
+        state.election_timer = ElectionTimer(3000, 5000)
 
         # execution
         from app.raft.functions import term_reset
@@ -75,10 +79,12 @@ class TestRaftFunctions:
     async def test_term_reset_call_candidate(self, mock_candidate: mock.Mock):
         # setup
         from app.raft.functions import State
+        from app.raft.timer import ElectionTimer
 
         state = FastAPIState()
         state.term = 0
         state.state = State.CANDIDATE
+        state.election_timer = ElectionTimer(3000, 5000)
 
         # execute
         from app.raft.functions import term_reset
@@ -94,10 +100,12 @@ class TestRaftFunctions:
     async def test_term_reset_call_leader(self, mock_leader: mock.Mock):
         # setup
         from app.raft.functions import State
+        from app.raft.timer import ElectionTimer
 
         state = FastAPIState()
         state.term = 0
         state.state = State.LEADER
+        state.election_timer = ElectionTimer(3000, 5000)
 
         # execute
         from app.raft.functions import term_reset
@@ -148,14 +156,13 @@ class TestRaftFunctions:
     @pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
     async def test_be_follower(self):
         # setup
-        from datetime import datetime, timedelta
         from fastapi.applications import State as FastAPIState
+        from app.raft.timer import ElectionTimer
 
+        clock = mock.Mock(return_value=0.0)
         test_state = FastAPIState()
-        test_state.ping_time = datetime.utcnow()
-        test_state.timeout = timedelta(
-            milliseconds=0
-        )  # always smaller than utcnow difference
+        test_state.election_timer = ElectionTimer(3000, 5000, clock=clock)
+        clock.return_value = 10.0  # timer fired
 
         # execute
         from app.raft.functions import be_follower
@@ -166,8 +173,433 @@ class TestRaftFunctions:
         from app.raft.functions import CandidateExecutorThread
 
         assert isinstance(test_state.candidature, CandidateExecutorThread)
-        assert not test_state.candidature.is_alive()
+        assert not test_state.election_timer.expired()  # re-armed for next term
 
         # cleanup
         test_state.candidature.stop()
         test_state.candidature.join()
+
+    @pytest.mark.asyncio
+    @mock.patch("app.raft.functions.requests.put")
+    async def test_pre_vote_majority(self, mock_put: mock.Mock):
+        # setup
+        from app.raft.functions import State, pre_vote
+
+        mock_put.return_value = mock.Mock(status_code=200)
+        state = FastAPIState()
+        state.id = "asdfghjkl"
+        state.app_name = "node_1"
+        state.term = 3
+        state.state = State.FOLLOWER
+        state.replicas = {"node_2": "10.0.0.2", "node_3": "10.0.0.3"}
+
+        # execute
+        got = pre_vote(state)
+
+        # test
+        assert got is True
+        assert state.term == 3  # pre-vote does not touch the term
+        mock_put.assert_called_once()
+        assert mock_put.call_args.kwargs["json"]["term"] == 4
+
+    @pytest.mark.asyncio
+    @mock.patch("app.raft.functions.requests.put")
+    async def test_pre_vote_rejected(self, mock_put: mock.Mock):
+        # setup
+        from app.raft.functions import State, pre_vote
+
+        mock_put.return_value = mock.Mock(status_code=400)
+        mock_put.return_value.json.return_value = {"error": {"term": 3}}
+        state = FastAPIState()
+        state.id = "asdfghjkl"
+        state.app_name = "node_1"
+        state.term = 3
+        state.state = State.FOLLOWER
+        state.replicas = {"node_2": "10.0.0.2", "node_3": "10.0.0.3"}
+
+        # execute
+        got = pre_vote(state)
+
+        # test
+        assert got is False
+        assert mock_put.call_count == 2
+
+    @pytest.mark.asyncio
+    @mock.patch("app.raft.functions.reset_leader")
+    async def test_check_quorum_step_down(self, mock_leader: mock.Mock):
+        # setup
+        import time
+        from app.raft.functions import check_quorum
+        from app.raft.timer import ElectionTimer
+        from app.api.v1.models import RaftStateException
+
+        now = time.monotonic()
+        state = FastAPIState()
+        state.election_timer = ElectionTimer(3000, 5000)
+        state.replicas = {"node_2": "10.0.0.2", "node_3": "10.0.0.3"}
+        state.leader_since = now - 10
+        state.last_ack = {"node_2": now - 10, "node_3": now - 10}
+
+        # execute / test
+        with pytest.raises(RaftStateException):
+            check_quorum(state)
+        mock_leader.assert_called_once_with(state)
+
+        state.last_ack["node_2"] = now
+        check_quorum(state)  # majority is alive, no step down
+        mock_leader.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_transfer_leadership_not_leader(self):
+        # setup
+        from app.api.exceptions import NotLeaderException
+        from app.raft.functions import State, transfer_leadership
+
+        state = FastAPIState()
+        state.state = State.FOLLOWER
+        state.leader = "node_2"
+
+        # execute / test
+        with pytest.raises(NotLeaderException) as error:
+            transfer_leadership(state)
+        assert error.value.details == {"leader": "node_2"}
+
+    @staticmethod
+    def transferring_leader(tmp_path) -> FastAPIState:
+        from app.raft.functions import State
+        from app.raft.leases import LeaseTable
+        from app.raft.storage import WriteAheadLog
+        from app.raft.timer import ElectionTimer
+
+        state = FastAPIState()
+        state.leases = LeaseTable()
+        state.log = WriteAheadLog(str(tmp_path), WriteAheadLog.NONE)
+        state.log.append(3, [b"{}", b"{}"])
+        state.commit_index = 0
+        state.id = "asdfghjkl"
+        state.app_name = "node_1"
+        state.term = 3
+        state.state = State.LEADER
+        state.replicas = {"node_2": "10.0.0.2", "node_3": "10.0.0.3"}
+        state.election_timer = ElectionTimer(150, 300)
+        state.pacer = mock.Mock(interval=0.01)
+        state.heartbeats = mock.Mock()
+        state.catchup_bytes = 0
+        state.last_ack = {"node_2": 1.0, "node_3": 2.0}
+        state.last_append = {}
+        state.match_index = {"node_2": 1, "node_3": 0}  # node_2 has more entries
+        state.next_index = {"node_2": 3, "node_3": 1}  # entry 2 is in flight
+        return state
+
+    @pytest.mark.asyncio
+    @mock.patch("app.raft.functions.requests.post")
+    async def test_transfer_leadership(self, mock_post: mock.Mock, tmp_path):
+        # setup
+        from app.api.exceptions import ServiceUnavailableException
+        from app.raft.functions import propose, transfer_leadership
+
+        mock_post.return_value = mock.Mock(status_code=200)
+        state = self.transferring_leader(tmp_path)
+        state.heartbeats.send.return_value = mock.Mock(
+            status_code=200, json=mock.Mock(return_value={"data": {}})
+        )
+
+        # execute
+        got = transfer_leadership(state)
+
+        # test
+        assert got == "node_2"
+        sent = state.heartbeats.send.call_args.args
+        assert sent[0] == "node_2"
+        assert [entry["index"] for entry in sent[1]["entries"]] == [2]  # resent
+        assert state.match_index["node_2"] == 2
+        urls = [call.args[0] for call in mock_post.call_args_list]
+        assert urls == ["http://node_2/api/v1/raft/timeout-now"]
+        with pytest.raises(ServiceUnavailableException):
+            propose(state, b"{}")  # until the target won the election
+
+    @pytest.mark.asyncio
+    @mock.patch("app.raft.functions.requests.post")
+    async def test_transfer_leadership_target_behind(
+        self, mock_post: mock.Mock, tmp_path
+    ):
+        # setup
+        import requests
+
+        from app.api.exceptions import ServiceUnavailableException
+        from app.raft.functions import propose, transfer_leadership
+
+        now = [0.0]
+        state = self.transferring_leader(tmp_path)
+        state.clock = lambda: now[0]
+        state.sleep = lambda seconds: now.__setitem__(0, now[0] + seconds)
+        state.heartbeats.send.side_effect = requests.ConnectionError("refused")
+        state.replicate = mock.Mock()
+
+        # execute
+        with pytest.raises(ServiceUnavailableException):
+            transfer_leadership(state, "node_3")
+
+        # test
+        mock_post.assert_not_called()  # no election with a stale log
+        assert now[0] >= state.election_timer.lower
+        assert propose(state, b"{}") == 3  # proposals are accepted again
+
+    @pytest.mark.asyncio
+    async def test_be_leader_skips_recent_appends(self, tmp_path):
+        # setup
+        from app.raft.functions import be_leader
+        from app.raft.groups import GroupResponse
+        from app.raft.leases import LeaseTable
+        from app.raft.pacing import HeartbeatPacer
+        from app.raft.storage import WriteAheadLog
+
+        state = FastAPIState()
+        state.leases = LeaseTable()
+        state.log = WriteAheadLog(str(tmp_path), WriteAheadLog.NONE)
+        state.commit_index = 0
+        state.next_index = {"node_2": 1, "node_3": 1}
+        state.match_index = {"node_2": 0, "node_3": 0}
+        state.id = "asdfghjkl"
+        state.app_name = "node_1"
+        state.term = 3
+        state.check_quorum = False
+        state.replicas = {"node_2": "10.0.0.2", "node_3": "10.0.0.3"}
+        state.last_ack = {}
+        state.last_append = {"node_2": time.monotonic()}  # e.g. on a transfer
+        state.pacer = HeartbeatPacer(0.1, 1.0, 0.5, 3.0)
+        state.heartbeats = mock.Mock()
+        state.heartbeats.send.return_value = GroupResponse(200, {"data": {}})
+
+        # execute
+        be_leader(state)
+
+        # test
+        state.heartbeats.send.assert_called_once()
+        assert state.heartbeats.send.call_args.args[0] == "node_3"
+        assert "node_3" in state.last_ack
+        assert state.pacer.rto("node_3") > 0
+
+    @pytest.mark.asyncio
+    async def test_be_leader_replicates_and_commits(self, tmp_path):
+        # setup
+        import threading
+        from app.raft.functions import be_leader
+        from app.raft.groups import GroupResponse
+        from app.raft.kv import KeyValueStore
+        from app.raft.leases import LeaseTable
+        from app.raft.pacing import HeartbeatPacer
+        from app.raft.storage import WriteAheadLog
+
+        state = FastAPIState()
+        state.leases = LeaseTable()
+        state.log = WriteAheadLog(str(tmp_path), WriteAheadLog.NONE)
+        state.log.append(2, [KeyValueStore.command(KeyValueStore.SET, "a", "1")])
+        state.log.append(3, [KeyValueStore.command(KeyValueStore.SET, "a", "2")])
+        state.kv = KeyValueStore()
+        state.commit_index = 0
+        state.last_applied = 0
+        state.apply_lock = threading.Lock()
+        state.id = "asdfghjkl"
+        state.app_name = "node_1"
+        state.term = 3
+        state.check_quorum = False
+        state.replicas = {"node_2": "10.0.0.2", "node_3": "10.0.0.3"}
+        state.next_index = {"node_2": 3, "node_3": 3}
+        state.match_index = {"node_2": 0, "node_3": 0}
+        state.last_ack = {}
+        state.last_append = {}
+        state.pacer = HeartbeatPacer(0.1, 1.0, 0.5, 3.0)
+        conflict = GroupResponse(409, {"error": {"term": 3}})
+        ok = GroupResponse(200, {"data": {}})
+        state.heartbeats = mock.Mock()
+        state.heartbeats.send.side_effect = [conflict, ok, ok, ok]
+
+        # execute
+        be_leader(state)  # node_2 lacks entry 2, node_3 stores both
+
+        # test
+        assert state.next_index == {"node_2": 2, "node_3": 3}
+        assert state.commit_index == 2
+        assert state.kv.get("a") == "2"
+
+        # execute
+        be_leader(state)
+
+        # test
+        sent = state.heartbeats.send.call_args_list[2].args[1]
+        assert (sent["prev_log_index"], sent["prev_log_term"]) == (1, 2)
+        assert [entry["index"] for entry in sent["entries"]] == [2]
+        assert state.match_index == {"node_2": 2, "node_3": 2}
+
+    @pytest.mark.asyncio
+    @mock.patch("app.raft.functions.requests.post")
+    async def test_be_leader_catches_up_with_records(self, post, tmp_path):
+        # setup
+        import threading
+        from app.raft.functions import MAX_APPEND_ENTRIES, be_leader
+        from app.raft.groups import GroupResponse
+        from app.raft.kv import KeyValueStore
+        from app.raft.leases import LeaseTable
+        from app.raft.pacing import HeartbeatPacer
+        from app.raft.storage import WriteAheadLog, decode_records
+
+        state = FastAPIState()
+        state.leases = LeaseTable()
+        state.log = WriteAheadLog(str(tmp_path), WriteAheadLog.NONE)
+        noop = KeyValueStore.command(KeyValueStore.NOOP)
+        state.log.append(1, [noop] * (MAX_APPEND_ENTRIES + 10))
+        state.kv = KeyValueStore()
+        state.commit_index = 0
+        state.last_applied = 0
+        state.apply_lock = threading.Lock()
+        state.id = "asdfghjkl"
+        state.app_name = "node_1"
+        state.term = 1
+        state.check_quorum = False
+        state.catchup_bytes = 1 << 20
+        state.replicas = {"node_2": "10.0.0.2"}
+        state.next_index = {"node_2": 1}
+        state.match_index = {"node_2": 0}
+        state.last_ack = {}
+        state.last_append = {}
+        state.pacer = HeartbeatPacer(0.1, 1.0, 0.5, 3.0)
+        state.heartbeats = mock.Mock()
+        post.return_value = GroupResponse(200, {"data": {}})
+
+        # execute
+        be_leader(state)
+
+        # test
+        state.heartbeats.send.assert_not_called()
+        assert post.call_args.kwargs["params"]["prev_log_index"] == 0
+        entries = decode_records(post.call_args.kwargs["data"])
+        assert len(entries) == MAX_APPEND_ENTRIES + 10
+        assert state.match_index == {"node_2": MAX_APPEND_ENTRIES + 10}
+        assert state.commit_index == MAX_APPEND_ENTRIES + 10
+
+    @pytest.mark.asyncio
+    async def test_conflict_next_index(self, tmp_path):
+        # setup
+        from app.raft.functions import conflict_next_index
+        from app.raft.storage import WriteAheadLog
+
+        state = FastAPIState()
+        state.log = WriteAheadLog(str(tmp_path), WriteAheadLog.NONE)
+        state.log.append(1, [b"a"] * 3)  # indexes 1 to 3
+        state.log.append(3, [b"b"] * 5)  # indexes 4 to 8
+
+        def hints(term, index):
+            return {"details": {"conflict_term": term, "conflict_index": index}}
+
+        # execute / test
+        assert conflict_next_index(state, 8, hints(None, 3)) == 3  # log too short
+        assert conflict_next_index(state, 8, hints(2, 4)) == 4  # term 2 unknown
+        assert conflict_next_index(state, 8, hints(1, 2)) == 4  # after own term 1
+        assert conflict_next_index(state, 2, hints(1, 1)) == 2  # always move back
+        assert conflict_next_index(state, 8, {"term": 3}) == 8  # no hints
+
+    @pytest.mark.asyncio
+    @mock.patch("app.raft.functions.requests.put")
+    async def test_be_candidate_ends_on_newer_term(self, put):
+        # setup
+        from app.api.v1.models import RaftStateException
+        from app.raft.functions import State, be_candidate
+        from app.raft.groups import GroupResponse
+        from app.raft.timer import ElectionTimer
+
+        state = FastAPIState()
+        state.id = "asdfghjkl"
+        state.app_name = "node_1"
+        state.state = State.CANDIDATE
+        state.term = 4
+        state.vote = "asdfghjkl"
+        state.replicas = {"node_2": "10.0.0.2", "node_3": "10.0.0.3"}
+        state.possible_voters = state.replicas.copy()
+        state.actual_voters = []
+        state.my_votes = 1
+        state.candidature = threading.Thread()
+        state.election_timer = ElectionTimer(3000, 5000)
+        put.return_value = GroupResponse(400, {"error": {"term": 5}})
+
+        # execute
+        with pytest.raises(RaftStateException):
+            be_candidate(state)
+
+        # test
+        put.assert_called_once()  # votes of term 4 do not count in term 5
+        assert (state.state, state.term, state.vote) == (State.FOLLOWER, 5, None)
+
+    @pytest.mark.asyncio
+    async def test_timed_wait_and_handler_timings(self):
+        # setup
+        from app.raft.functions import State, run_handler, timed_wait
+        from app.raft.metrics import Metrics
+
+        clock = mock.Mock(return_value=10.0)
+        state = FastAPIState()
+        state.clock = clock
+        state.metrics = Metrics()
+        woken = threading.Event()
+        woken.set()
+        idle = mock.Mock()
+        idle.wait.return_value = False
+
+        def handler(state) -> None:
+            clock.return_value += 0.5
+
+        # execution
+        set_before = timed_wait(state, State.LEADER, woken, 1.0)
+        clock.side_effect = [10.0, 11.25]  # woke up 0.25 s late
+        timed_out = timed_wait(state, State.CANDIDATE, idle, 1.0)
+        clock.side_effect = None
+        clock.return_value = 20.0
+        run_handler(state, State.FOLLOWER, handler)
+        with pytest.raises(ValueError):
+            run_handler(state, State.LEADER, mock.Mock(side_effect=ValueError))
+
+        # test
+        timings = state.metrics.timings()
+        assert (set_before, timed_out) == (True, False)
+        assert "timer_drift_leader" not in timings
+        assert timings["timer_drift_candidate"]["last_millis"] == pytest.approx(250)
+        assert timings["handler_follower"]["max_millis"] == pytest.approx(500)
+        assert timings["handler_leader"]["count"] == 1
+
+    @pytest.mark.asyncio
+    async def test_append_message_bytes_and_uncommitted_limit(self, tmp_path):
+        # setup
+        from app.api.exceptions import ServiceUnavailableException
+        from app.raft.admission import AdmissionControl
+        from app.raft.functions import State, append_message, propose
+        from app.raft.storage import WriteAheadLog
+
+        state = FastAPIState()
+        state.id = "asdfghjkl"
+        state.state = State.LEADER
+        state.term = 2
+        state.log = WriteAheadLog(str(tmp_path), WriteAheadLog.NONE)
+        state.log.append(2, [b"x" * 600, b"y" * 600, b"z" * 10])
+        state.commit_index = 0
+        state.replicate = threading.Event()
+        state.next_index = {"node_2": 1, "node_3": 3}
+        state.catchup_bytes = 1000
+        state.admission = AdmissionControl(0, 4)
+        heartbeat = {"term": 2, "leader_commit": 0}
+
+        # execution
+        behind = append_message(state, "node_2", heartbeat)
+        large = append_message(state, "node_3", heartbeat)
+        state.next_index["node_3"] = 1
+        state.catchup_bytes = 100  # a single entry above the limit is sent
+        single = append_message(state, "node_3", heartbeat)
+        index = propose(state, b"w")
+        with pytest.raises(ServiceUnavailableException):
+            propose(state, b"v")
+
+        # test
+        assert [entry["index"] for entry in behind["entries"]] == [1]
+        assert [entry["index"] for entry in large["entries"]] == [3]
+        assert [entry["index"] for entry in single["entries"]] == [1]
+        assert index == 4 and state.log.last_index == 4
+        state.log.close()
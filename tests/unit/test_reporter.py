@@ -0,0 +1,68 @@
+from unittest import mock
+import pytest
+import requests
+
+
+class TestStatusReporter:
+    """Test batching and coalescing of pushed status events."""
+
+    @pytest.mark.asyncio
+    @mock.patch("app.raft.reporter.requests.post")
+    async def test_coalesce_and_batch(self, mock_post: mock.Mock):
+        # setup
+        from app.raft.reporter import StatusReporterThread
+
+        reporter = StatusReporterThread("http://monitor:8000/", 0.1)
+
+        # execution
+        reporter.report({"state": "FOLLOWER", "term": 1, "timestamp": 1.0})
+        reporter.report({"state": "FOLLOWER", "term": 1, "timestamp": 2.0})
+        reporter.report({"state": "CANDIDATE", "term": 2, "timestamp": 3.0})
+        reporter.flush()
+
+        # test
+        mock_post.assert_called_once()
+        assert mock_post.call_args.args[0] == "http://monitor:8000/ingest"
+        events = mock_post.call_args.kwargs["json"]["events"]
+        assert [event["timestamp"] for event in events] == [1.0, 3.0]
+
+    @pytest.mark.asyncio
+    @mock.patch(
+        "app.raft.reporter.requests.post", side_effect=requests.ConnectionError()
+    )
+    async def test_requeue_bounded(self, mock_post: mock.Mock):
+        # setup
+        from app.raft.reporter import StatusReporterThread
+
+        reporter = StatusReporterThread("http://monitor:8000", 0.1, max_pending=2)
+        reporter.report({"term": 1, "timestamp": 1.0})
+        reporter.report({"term": 2, "timestamp": 2.0})
+
+        # execution
+        reporter.flush()
+        reporter.report({"term": 3, "timestamp": 3.0})
+
+        # test
+        assert [event["term"] for event in reporter._pending] == [2, 3]
+
+    @pytest.mark.asyncio
+    @mock.patch("app.raft.reporter.requests.post")
+    async def test_keepalive(self, mock_post: mock.Mock):
+        # setup
+        from app.raft.reporter import StatusReporterThread
+
+        reporter = StatusReporterThread("http://monitor:8000", 0.1, keepalive=0.0)
+        reporter.source = lambda: {"term": 1, "commit_index": 7, "timestamp": 2.0}
+
+        # execution
+        reporter.report({"term": 1, "commit_index": 5, "timestamp": 1.0})
+        reporter.report({"term": 1, "commit_index": 6, "timestamp": 1.5})
+        reporter.flush()
+        reporter.flush()  # nothing changed, the status is resent
+
+        # test
+        batches = [call.kwargs["json"]["events"] for call in mock_post.call_args_list]
+        assert batches == [
+            [{"term": 1, "commit_index": 5, "timestamp": 1.0}],
+            [{"term": 1, "commit_index": 7, "timestamp": 2.0}],
+        ]
@@ -0,0 +1,70 @@
+import time
+import pytest
+
+
+def wait_for_results(runner, count: int) -> list:
+    deadline = time.monotonic() + 5
+    while len(runner.results()) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return runner.results()
+
+
+class TestScriptRunner:
+    """Test supervision of the payload scripts."""
+
+    @pytest.mark.asyncio
+    async def test_exit_code_recorded(self, tmp_path):
+        # setup
+        from app.raft.scripts import ScriptRunner
+
+        script = tmp_path / "script.sh"
+        script.write_text("exit 3\n")
+        runner = ScriptRunner(timeout=5)
+
+        # execution
+        runner.run("LEADER", str(script))
+
+        # test
+        results = wait_for_results(runner, 1)
+        assert results[0]["role"] == "LEADER"
+        assert results[0]["exit_code"] == 3
+        assert not results[0]["timed_out"]
+        assert not results[0]["cancelled"]
+
+    @pytest.mark.asyncio
+    async def test_timeout(self, tmp_path):
+        # setup
+        from app.raft.scripts import ScriptRunner
+
+        script = tmp_path / "script.sh"
+        script.write_text("sleep 10\n")
+        runner = ScriptRunner(timeout=0.1, grace=0.1)
+
+        # execution
+        runner.run("FOLLOWER", str(script))
+
+        # test
+        results = wait_for_results(runner, 1)
+        assert results[0]["timed_out"]
+        assert results[0]["exit_code"] != 0
+        assert results[0]["duration"] < 5
+
+    @pytest.mark.asyncio
+    async def test_role_change_cancels_previous(self, tmp_path):
+        # setup
+        from app.raft.scripts import ScriptRunner
+
+        slow = tmp_path / "slow.sh"
+        slow.write_text("sleep 10\n")
+        fast = tmp_path / "fast.sh"
+        fast.write_text("exit 0\n")
+        runner = ScriptRunner(timeout=5, grace=0.1)
+
+        # execution
+        runner.run("FOLLOWER", str(slow))
+        runner.run("LEADER", str(fast))
+
+        # test
+        results = {r["role"]: r for r in wait_for_results(runner, 2)}
+        assert results["FOLLOWER"]["cancelled"]
+        assert results["LEADER"]["exit_code"] == 0
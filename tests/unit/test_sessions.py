@@ -0,0 +1,54 @@
+import pytest
+
+
+class TestSessionTable:
+    """Test deduplication and eviction of client sessions."""
+
+    @pytest.mark.asyncio
+    async def test_retries_apply_once(self):
+        # setup
+        from app.api.exceptions import ConflictException
+        from app.raft.kv import KeyValueStore
+        from app.raft.sessions import SessionTable
+
+        changes = []
+        kv = KeyValueStore(on_change=lambda *change: changes.append(change))
+        first = KeyValueStore.command(KeyValueStore.SET, "a", "1", "s1", 1, 100.0)
+        second = KeyValueStore.command(KeyValueStore.SET, "a", "2", "s1", 2, 101.0)
+
+        # execution
+        before = kv.sessions.lookup("s1", 1)
+        kv.apply(first, 5)
+        kv.apply(second, 6)
+        kv.apply(first, 7)  # retry appended by a new leader
+        kv.apply(KeyValueStore.command(KeyValueStore.SET, "a", "3"), 8)
+
+        # test
+        assert before is None
+        assert changes == [("a", "1"), ("a", "2"), ("a", "3")]
+        assert kv.sessions.lookup("s1", 2) == 6
+        assert kv.sessions.lookup("s1", 3) is None
+        with pytest.raises(ConflictException):
+            kv.sessions.lookup("s1", 1)
+        assert isinstance(kv.sessions, SessionTable)
+
+    @pytest.mark.asyncio
+    async def test_eviction(self):
+        # setup
+        from app.raft.sessions import SessionTable
+
+        table = SessionTable(max_sessions=2, ttl=60.0)
+
+        # execution
+        table.record("s1", 1, 1, 0.0)
+        table.record("s2", 1, 2, 1.0)
+        table.record("s1", 1, 3, 2.0)  # duplicate, used recently
+        table.record("s3", 1, 4, 3.0)  # evicts s2, least recently used
+        lru = (table.lookup("s1", 1), table.lookup("s2", 1), table.lookup("s3", 1))
+        table.record("s4", 1, 5, 62.5)  # s1 idle for more than 60 s
+
+        # test
+        assert lru == (1, None, 4)
+        assert len(table) == 2
+        assert table.lookup("s1", 1) is None
+        assert (table.lookup("s3", 1), table.lookup("s4", 1)) == (4, 5)
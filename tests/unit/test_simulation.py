@@ -0,0 +1,56 @@
+import pytest
+
+
+class TestSimulation:
+    """Test the deterministic cluster simulation."""
+
+    @pytest.mark.asyncio
+    async def test_same_seed_same_run(self, tmp_path):
+        # setup
+        from app.raft.simulation import Simulation
+
+        runs = []
+
+        # execution
+        for directory in ("a", "b"):
+            simulation = Simulation(7, str(tmp_path / directory))
+            runs.append(simulation.run(120))
+            simulation.close()
+
+        # test
+        assert runs[0] == runs[1]
+        assert runs[0].leaders >= 1
+        assert runs[0].committed > 0
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("seed", [5, 89])
+    async def test_safety_under_faults(self, tmp_path, seed):
+        # setup
+        from app.raft.simulation import Simulation
+
+        simulation = Simulation(
+            seed, str(tmp_path), fault_interval=2.0, drop=0.1, late=0.1
+        )
+
+        # execution / test (raises InvariantViolation)
+        try:
+            simulation.run(120)
+        finally:
+            simulation.close()
+
+    @pytest.mark.asyncio
+    async def test_detects_two_leaders(self, tmp_path):
+        # setup
+        from app.raft.functions import State
+        from app.raft.simulation import InvariantViolation, Simulation
+
+        simulation = Simulation(1, str(tmp_path), nodes=3)
+        simulation.run(0)
+        for name in ("node_1", "node_2"):
+            state = simulation.nodes[name]
+            state.state, state.term, state.leader = State.LEADER, 9, name
+
+        # execution / test
+        with pytest.raises(InvariantViolation):
+            simulation.check()
+        simulation.close()
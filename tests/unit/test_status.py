@@ -0,0 +1,50 @@
+import pytest
+from fastapi.applications import State as FastAPIState
+
+
+class TestNodeStatus:
+    """Test the immutable status snapshot read by request handlers."""
+
+    @pytest.mark.asyncio
+    async def test_immutable(self):
+        # setup
+        from app.raft.status import NodeStatus
+
+        status = NodeStatus("node_1", "abc", None, None, 3, None, "node_2")
+
+        # execute / test
+        with pytest.raises(AttributeError):
+            status.term = 4
+        with pytest.raises(AttributeError):
+            status.other = 1  # no __dict__ because of __slots__
+        assert status.term == 3
+        assert "term=3" in repr(status)
+
+    @pytest.mark.asyncio
+    async def test_swapped_on_status_changed(self):
+        # setup
+        from app.raft.functions import State, status_changed
+        from app.raft.status import current_status
+
+        state = FastAPIState()
+        state.app_name = "node_1"
+        state.id = "abc"
+        state.state = State.FOLLOWER
+        state.term = 1
+        state.vote = None
+        state.leader = None
+        status_changed(state)
+        before = current_status(state)
+
+        # execution
+        state.term = 2
+        state.state = State.CANDIDATE
+        state.vote = "node_1"
+        unpublished = current_status(state)
+        status_changed(state)
+
+        # test
+        assert unpublished is before  # handlers never see half a transition
+        after = current_status(state)
+        assert (after.term, after.state, after.vote) == (2, State.CANDIDATE, "node_1")
+        assert (before.term, before.state, before.vote) == (1, State.FOLLOWER, None)
@@ -0,0 +1,237 @@
+import os
+import threading
+
+import pytest
+
+
+class TestWriteAheadLog:
+    """Test appending, recovering and truncating the Raft log."""
+
+    @pytest.mark.asyncio
+    async def test_append_and_read(self, tmp_path):
+        # setup
+        from app.raft.storage import WriteAheadLog
+
+        log = WriteAheadLog(str(tmp_path))
+
+        # execution
+        last = log.append(1, [b'{"a":1}', b'{"b":2}'])
+        log.append(2, [b'{"c":3}'])
+
+        # test
+        assert last == 2
+        assert (log.last_index, log.last_term) == (3, 2)
+        assert [entry.data for entry in log.entries(2, 10)] == [b'{"b":2}', b'{"c":3}']
+        assert log.entries(4, 10) == []
+        assert log.term_at(0) == 0
+        assert log.term_at(4) is None
+
+    @pytest.mark.asyncio
+    async def test_recover_torn_tail(self, tmp_path):
+        # setup
+        from app.raft.storage import WriteAheadLog
+
+        log = WriteAheadLog(str(tmp_path))
+        log.append(1, [b"x" * 10, b"y" * 10])
+        log.close()
+        path = os.path.join(str(tmp_path), f"{1:020d}.log")
+        with open(path, "r+b") as file:
+            file.truncate(os.path.getsize(path) - 3)  # crash during a write
+
+        # execution
+        log = WriteAheadLog(str(tmp_path))
+
+        # test
+        assert log.last_index == 1
+        assert log.append(1, [b"z"]) == 2
+        assert [entry.data for entry in log.entries(1, 10)] == [b"x" * 10, b"z"]
+
+    @pytest.mark.asyncio
+    async def test_write_truncates_conflicts(self, tmp_path):
+        # setup
+        from app.api.exceptions import ConflictException
+        from app.raft.storage import LogEntry, WriteAheadLog
+
+        log = WriteAheadLog(str(tmp_path), WriteAheadLog.NONE)
+        log.append(1, [b"a", b"b", b"c"])
+
+        # execution
+        last = log.write(1, 1, [LogEntry(2, 1, b"b"), LogEntry(3, 2, b"C")])
+
+        # test
+        assert last == 3
+        assert [(e.term, e.data) for e in log.entries(1, 10)] == [
+            (1, b"a"),
+            (1, b"b"),
+            (2, b"C"),
+        ]
+        with pytest.raises(ConflictException) as missing:
+            log.write(5, 2, [LogEntry(6, 2, b"f")])
+        assert missing.value.details == {"conflict_term": None, "conflict_index": 4}
+        with pytest.raises(ConflictException) as mismatch:
+            log.write(3, 1, [])
+        assert mismatch.value.details == {"conflict_term": 2, "conflict_index": 3}
+        assert (log.last_index_of_term(1), log.last_index_of_term(2)) == (2, 3)
+        assert log.last_index_of_term(3) is None
+
+    @pytest.mark.asyncio
+    async def test_hard_state(self, tmp_path):
+        # setup
+        from app.raft.storage import WriteAheadLog
+
+        log = WriteAheadLog(str(tmp_path))
+        assert log.hard_state() == (0, None)
+
+        # execution
+        log.save_hard_state(4, "node_2")
+
+        # test
+        assert WriteAheadLog(str(tmp_path)).hard_state() == (4, "node_2")
+
+    @pytest.mark.asyncio
+    async def test_group_commit(self, tmp_path):
+        # setup
+        from app.raft.storage import WriteAheadLog
+
+        log = WriteAheadLog(str(tmp_path), WriteAheadLog.GROUP, group_window=0.01)
+        writers = [
+            threading.Thread(target=log.append, args=(1, [b"%d" % i])) for i in range(8)
+        ]
+
+        # execution
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+
+        # test
+        assert log.last_index == 8
+        assert log._synced == log._written
+        assert sorted(e.data for e in log.entries(1, 10)) == [
+            b"%d" % i for i in range(8)
+        ]
+
+    @pytest.mark.asyncio
+    async def test_unknown_durability(self, tmp_path):
+        # setup
+        from app.raft.storage import WriteAheadLog
+
+        # execute / test
+        with pytest.raises(ValueError):
+            WriteAheadLog(str(tmp_path), "sometimes")
+
+    @pytest.mark.asyncio
+    async def test_segments(self, tmp_path):
+        # setup
+        from app.raft.storage import INDEX_INTERVAL, WriteAheadLog
+
+        log = WriteAheadLog(str(tmp_path), WriteAheadLog.NONE, segment_bytes=1024)
+        payloads = [b"%04d" % i for i in range(3 * INDEX_INTERVAL)]
+
+        # execution
+        for payload in payloads:
+            log.append(1, [payload])
+        log.close()
+        log = WriteAheadLog(str(tmp_path), WriteAheadLog.NONE, segment_bytes=1024)
+
+        # test
+        assert len(os.listdir(str(tmp_path))) > 2
+        assert log.last_index == len(payloads)
+        assert [e.data for e in log.entries(1, len(payloads))] == payloads
+        assert [e.index for e in log.entries(INDEX_INTERVAL + 5, 3)] == [
+            INDEX_INTERVAL + 5,
+            INDEX_INTERVAL + 6,
+            INDEX_INTERVAL + 7,
+        ]
+
+    @pytest.mark.asyncio
+    async def test_truncate_across_segments(self, tmp_path):
+        # setup
+        from app.raft.storage import LogEntry, WriteAheadLog
+
+        log = WriteAheadLog(str(tmp_path), WriteAheadLog.NONE, segment_bytes=256)
+        for i in range(40):
+            log.append(1, [b"%02d" % i])
+
+        # execution
+        log.write(9, 1, [LogEntry(10, 2, b"new")])
+
+        # test
+        assert (log.last_index, log.last_term) == (10, 2)
+        assert log.entries(10, 5) == [LogEntry(10, 2, b"new")]
+        log.close()
+        log = WriteAheadLog(str(tmp_path), WriteAheadLog.NONE, segment_bytes=256)
+        assert [e.data for e in log.entries(8, 5)] == [b"07", b"08", b"new"]
+
+    @pytest.mark.asyncio
+    async def test_records(self, tmp_path):
+        # setup
+        from app.raft.storage import RECORD_HEADER, WriteAheadLog, decode_records
+
+        log = WriteAheadLog(str(tmp_path), WriteAheadLog.NONE, segment_bytes=256)
+        for i in range(40):
+            log.append(1, [b"%02d" % i])
+        size = RECORD_HEADER.size + 2
+
+        # execution
+        small = log.records(3, 1)
+        bounded = log.records(3, 3 * size)
+        tail = log.records(40, 1 << 20)
+
+        # test
+        assert (small.first_index, small.last_index) == (3, 3)
+        assert (bounded.first_index, bounded.last_index) == (3, 5)
+        assert [e.data for e in decode_records(bounded.data)] == [b"02", b"03", b"04"]
+        assert [e.index for e in decode_records(tail.data)] == [40]
+        assert log.records(41, 1 << 20) is None
+        with pytest.raises(ValueError):
+            decode_records(bytes(bounded.data)[:-1])
+
+    @pytest.mark.asyncio
+    async def test_tail_cache(self, tmp_path):
+        # setup
+        from app.raft.metrics import Metrics
+        from app.raft.storage import LogEntry, WriteAheadLog
+
+        metrics = Metrics()
+        log = WriteAheadLog(
+            str(tmp_path), WriteAheadLog.NONE, cache_bytes=20, metrics=metrics
+        )
+        log.append(1, [b"%02d" % i for i in range(20)])  # entries 11 to 20 cached
+
+        # execution
+        tail = log.entries(15, 10)
+        head = log.entries(1, 2)
+        log.write(17, 1, [LogEntry(18, 2, b"xx")])
+        truncated = log.entries(17, 10)
+
+        # test
+        assert [entry.data for entry in tail] == [b"%02d" % i for i in range(14, 20)]
+        assert [entry.data for entry in head] == [b"00", b"01"]
+        assert truncated == [LogEntry(17, 1, b"16"), LogEntry(18, 2, b"xx")]
+        assert metrics.snapshot()["counters"] == {
+            "log_cache_hits": 2,
+            "log_cache_misses": 1,
+        }
+
+
+class TestKeyValueStore:
+    """Test applying committed commands."""
+
+    @pytest.mark.asyncio
+    async def test_apply(self):
+        # setup
+        from unittest import mock
+        from app.raft.kv import KeyValueStore
+
+        on_change = mock.Mock()
+        kv = KeyValueStore(on_change=on_change)
+
+        # execution
+        kv.apply(KeyValueStore.command(KeyValueStore.SET, "a", "1"))
+        kv.apply(KeyValueStore.command(KeyValueStore.NOOP))
+        kv.apply(KeyValueStore.command(KeyValueStore.DELETE, "a"))
+
+        # test
+        assert kv.get("a") is None
+        assert on_change.call_args_list == [mock.call("a", "1"), mock.call("a", None)]
@@ -0,0 +1,75 @@
+import threading
+from unittest import mock
+import pytest
+
+
+class TestElectionTimer:
+    """Test the monotonic election timer."""
+
+    @pytest.mark.asyncio
+    async def test_reset_pushes_deadline(self):
+        # setup
+        from app.raft.timer import ElectionTimer
+
+        clock = mock.Mock(return_value=100.0)
+        timer = ElectionTimer(3000, 5000, clock=clock)
+
+        # execution
+        clock.return_value = 102.0
+        timer.reset()
+
+        # test
+        assert 3.0 <= timer.timeout <= 5.0
+        assert timer.deadline == 102.0 + timer.timeout
+        assert not timer.expired()
+        clock.return_value = 102.0 + timer.timeout
+        assert timer.expired()
+
+    @pytest.mark.asyncio
+    @mock.patch("app.raft.timer.random.uniform", side_effect=[3.5, 4.5])
+    async def test_rearm_draws_new_timeout(self, mock_uniform: mock.Mock):
+        # setup
+        from app.raft.timer import ElectionTimer
+
+        timer = ElectionTimer(3000, 5000, clock=lambda: 0.0)
+
+        # execution
+        timer.rearm()
+
+        # test
+        assert timer.timeout == 4.5
+        assert timer.deadline == 4.5
+        mock_uniform.assert_called_with(3.0, 5.0)
+
+    @pytest.mark.asyncio
+    async def test_wait_fires_at_deadline(self):
+        # setup
+        from app.raft.timer import ElectionTimer
+
+        timer = ElectionTimer(10, 20)
+
+        # execution
+        got = timer.wait(threading.Event())
+
+        # test
+        assert got is True
+        assert timer.expired()
+
+    @pytest.mark.asyncio
+    async def test_wait_stopped(self):
+        # setup
+        from app.raft.timer import ElectionTimer
+
+        timer = ElectionTimer(60000, 60000)
+        stop_evt = threading.Event()
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(timer.wait(stop_evt)))
+        waiter.start()
+
+        # execution
+        stop_evt.set()
+        timer.wake()
+        waiter.join(timeout=1)
+
+        # test
+        assert result == [False]
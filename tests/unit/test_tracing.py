@@ -0,0 +1,123 @@
+import json
+import os
+from unittest import mock
+
+import pytest
+
+
+def read_spans(path: str) -> list:
+    with open(path, encoding="utf-8") as file:
+        return [
+            json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+            for line in file
+        ]
+
+
+class TestTracing:
+    """Test spans, their export and the propagation between nodes."""
+
+    @pytest.mark.asyncio
+    async def test_traceparent(self):
+        # setup
+        from app.raft.tracing import SpanContext
+
+        header = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+        # execution
+        got = SpanContext.from_traceparent(header)
+
+        # test
+        assert got == SpanContext(
+            "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+        )
+        assert got.traceparent == header
+        assert SpanContext.from_traceparent(None) is None
+        assert SpanContext.from_traceparent("00-xyz-00f067aa0ba902b7-01") is None
+        assert (
+            SpanContext.from_traceparent(f"00-{'0' * 32}-00f067aa0ba902b7-01") is None
+        )
+
+    @pytest.mark.asyncio
+    async def test_nested_spans(self, tmp_path):
+        # setup
+        from app.raft.tracing import CLIENT, Tracer, current_context
+
+        path = os.path.join(tmp_path, "spans.jsonl")
+        tracer = Tracer("node_1", path)
+
+        class Stop(Exception):
+            pass
+
+        # execution
+        with tracer.span("heartbeat round", expected=(Stop,), term=3) as outer:
+            with tracer.span("append entries", CLIENT, peer="node_2") as inner:
+                headers = inner.headers
+                inner.set(status_code=200)
+            with pytest.raises(ValueError):
+                with tracer.span("fsync"):
+                    raise ValueError("disk")
+            with pytest.raises(Stop):
+                with tracer.span("vote round", expected=(Stop,)):
+                    raise Stop()
+        tracer.close()
+
+        # test
+        assert current_context() is None
+        inner_span, fsync, vote, outer_span = read_spans(path)
+        assert headers == {"traceparent": inner.context.traceparent}
+        assert inner_span["parentSpanId"] == outer.context.span_id
+        assert inner_span["traceId"] == outer_span["traceId"]
+        assert inner_span["kind"] == CLIENT
+        assert {"key": "status_code", "value": {"intValue": "200"}} in inner_span[
+            "attributes"
+        ]
+        assert "parentSpanId" not in outer_span
+        assert fsync["status"]["message"] == "ValueError: disk"
+        assert "status" not in vote
+        assert {"key": "ended_by", "value": {"stringValue": "Stop"}} in vote[
+            "attributes"
+        ]
+        assert int(outer_span["endTimeUnixNano"]) >= int(inner_span["endTimeUnixNano"])
+
+    @pytest.mark.asyncio
+    async def test_disabled(self):
+        # setup
+        from app.raft.tracing import NO_SPAN, Tracer, current_context
+
+        tracer = Tracer("node_1")
+
+        # execution
+        with tracer.span("heartbeat round") as span:
+            context = current_context()
+
+        # test
+        assert not tracer.enabled
+        assert span is NO_SPAN
+        assert span.headers == {}
+        assert context is None
+
+    @pytest.mark.asyncio
+    @mock.patch("app.raft.groups.requests.post")
+    async def test_heartbeat_carries_traceparent(self, mock_post: mock.Mock, tmp_path):
+        # setup
+        from app.raft.groups import HeartbeatCoalescer
+        from app.raft.tracing import Tracer
+
+        path = os.path.join(tmp_path, "spans.jsonl")
+        tracer = Tracer("node_1", path)
+        mock_post.return_value = mock.Mock(status_code=200)
+        mock_post.return_value.json.return_value = {"data": {"term": 1}}
+        coalescer = HeartbeatCoalescer(linger=0.001, tracer=tracer)
+
+        # execution
+        with tracer.span("append entries") as rpc:
+            coalescer.send("node_2", {"term": 1})
+        tracer.close()
+
+        # test
+        request, append = read_spans(path)
+        assert request["name"] == "POST /log"
+        assert request["parentSpanId"] == rpc.context.span_id
+        assert mock_post.call_args.kwargs["headers"] == {
+            "traceparent": f"00-{append['traceId']}-{request['spanId']}-01"
+        }
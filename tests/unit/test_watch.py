@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import pytest
+
+
+class TestWatchHub:
+    """Test the event log and the waiters of the watch hub."""
+
+    @pytest.mark.asyncio
+    async def test_since_filters_keys(self):
+        # setup
+        from app.raft.watch import WatchHub
+
+        hub = WatchHub(max_events=10)
+        hub.publish_status(1, "node_1")
+        hub.publish("KEY", "locks/db", "worker-1")
+        hub.publish("KEY", "other/x", "y")
+
+        # execution
+        got = hub.since(1, ["leader", "locks/"])
+
+        # test
+        assert [(e.index, e.key) for e in got] == [(2, "leader"), (3, "locks/db")]
+
+    @pytest.mark.asyncio
+    async def test_publish_status_only_changes(self):
+        # setup
+        from app.raft.watch import WatchHub
+
+        hub = WatchHub(max_events=10)
+
+        # execution
+        hub.publish_status(1, None)
+        hub.publish_status(1, None)
+        hub.publish_status(1, "node_1")
+
+        # test
+        assert [e.kind for e in hub.since(0)] == ["TERM", "LEADER"]
+
+    @pytest.mark.asyncio
+    async def test_compacted_index(self):
+        # setup
+        from app.api.exceptions import GoneException
+        from app.raft.watch import WatchHub
+
+        hub = WatchHub(max_events=2)
+        for value in range(5):
+            hub.publish("KEY", "locks/db", str(value))
+
+        # execution / test
+        assert len(hub.since(3)) == 2
+        with pytest.raises(GoneException):
+            hub.since(1)
+
+    @pytest.mark.asyncio
+    async def test_wait_woken_from_thread(self):
+        # setup
+        from app.raft.watch import WatchHub
+
+        hub = WatchHub(max_events=10)
+        hub.attach(asyncio.get_running_loop())
+        publisher = threading.Timer(0.05, hub.publish, args=("KEY", "locks/db"))
+
+        # execution
+        publisher.start()
+        index, events = await hub.wait(0, ["locks/db"], timeout=5)
+
+        # test
+        assert index == 1
+        assert [e.key for e in events] == ["locks/db"]
+
+    @pytest.mark.asyncio
+    async def test_wait_timeout(self):
+        # setup
+        from app.raft.watch import WatchHub
+
+        hub = WatchHub(max_events=10)
+        hub.attach(asyncio.get_running_loop())
+        hub.publish("KEY", "other/x")
+
+        # execution
+        index, events = await hub.wait(0, ["locks/db"], timeout=0.05)
+
+        # test
+        assert index == 1
+        assert events == []
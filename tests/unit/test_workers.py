@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+
+class TestWorkers:
+    """Test ownership, forwarding to the owner and the view of a worker."""
+
+    @pytest.mark.asyncio
+    async def test_claim_ownership(self, tmp_path):
+        # setup
+        from app.workers import claim_ownership
+
+        path = str(tmp_path / "raft.sock.lock")
+
+        # execution
+        owner = claim_ownership(path)
+        other = claim_ownership(path)
+        owner.close()  # the owner exits
+        successor = claim_ownership(path)
+
+        # test
+        assert owner is not None
+        assert other is None
+        assert successor is not None
+        successor.close()
+
+    @pytest.mark.asyncio
+    async def test_forward_request(self, tmp_path):
+        # setup
+        import httpx
+        from fastapi import FastAPI, Request
+        from fastapi.applications import State as FastAPIState
+        from starlette.responses import JSONResponse
+
+        from app.api.exceptions import ApiException
+        from app.workers import OwnerForwarder, OwnerServer, OwnerView
+
+        path = str(tmp_path / "raft.sock")
+        owner_app = FastAPI()
+
+        @owner_app.put("/api/v1/kv/{key}")
+        async def put(request: Request, key: str, timeout_millis: int = 0):
+            body = await request.json()
+            return {"key": key, "value": body["value"], "timeout": timeout_millis}
+
+        worker_app = FastAPI()
+        worker_state = FastAPIState()
+        worker_state.groups = {"default": worker_state}
+        view = OwnerView(worker_state, path)
+        view._synced.add("default")  # ready, reads are answered by the worker
+        worker_app.add_middleware(OwnerForwarder, path=path, view=view)
+
+        @worker_app.exception_handler(ApiException)
+        def handler(request: Request, error: ApiException) -> JSONResponse:
+            return JSONResponse({"id": error.id}, status_code=error.status_code)
+
+        @worker_app.get("/api/v1/kv/{key}")
+        async def get(key: str):
+            return {"key": key, "local": True}
+
+        server = OwnerServer(owner_app, FastAPIState(), path)
+        await server.start()
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=worker_app), base_url="http://worker"
+        )
+
+        # execution
+        written = await client.put(
+            "/api/v1/kv/a?timeout_millis=50", json={"value": "b"}
+        )
+        read = await client.get("/api/v1/kv/a")
+        await server.close()
+        unavailable = await client.put("/api/v1/kv/a", json={"value": "c"})
+
+        # test
+        assert written.status_code == 200
+        assert written.json() == {"key": "a", "value": "b", "timeout": 50}
+        assert read.json() == {"key": "a", "local": True}
+        assert unavailable.status_code == 503
+        assert unavailable.json() == {"id": "SERVICE_UNAVAILABLE"}
+
+    @pytest.mark.asyncio
+    async def test_view_follows_owner(self, tmp_path):
+        # setup
+        from fastapi.applications import State as FastAPIState
+
+        from app.raft.functions import State
+        from app.raft.kv import KeyValueStore
+        from app.raft.watch import WatchHub
+        from app.workers import OwnerServer, OwnerView
+
+        path = str(tmp_path / "raft.sock")
+        owner = FastAPIState()
+        owner.app_name = owner.id = "node_1"
+        owner.group = "default"
+        owner.state = State.LEADER
+        owner.term = 3
+        owner.watch = WatchHub(100)
+        owner.watch.attach(asyncio.get_running_loop())
+        owner.kv = KeyValueStore(on_change=owner.watch.publish_value)
+        owner.groups = {"default": owner}
+        owner.kv.apply(KeyValueStore.command(KeyValueStore.SET, "a", "1"))
+        worker = FastAPIState()
+        worker.kv = KeyValueStore()
+        worker.groups = {"default": worker}
+        server = OwnerServer(None, owner, path)
+        await server.start()
+        view = OwnerView(worker, path, retry=0.01)
+
+        async def until(predicate) -> None:
+            for _ in range(200):
+                if predicate():
+                    return
+                await asyncio.sleep(0.01)
+
+        # execution
+        following = asyncio.create_task(view.run())
+        await until(lambda: view.ready)
+        synced = worker.kv.get("a")
+        owner.kv.apply(KeyValueStore.command(KeyValueStore.SET, "b", "2"))
+        owner.kv.apply(KeyValueStore.command(KeyValueStore.DELETE, "a"))
+        await until(lambda: worker.kv.get("a") is None)
+        following.cancel()
+        await server.close()
+
+        # test
+        assert synced == "1"
+        assert worker.kv.snapshot() == {"b": "2"}
+        assert (worker.status.state, worker.status.term) == (State.LEADER, 3)
+        assert worker.status.app_name == "node_1"